@@ -3,14 +3,22 @@ This script is used to create a locust load test for the email API. It reads the
 It then creates a locust user class for each configuration and runs the load test based on the configurations.
 """
 
-from locust import HttpUser, task, between, events
+from locust import HttpUser, between, events
+from locust.runners import MasterRunner, WorkerRunner
+from gevent.pool import Pool
+import gevent
 import os
 import json
 import pandas as pd
 import time
 import datetime
 import sys
-import itertools
+import threading
+
+from data_partition import Counters, RecordDispenser, get_shard, sum_worker_counts
+from load_shapes import ArrivalSchedule
+from latency_report import LatencyReport, add_threshold_arguments, compare_to_baseline, get_thresholds, load_report
+from response_sink import ResponseSink
 
 # Load email data from CSV
 input_data_prefix = 'api_load_tests/data/inputs'
@@ -30,67 +38,171 @@ class BaseEmailUser(HttpUser):
     def headers(self):
         return {'Content-Type': 'application/json', 'x-api-key': self.api_key}
 
-# List to store response data
-responses = []
+# Responses are streamed to JSONL files instead of being kept in memory
+response_sink = ResponseSink(output_data_prefix)
+
+# Latency histograms, errors and throughput per user class
+latency_report = LatencyReport()
+
+@events.init_command_line_parser.add_listener
+def on_init_command_line_parser(parser):
+    parser.add_argument(
+        "--latency-report",
+        default="",
+        help="Path of the latency report, by default it is written to the outputs directory",
+    )
+    parser.add_argument(
+        "--baseline-report", default="", help="Latency report to compare against, the run fails on a regression"
+    )
+    parser.add_argument(
+        "--data-shards",
+        type=int,
+        default=0,
+        help="Number of disjoint data shards, by default one per worker of --expect-workers",
+    )
+    add_threshold_arguments(parser)
 
 # Start time
 start_time = time.time()
 
-# track the number of requests
-num_requests = 0
+# Records taken and requests sent per user class, reported to the master in distributed mode
+counters = Counters()
+
+# Record dispensers of the user classes, created once the worker index is known
+dispensers = {}
+dispensers_lock = threading.Lock()
+
+# Latest counts and latency report of each worker, on the master
+worker_counts = {}
+worker_latency_reports = {}
+
+def get_shard_count(environment):
+    options = environment.parsed_options
+    if not options:
+        return 1
+    # Without --data-shards, one shard per expected worker, and a single shard outside distributed mode
+    return getattr(options, "data_shards", 0) or getattr(options, "expect_workers", 1) or 1
+
+def get_dispenser(class_name, environment, cycle):
+    """
+    Get the record dispenser shared by the users of a class, over the data shard of this worker.
+    """
+    with dispensers_lock:
+        if class_name not in dispensers:
+            shard_index = getattr(environment.runner, "worker_index", 0)
+            shard = get_shard(email_data, shard_index, get_shard_count(environment))
+            print(f"{class_name}: shard {shard_index} has {len(shard)} of {len(email_data)} records")
+            dispensers[class_name] = RecordDispenser(shard, cycle=cycle)
+        return dispensers[class_name]
 
 # Dynamically create user classes based on configuration
 def create_user_class(class_name, details):
+    """
+    Create the user class of a configuration.
+
+    Without a "load_shape" the users run a closed loop, each sending its next request after the previous
+    response and a wait time. With a "load_shape" a single user dispatches requests at the scheduled
+    arrival times, whatever the response times, until the schedule ends.
+    """
+    load_shape = ArrivalSchedule.from_config(details['load_shape']) if 'load_shape' in details else None
+
     class NewUser(BaseEmailUser):
         host = details['host']
         path = details['path']
         payload_structure = details['payload']
-        # uncomment the line below if you want to stop the test when all data is processed
-        data = iter(email_data) # Create an iterator for the email data
-        # uncomment the line below if you want to cycle through the data indefinitely
-        #data = itertools.cycle(email_data)
+        if load_shape is not None:
+            # One dispatcher per data shard, the offered load comes from the schedule and not the number of users
+            fixed_count = 1
 
-        @task
-        def post_data(self):
-            global num_requests
-            try:
-                data_point = next(self.data)  # For now, we will raise StopIteration when data ends
-            except StopIteration:
-                total_time = time.time() - start_time
-                print(f"All {len(email_data)} records have been processed in {total_time:.2f} seconds.")               
-                
-                # Writing responses to file once all data has been processed
-                timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                with open(f"{output_data_prefix}/responses_{timestamp}.json", "w") as f:
-                    json.dump(responses, f, indent=4)
-                
-                # capture command line arguments
-                cmd_args = " ".join(sys.argv[1:])
+        def on_start(self):
+            # The users of a class share one dispenser, so records are never sent twice. The load shape
+            # sets the duration of an open-loop test, so its data is cycled.
+            self.data = get_dispenser(class_name, self.environment, cycle=load_shape is not None)
+
+        def finish(self):
+            total_time = time.time() - start_time
+            print(f"All {len(self.data.records)} records of the shard have been processed in {total_time:.2f} seconds.")               
+            
+            # Flush the buffered responses once all data has been processed
+            response_sink.flush()
+            timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            
+            # capture command line arguments
+            cmd_args = " ".join(sys.argv[1:])
+            
+            # Also write command line arguments and summary to file
+            with open(f"{output_data_prefix}/summary_{timestamp}.txt", "w") as f:
+                f.write(f"User class: {class_name}\n")
+                f.write(f"Host: {self.host}\n")
+                f.write(f"Path: {self.path}\n")
+                shard = getattr(self.environment.runner, 'worker_index', 0)
+                f.write(f"Total number of records: {len(self.data.records)} of {len(email_data)} in shard {shard}\n")
+                f.write(f"Total number of requests: {counters.get(class_name, 'requests')}\n")
+                f.write(f"Total time taken: {total_time:.2f} seconds\n")
+                if load_shape is not None:
+                    f.write(f"Load shape: {json.dumps(details['load_shape'])}\n")
+                f.write(f"Response files: {', '.join(response_sink.paths)}\n")
+                f.write(f"Latency: {latency_report.format_summary()}\n")
+                f.write(f"Command line arguments: {cmd_args}\n")
                 
-                # Also write command line arguments and summary to file
-                with open(f"{output_data_prefix}/summary_{timestamp}.txt", "w") as f:
-                    f.write(f"User class: {class_name}\n")
-                    f.write(f"Host: {self.host}\n")
-                    f.write(f"Path: {self.path}\n")
-                    f.write(f"Total number of records: {len(email_data)}\n")
-                    f.write(f"Total number of requests: {num_requests}\n")
-                    f.write(f"Total time taken: {total_time:.2f} seconds\n")
-                    f.write(f"Command line arguments: {cmd_args}\n")
-                    
-                self.environment.runner.quit()
-                return
+            self.environment.runner.quit()
 
+        def send_request(self, data_point):
             # Prepare the data to be sent in the POST request
             data_to_post = {key: data_point[key] for key in self.payload_structure.keys()}
+            request_start = time.perf_counter()
             with self.client.post(self.path, json=data_to_post, headers=self.headers(), catch_response=True) as response:
+                latency_ms = (time.perf_counter() - request_start) * 1000
                 if response.ok:
                     response_data = response.json()
-                    responses.append(response_data)
+                    response_sink.record(class_name, response.status_code, latency_ms, response=response_data)
+                    latency_report.record(class_name, latency_ms, ok=True)
                 else:
                     # Cases where the response is not OK
                     response.failure("Got wrong response!")
+                    response_sink.record(class_name, response.status_code, latency_ms,
+                                         error=f"Got wrong response! {response.text[:200]}")
+                    latency_report.record(class_name, latency_ms, ok=False)
                     
-            num_requests += 1
+            counters.increment(class_name, "requests")
+
+        def drop_request(self):
+            # Too many requests are outstanding, the arrival counts as a failure without a latency
+            self.environment.events.request.fire(
+                request_type="POST", name=self.path, response_time=0, response_length=0,
+                exception=Exception(f"Dropped, more than {load_shape.max_in_flight} requests in flight per shard"),
+                context={},
+            )
+            response_sink.record(class_name, None, 0.0, error="dropped")
+            latency_report.record(class_name, None, ok=False)
+
+        def post_data(self):
+            try:
+                data_point = next(self.data)  # For now, we will raise StopIteration when data ends
+            except StopIteration:
+                self.finish()
+                return
+            counters.increment(class_name, "records")
+            self.send_request(data_point)
+
+        def dispatch_arrivals(self):
+            # Each shard dispatcher sends its share of the scheduled load
+            schedule = load_shape.scaled(1.0 / get_shard_count(self.environment))
+            in_flight = Pool(schedule.max_in_flight)
+            dispatch_start = time.time()
+            for offset in schedule.arrival_times():
+                delay = dispatch_start + offset - time.time()
+                if delay > 0:
+                    gevent.sleep(delay)
+                if in_flight.full():
+                    self.drop_request()
+                    continue
+                counters.increment(class_name, "records")
+                in_flight.spawn(self.send_request, next(self.data))
+            in_flight.join()
+            self.finish()
+
+        tasks = [post_data] if load_shape is None else [dispatch_arrivals]
 
     NewUser.__name__ = class_name
     return NewUser
@@ -99,9 +211,73 @@ def create_user_class(class_name, details):
 for user_class, details in config.items():
     globals()[user_class] = create_user_class(user_class, details)
 
+@events.init.add_listener
+def on_init(environment, **kwargs):
+    # Run one open-loop dispatcher per data shard, locust spreads them over the workers
+    for user_class, details in config.items():
+        if 'load_shape' in details:
+            globals()[user_class].fixed_count = get_shard_count(environment)
+
+@events.report_to_master.add_listener
+def on_report_to_master(client_id, data):
+    # Absolute values, so the master keeps the latest report of each worker
+    data["email_counts"] = counters.snapshot()
+    data["latency_report"] = latency_report.to_dict()
+
+@events.worker_report.add_listener
+def on_worker_report(client_id, data):
+    if "email_counts" in data:
+        worker_counts[client_id] = data["email_counts"]
+    if "latency_report" in data:
+        worker_latency_reports[client_id] = data["latency_report"]
+
+@events.test_start.add_listener
+def on_test_start(environment, **kwargs):
+    # Each worker takes the shard of its index, so workers beyond the shard count would have no data
+    if not isinstance(environment.runner, MasterRunner):
+        return
+    shard_count = get_shard_count(environment)
+    if environment.runner.worker_count > shard_count:
+        print(f"{environment.runner.worker_count} workers are connected but the data has {shard_count} shards, "
+              f"run the master with --data-shards {environment.runner.worker_count} or --expect-workers "
+              f"{environment.runner.worker_count}")
+        environment.process_exit_code = 1
+        environment.runner.quit()
+
 # We can set up a listener to stop the test when all data is processed
 @events.test_stop.add_listener
 def on_test_stop(environment, **kwargs):
-    print("Test has stopped.")
+    response_sink.close()
+    print(f"Test has stopped. {response_sink.records_written} responses written to {', '.join(response_sink.paths)}")
+
+@events.quitting.add_listener
+def on_quitting(environment, **kwargs):
+    # In distributed mode the master reports for all workers
+    if isinstance(environment.runner, WorkerRunner):
+        return
+    report = latency_report
+    if isinstance(environment.runner, MasterRunner):
+        report = LatencyReport()
+        for worker_report in worker_latency_reports.values():
+            report.merge(LatencyReport.from_dict(worker_report))
+        for user_class, counts in sorted(sum_worker_counts(worker_counts).items()):
+            print(f"{user_class}: {counts.get('records', 0)} records, {counts.get('requests', 0)} requests "
+                  f"over {len(worker_counts)} workers")
+    if not report.classes:
+        return
+    options = environment.parsed_options
+    report_path = getattr(options, "latency_report", "") or (
+        f"{output_data_prefix}/latency_report_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json"
+    )
+    report.write(report_path)
+    print(f"Latency report written to {report_path}\n{report.format_summary()}")
+
+    baseline_path = getattr(options, "baseline_report", "")
+    if baseline_path:
+        regressions = compare_to_baseline(report.to_dict(), load_report(baseline_path), get_thresholds(options))
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            environment.process_exit_code = 1
             
 #TODO: Add more tasks as necessary for the load testing scenarios for each environment and use case
@@ -0,0 +1,86 @@
+"""
+Partitioning of the load test data across distributed locust workers and the users of each worker.
+
+Each worker takes a disjoint shard of the records by its worker index, so a test spread over many
+workers covers every record exactly once. Within a worker, the users of a class take their records
+from one shared dispenser. Each worker reports its counts to the master, which sums them.
+"""
+
+import threading
+
+
+def get_shard(records, shard_index, shard_count):
+    """
+    Get the records of one shard. The shards of 0 to shard_count - 1 are disjoint and cover all records.
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} is out of range for {shard_count} shards, "
+                         "--data-shards must cover every worker index, including workers that reconnected")
+    return records[shard_index::shard_count]
+
+
+class RecordDispenser():
+    """
+    Hands out the records of a shard one at a time to the users of a class, safely across users.
+
+    Args:
+    - records (list): The records of the shard.
+    - cycle (bool): Start over once all records have been dispensed, instead of raising StopIteration.
+    """
+    def __init__(self, records, cycle=False):
+        self.records = records
+        self.cycle = cycle
+        self.dispensed = 0
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._lock:
+            if not self.records or (not self.cycle and self.dispensed >= len(self.records)):
+                raise StopIteration
+            record = self.records[self.dispensed % len(self.records)]
+            self.dispensed += 1
+            return record
+
+
+class Counters():
+    """
+    Thread-safe counters, by user class and counter name.
+    """
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def increment(self, user_class, name, amount=1):
+        with self._lock:
+            counts = self._counts.setdefault(user_class, {})
+            counts[name] = counts.get(name, 0) + amount
+
+    def get(self, user_class, name):
+        with self._lock:
+            return self._counts.get(user_class, {}).get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return {user_class: dict(counts) for user_class, counts in self._counts.items()}
+
+
+def sum_worker_counts(worker_counts):
+    """
+    Sum the latest counts reported by each worker.
+
+    Args:
+    - worker_counts (dict): Client id to the counts snapshot reported by the worker.
+
+    Returns:
+    - dict: User class to the summed counts.
+    """
+    totals = {}
+    for counts in worker_counts.values():
+        for user_class, class_counts in counts.items():
+            class_totals = totals.setdefault(user_class, {})
+            for name, count in class_counts.items():
+                class_totals[name] = class_totals.get(name, 0) + count
+    return totals
@@ -0,0 +1,333 @@
+"""
+Stand-in for the SageMaker runtime client of the Lambda handlers, for offline load tests.
+
+EmulatedSageMakerRuntime answers invoke_endpoint like the email-type and email-names endpoints, with
+responses the handlers can parse, after a log-normal service time. A limited number of requests
+are served at once, like the instances of a real endpoint, and the others queue.
+
+With prefill_ms_per_token and decode_ms_per_token, email-names requests also take time in
+proportion to the tokens of their prompt and of their answer, which is cut at max_new_tokens.
+The max_* token options admit and batch them like the TGI container of the endpoint does.
+
+It can also inject the errors of an overloaded endpoint, raised as the botocore exceptions of the
+real client: throttles when too many requests queue or at random, read timeouts when a request
+takes longer than the client timeout or at random, and errors queued with inject_errors().
+"""
+
+import io
+import json
+import math
+import random
+import re
+import threading
+import time
+
+import botocore.exceptions
+
+NAME_PREFIXES = {"dr", "dr.", "mr", "mr.", "mrs", "mrs.", "ms", "ms.", "prof", "prof."}
+NAME_SUFFIXES = {"jr", "jr.", "sr", "sr.", "ii", "iii", "iv", "phd", "md"}
+ERROR_THROTTLE = "throttle"
+ERROR_TIMEOUT = "timeout"
+ERROR_MODEL = "model"
+# The model container rejects the request, which SageMaker wraps in a ModelError with its 429
+ERROR_OVERLOADED = "overloaded"
+
+# Rough number of characters per token of the Mistral tokenizer
+CHARS_PER_TOKEN = 4
+
+NON_PERSON_TERMS = {"team", "support", "info", "sales", "admin", "noreply", "no-reply", "billing", "inc", "llc", "ltd"}
+
+
+def guess_name_components(display_name):
+    """
+    Split a display name into name components with simple rules, standing in for the LLM.
+
+    Like the LLM is asked to, it ignores the extra terms of a signature after a "|".
+    """
+    tokens = [token.strip(",") for token in display_name.split("|", 1)[0].split() if "@" not in token]
+    names = {"first_name": "", "middle_name": "", "last_name": "", "name_prefix": "", "name_suffix": ""}
+    if tokens and tokens[0].lower() in NAME_PREFIXES:
+        names["name_prefix"] = tokens.pop(0)
+    if tokens and tokens[-1].lower() in NAME_SUFFIXES:
+        names["name_suffix"] = tokens.pop()
+    if tokens:
+        names["first_name"] = tokens[0]
+    if len(tokens) > 1:
+        names["last_name"] = tokens[-1]
+    if len(tokens) > 2:
+        names["middle_name"] = " ".join(tokens[1:-1])
+    return names
+
+
+def person_probability(text):
+    """
+    Score how likely an email address and names belong to a person, standing in for the classifier.
+    """
+    words = re.findall(r"[a-z][a-z\-]+", text.lower())
+    if any(word in NON_PERSON_TERMS for word in words):
+        return 0.02
+    return 0.97 if len(words) >= 3 else 0.6
+
+
+class TokenBudget():
+    """
+    Tokens shared by the requests being served, like the batch token limits of TGI.
+
+    Args:
+    - tokens (int): Size of the budget, None for no limit.
+    """
+    def __init__(self, tokens=None):
+        self.tokens = tokens
+        self.available = tokens
+        self._condition = threading.Condition()
+
+    def acquire(self, tokens):
+        """
+        Wait until the tokens are available and take them.
+
+        Returns:
+        - int: The tokens taken, to release later.
+        """
+        if self.tokens is None:
+            return 0
+        # A request larger than the budget runs alone
+        tokens = min(tokens, self.tokens)
+        with self._condition:
+            while self.available < tokens:
+                self._condition.wait()
+            self.available -= tokens
+        return tokens
+
+    def release(self, tokens):
+        if not tokens:
+            return
+        with self._condition:
+            self.available += tokens
+            self._condition.notify_all()
+
+
+class EmulatedSageMakerRuntime():
+    """
+    Emulated sagemaker-runtime client.
+
+    Args:
+    - latency_ms (float): Mean service time of a request in milliseconds.
+    - latency_cv (float): Coefficient of variation of the service time, 0 for a constant service time.
+    - concurrency (int): Number of requests served at once, the others wait for a free slot.
+    - variant_name (str): Production variant reported in the responses.
+    - seed (int): Optional random seed.
+    - throttle_rate (float): Share of requests throttled at random.
+    - timeout_rate (float): Share of requests timing out at random.
+    - max_queue (int): Number of requests that can wait for a slot, later ones are throttled, None for no limit.
+    - read_timeout_s (float): Client read timeout, requests waiting and served longer than it time out.
+    - prefill_ms_per_token (float): Extra service time per prompt token of an email-names request.
+    - decode_ms_per_token (float): Extra service time per generated token of an email-names request.
+    - batch_decode_factor (float): Slowdown of each decode step per other request in the batch.
+    - max_concurrent_requests (int): Requests accepted at once, later ones fail as overloaded, None for no limit.
+    - max_input_tokens (int): Prompt tokens of a request, longer ones fail with a model error, None for no limit.
+    - max_total_tokens (int): Prompt tokens and max_new_tokens of a request, larger ones fail with a model error.
+    - max_batch_prefill_tokens (int): Prompt tokens prefilled at once, None for no limit.
+    - max_batch_total_tokens (int): Prompt tokens and max_new_tokens of the requests decoded at once, None for no limit.
+    """
+    def __init__(self, latency_ms=800, latency_cv=0.3, concurrency=8, variant_name="AllTraffic", seed=None,
+                 throttle_rate=0.0, timeout_rate=0.0, max_queue=None, read_timeout_s=None,
+                 prefill_ms_per_token=0.0, decode_ms_per_token=0.0, batch_decode_factor=0.0,
+                 max_concurrent_requests=None, max_input_tokens=None, max_total_tokens=None,
+                 max_batch_prefill_tokens=None, max_batch_total_tokens=None):
+        self.latency_ms = latency_ms
+        self.latency_cv = latency_cv
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.decode_ms_per_token = decode_ms_per_token
+        self.batch_decode_factor = batch_decode_factor
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_input_tokens = max_input_tokens
+        self.max_total_tokens = max_total_tokens
+        self._prefill_tokens = TokenBudget(max_batch_prefill_tokens)
+        self._batch_tokens = TokenBudget(max_batch_total_tokens)
+        self.variant_name = variant_name
+        self.throttle_rate = throttle_rate
+        self.timeout_rate = timeout_rate
+        self.max_queue = max_queue
+        self.read_timeout_s = read_timeout_s
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._active = 0
+        self._injected = []
+        self.invocations = 0
+        self.errors = {ERROR_THROTTLE: 0, ERROR_TIMEOUT: 0, ERROR_MODEL: 0, ERROR_OVERLOADED: 0}
+
+    def inject_errors(self, kind, count=1):
+        """
+        Fail the next count requests with an ERROR_THROTTLE, ERROR_TIMEOUT, ERROR_MODEL or ERROR_OVERLOADED error.
+        """
+        with self._lock:
+            self._injected.extend([kind] * count)
+
+    def _raise(self, kind, wait_s=0.0):
+        with self._lock:
+            self.errors[kind] += 1
+        if kind == ERROR_TIMEOUT:
+            # The client waits for the whole read timeout before giving up
+            time.sleep(max(0.0, (self.read_timeout_s or 0.0) - wait_s))
+            raise botocore.exceptions.ReadTimeoutError(endpoint_url="https://runtime.sagemaker.local/invocations")
+        original_status_code = None
+        if kind == ERROR_THROTTLE:
+            code, message, status_code = "ThrottlingException", "Rate exceeded", 400
+        elif kind == ERROR_OVERLOADED:
+            code, message, status_code = "ModelError", "Model is overloaded", 424
+            original_status_code = 429
+        else:
+            code, message, status_code = "ModelError", "Received server error (500) from primary", 424
+            original_status_code = 500
+        raise botocore.exceptions.ClientError(
+            {"Error": {"Code": code, "Message": message}, "ResponseMetadata": {"HTTPStatusCode": status_code},
+             **({"OriginalStatusCode": original_status_code} if original_status_code else {})},
+            "InvokeEndpoint",
+        )
+
+    def _get_injected_error(self):
+        with self._lock:
+            if self._injected:
+                return self._injected.pop(0)
+            draw = self._rng.random()
+            if draw < self.throttle_rate:
+                return ERROR_THROTTLE
+            if draw < self.throttle_rate + self.timeout_rate:
+                return ERROR_TIMEOUT
+            if self.max_queue is not None and self._queued >= self.max_queue:
+                return ERROR_THROTTLE
+            if self.max_concurrent_requests is not None and self._in_flight >= self.max_concurrent_requests:
+                # TGI answers 429 itself, SageMaker passes it on as a ModelError
+                return ERROR_OVERLOADED
+            self._queued += 1
+            self._in_flight += 1
+        return None
+
+    def _service_time_s(self):
+        if self.latency_cv <= 0:
+            return self.latency_ms / 1000
+        sigma = math.sqrt(math.log(1 + self.latency_cv ** 2))
+        mu = math.log(self.latency_ms / 1000) - sigma ** 2 / 2
+        with self._lock:
+            return self._rng.lognormvariate(mu, sigma)
+
+    def _predict(self, content_type, body):
+        if content_type == "text/csv":
+            # email-type: "email_address, email_name, email_display_name"
+            probability = person_probability(body)
+            return [{"sentence": body, "probabilities": [probability, 1 - probability]}]
+
+        # email-names: a text generation payload whose prompt ends with the input record
+        payload = json.loads(body)
+        match = re.findall(r'"Display Name": "([^"]*)"', payload["inputs"])
+        names = guess_name_components(match[-1] if match else "")
+        generated_text = "\n".join([
+            f"First Name: {names['first_name']}",
+            f"Middle Name: {names['middle_name']}",
+            f"Last Name: {names['last_name']}",
+            f"Name Prefix: {names['name_prefix']}",
+            f"Name Suffix: {names['name_suffix']}",
+        ])
+        max_new_tokens = payload.get("parameters", {}).get("max_new_tokens")
+        if max_new_tokens is not None:
+            # Generation stops at max_new_tokens, cutting off the last name components
+            generated_text = generated_text[:max_new_tokens * CHARS_PER_TOKEN]
+        return [{"generated_text": generated_text}]
+
+    def _get_request_tokens(self, content_type, body):
+        """
+        Get the prompt tokens and max_new_tokens of an email-names request, None for an email-type request.
+        """
+        if content_type == "text/csv":
+            return None
+        payload = json.loads(body)
+        prompt_tokens = math.ceil(len(payload["inputs"]) / CHARS_PER_TOKEN)
+        return prompt_tokens, payload.get("parameters", {}).get("max_new_tokens", 0)
+
+    def _fits_limits(self, prompt_tokens, max_new_tokens):
+        if self.max_input_tokens is not None and prompt_tokens > self.max_input_tokens:
+            return False
+        return self.max_total_tokens is None or prompt_tokens + max_new_tokens <= self.max_total_tokens
+
+    def _token_time_s(self, content_type, body, response):
+        """
+        Prefill and decode time of an email-names request served alone, in proportion to its prompt and answer tokens.
+        """
+        if content_type == "text/csv" or not (self.prefill_ms_per_token or self.decode_ms_per_token):
+            return 0.0
+        prompt_tokens, _ = self._get_request_tokens(content_type, body)
+        generated_tokens = len(response[0]["generated_text"]) / CHARS_PER_TOKEN
+        return (self.prefill_ms_per_token * prompt_tokens + self.decode_ms_per_token * generated_tokens) / 1000
+
+    def _generate(self, content_type, body, response):
+        """
+        Prefill and decode an email-names request, batched with the others like TGI's continuous batching.
+
+        The request holds its prompt and max_new_tokens in the batch token budget while it runs,
+        and its prompt in the prefill token budget while it is prefilled. Each decode step takes
+        longer the more requests share the batch.
+        """
+        tokens = self._get_request_tokens(content_type, body)
+        if tokens is None:
+            return
+        prompt_tokens, max_new_tokens = tokens
+        generated_tokens = len(response[0]["generated_text"]) / CHARS_PER_TOKEN
+        batch_tokens = self._batch_tokens.acquire(prompt_tokens + max_new_tokens)
+        with self._lock:
+            self._active += 1
+            active = self._active
+        try:
+            prefill_tokens = self._prefill_tokens.acquire(prompt_tokens)
+            try:
+                time.sleep(self.prefill_ms_per_token * prompt_tokens / 1000)
+            finally:
+                self._prefill_tokens.release(prefill_tokens)
+            slowdown = 1 + self.batch_decode_factor * (active - 1)
+            time.sleep(self.decode_ms_per_token * generated_tokens * slowdown / 1000)
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._batch_tokens.release(batch_tokens)
+
+    def invoke_endpoint(self, EndpointName, Body, ContentType="application/json", CustomAttributes=None, **kwargs):
+        if isinstance(Body, bytes):
+            Body = Body.decode("utf-8")
+        tokens = self._get_request_tokens(ContentType, Body)
+        if tokens is not None and not self._fits_limits(*tokens):
+            # Rejected by the input validation of TGI
+            self._raise(ERROR_MODEL)
+        error = self._get_injected_error()
+        if error is not None:
+            self._raise(error)
+
+        start = time.perf_counter()
+        try:
+            try:
+                self._slots.acquire()
+            finally:
+                with self._lock:
+                    self._queued -= 1
+            try:
+                response = self._predict(ContentType, Body)
+                service_time_s = self._service_time_s()
+                wait_s = time.perf_counter() - start
+                token_time_s = self._token_time_s(ContentType, Body, response)
+                if self.read_timeout_s is not None and wait_s + service_time_s + token_time_s > self.read_timeout_s:
+                    self._raise(ERROR_TIMEOUT, wait_s)
+                time.sleep(service_time_s)
+                self._generate(ContentType, Body, response)
+            finally:
+                self._slots.release()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        with self._lock:
+            self.invocations += 1
+        return {
+            "Body": io.BytesIO(json.dumps(response).encode("utf-8")),
+            "ContentType": "application/json",
+            "InvokedProductionVariant": self.variant_name,
+        }
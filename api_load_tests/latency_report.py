@@ -0,0 +1,313 @@
+"""
+Per-user-class latency report for the load test, with an optional regression check against a baseline.
+
+Latencies are kept in log-bucketed histograms, in the spirit of HDR histograms: the relative error
+of any percentile is bounded by the bucket precision and memory does not grow with the number of
+requests. Error counts and throughput are also tracked over time.
+
+Two saved reports can also be compared offline:
+
+    python api_load_tests/latency_report.py --report latency_report.json --baseline baseline.json --max-p99-increase 0.2
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+
+# Default maximum relative increase of each percentile, and absolute increase of the error rate
+DEFAULT_THRESHOLDS = {
+    "p50": 0.10,
+    "p95": 0.15,
+    "p99": 0.20,
+    "error_rate": 0.01,
+}
+
+
+class LatencyHistogram():
+    """
+    Histogram of latencies in milliseconds with logarithmic buckets.
+
+    Args:
+    - precision (float): Relative width of a bucket, percentiles are accurate to within this fraction.
+    - min_value_ms (float): Latencies below this value share the first bucket.
+    """
+    def __init__(self, precision=0.01, min_value_ms=0.1):
+        self.precision = precision
+        self.min_value_ms = min_value_ms
+        self._log_base = math.log(1 + precision)
+        self.counts = {}
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = None
+
+    def _bucket(self, value_ms):
+        if value_ms <= self.min_value_ms:
+            return 0
+        return int(math.log(value_ms / self.min_value_ms) / self._log_base) + 1
+
+    def _bucket_value(self, bucket):
+        # Upper bound of the bucket, so percentiles are never under-reported
+        return self.min_value_ms * (1 + self.precision) ** bucket
+
+    def record(self, value_ms):
+        bucket = self._bucket(value_ms)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.min_ms = value_ms if self.min_ms is None else min(self.min_ms, value_ms)
+        self.max_ms = value_ms if self.max_ms is None else max(self.max_ms, value_ms)
+
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.total_ms += other.total_ms
+        if other.count:
+            self.min_ms = other.min_ms if self.min_ms is None else min(self.min_ms, other.min_ms)
+            self.max_ms = other.max_ms if self.max_ms is None else max(self.max_ms, other.max_ms)
+
+    def percentile(self, p):
+        """
+        Get the latency below which p percent of the requests fall.
+        """
+        if not self.count:
+            return None
+        rank = math.ceil(p / 100 * self.count)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self._bucket_value(bucket), self.max_ms)
+        return self.max_ms
+
+    def to_dict(self):
+        return {
+            "precision": self.precision,
+            "min_value_ms": self.min_value_ms,
+            "count": self.count,
+            "total_ms": self.total_ms,
+            "min_ms": self.min_ms,
+            "max_ms": self.max_ms,
+            "counts": {str(bucket): count for bucket, count in sorted(self.counts.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(precision=data["precision"], min_value_ms=data["min_value_ms"])
+        histogram.counts = {int(bucket): count for bucket, count in data["counts"].items()}
+        histogram.count = data["count"]
+        histogram.total_ms = data["total_ms"]
+        histogram.min_ms = data["min_ms"]
+        histogram.max_ms = data["max_ms"]
+        return histogram
+
+
+class ClassStats():
+    """
+    Latency histogram, error count and throughput over time of one user class.
+    """
+    def __init__(self, interval_s=10):
+        self.interval_s = interval_s
+        self.histogram = LatencyHistogram()
+        self.requests = 0
+        self.errors = 0
+        self.first_request = None
+        self.last_request = None
+        # Interval start time to [requests, errors]
+        self.timeline = {}
+
+    def record(self, latency_ms, ok, timestamp):
+        # Requests that failed without a response, such as dropped arrivals, have no latency
+        if latency_ms is not None:
+            self.histogram.record(latency_ms)
+        self.requests += 1
+        self.errors += 0 if ok else 1
+        self.first_request = timestamp if self.first_request is None else min(self.first_request, timestamp)
+        self.last_request = timestamp if self.last_request is None else max(self.last_request, timestamp)
+        interval = int(timestamp // self.interval_s * self.interval_s)
+        counts = self.timeline.setdefault(interval, [0, 0])
+        counts[0] += 1
+        counts[1] += 0 if ok else 1
+
+    def merge(self, other):
+        self.histogram.merge(other.histogram)
+        self.requests += other.requests
+        self.errors += other.errors
+        for attr, pick in (("first_request", min), ("last_request", max)):
+            value = getattr(other, attr)
+            if value is not None:
+                setattr(self, attr, value if getattr(self, attr) is None else pick(getattr(self, attr), value))
+        for interval, (requests, errors) in other.timeline.items():
+            counts = self.timeline.setdefault(interval, [0, 0])
+            counts[0] += requests
+            counts[1] += errors
+
+    def to_dict(self):
+        duration = (self.last_request - self.first_request) if self.requests > 1 else 0.0
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": self.errors / self.requests if self.requests else 0.0,
+            "throughput_rps": self.requests / duration if duration else None,
+            "mean_ms": self.histogram.total_ms / self.histogram.count if self.histogram.count else None,
+            "min_ms": self.histogram.min_ms,
+            "p50_ms": self.histogram.percentile(50),
+            "p90_ms": self.histogram.percentile(90),
+            "p95_ms": self.histogram.percentile(95),
+            "p99_ms": self.histogram.percentile(99),
+            "max_ms": self.histogram.max_ms,
+            "timeline": [
+                {"start": interval, "requests": requests, "errors": errors, "rps": requests / self.interval_s}
+                for interval, (requests, errors) in sorted(self.timeline.items())
+            ],
+            "histogram": self.histogram.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data, interval_s=10):
+        stats = cls(interval_s=interval_s)
+        stats.histogram = LatencyHistogram.from_dict(data["histogram"])
+        stats.requests = data["requests"]
+        stats.errors = data["errors"]
+        for point in data["timeline"]:
+            stats.timeline[point["start"]] = [point["requests"], point["errors"]]
+        if stats.timeline:
+            stats.first_request = min(stats.timeline)
+            stats.last_request = max(stats.timeline) + interval_s
+        return stats
+
+
+class LatencyReport():
+    """
+    Latency statistics of a load test, per user class.
+    """
+    def __init__(self, interval_s=10):
+        self.interval_s = interval_s
+        self.classes = {}
+
+    def record(self, user_class, latency_ms, ok=True, timestamp=None):
+        stats = self.classes.get(user_class)
+        if stats is None:
+            stats = self.classes[user_class] = ClassStats(interval_s=self.interval_s)
+        stats.record(latency_ms, ok, time.time() if timestamp is None else timestamp)
+
+    def merge(self, other):
+        for user_class, stats in other.classes.items():
+            if user_class not in self.classes:
+                self.classes[user_class] = ClassStats(interval_s=self.interval_s)
+            self.classes[user_class].merge(stats)
+
+    @classmethod
+    def from_dict(cls, data):
+        report = cls(interval_s=data["interval_s"])
+        for user_class, stats in data["classes"].items():
+            report.classes[user_class] = ClassStats.from_dict(stats, interval_s=data["interval_s"])
+        return report
+
+    def to_dict(self):
+        return {
+            "generated_at": time.time(),
+            "interval_s": self.interval_s,
+            "classes": {user_class: stats.to_dict() for user_class, stats in sorted(self.classes.items())},
+        }
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    def format_summary(self):
+        lines = []
+        for user_class, stats in sorted(self.classes.items()):
+            summary = stats.to_dict()
+            lines.append(
+                f"{user_class}: {summary['requests']} requests, {summary['errors']} errors, "
+                f"p50 {summary['p50_ms'] or 0:.1f} ms, p95 {summary['p95_ms'] or 0:.1f} ms, "
+                f"p99 {summary['p99_ms'] or 0:.1f} ms"
+            )
+        return "\n".join(lines)
+
+
+def load_report(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def compare_to_baseline(report, baseline, thresholds=None):
+    """
+    Compare a report with a baseline report.
+
+    Args:
+    - report (dict): The report of this run, as returned by LatencyReport.to_dict().
+    - baseline (dict): The baseline report.
+    - thresholds (dict): Maximum relative increase of p50, p95 and p99, and maximum absolute
+      increase of the error rate. Defaults to DEFAULT_THRESHOLDS.
+
+    Returns:
+    - list: A description of each regression, empty if there is none.
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    regressions = []
+    for user_class, baseline_stats in baseline["classes"].items():
+        stats = report["classes"].get(user_class)
+        if stats is None:
+            print(f"{user_class} is in the baseline but not in this run, skipping it")
+            continue
+        for percentile in ("p50", "p95", "p99"):
+            baseline_value = baseline_stats.get(f"{percentile}_ms")
+            value = stats.get(f"{percentile}_ms")
+            if not baseline_value or value is None:
+                continue
+            increase = value / baseline_value - 1
+            if increase > thresholds[percentile]:
+                regressions.append(
+                    f"{user_class} {percentile} {value:.1f} ms is {increase:.1%} above the baseline "
+                    f"{baseline_value:.1f} ms (threshold {thresholds[percentile]:.1%})"
+                )
+        error_rate_increase = stats["error_rate"] - baseline_stats["error_rate"]
+        if error_rate_increase > thresholds["error_rate"]:
+            regressions.append(
+                f"{user_class} error rate {stats['error_rate']:.2%} is {error_rate_increase:.2%} above the baseline "
+                f"{baseline_stats['error_rate']:.2%} (threshold {thresholds['error_rate']:.2%})"
+            )
+    return regressions
+
+
+def add_threshold_arguments(parser):
+    """
+    Add the regression threshold options, shared by this script and the locust command line.
+    """
+    parser.add_argument("--max-p50-increase", type=float, default=DEFAULT_THRESHOLDS["p50"],
+                        help="Maximum relative p50 latency increase over the baseline, e.g. 0.1 for 10%%")
+    parser.add_argument("--max-p95-increase", type=float, default=DEFAULT_THRESHOLDS["p95"],
+                        help="Maximum relative p95 latency increase over the baseline")
+    parser.add_argument("--max-p99-increase", type=float, default=DEFAULT_THRESHOLDS["p99"],
+                        help="Maximum relative p99 latency increase over the baseline")
+    parser.add_argument("--max-error-rate-increase", type=float, default=DEFAULT_THRESHOLDS["error_rate"],
+                        help="Maximum absolute error rate increase over the baseline, e.g. 0.01 for 1 point")
+
+
+def get_thresholds(options):
+    return {
+        "p50": options.max_p50_increase,
+        "p95": options.max_p95_increase,
+        "p99": options.max_p99_increase,
+        "error_rate": options.max_error_rate_increase,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--report", required=True, help="Latency report of the run to check")
+    parser.add_argument("--baseline", required=True, help="Latency report to compare against")
+    add_threshold_arguments(parser)
+    args = parser.parse_args()
+
+    regressions = compare_to_baseline(load_report(args.report), load_report(args.baseline), get_thresholds(args))
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    if regressions:
+        sys.exit(1)
+    print("No regression against the baseline")
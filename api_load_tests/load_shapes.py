@@ -0,0 +1,131 @@
+"""
+Open-loop arrival schedules for the load test.
+
+A load shape is a list of stages, each with a target request rate and a duration. Arrival times are
+drawn from the schedule alone, so the offered load does not drop when the API slows down and
+saturation shows up as growing latency and errors instead of a lower request rate.
+
+Load shapes are configured per user class with a "load_shape" entry in api_configs.json:
+
+    {"type": "constant", "rps": 5, "duration_s": 600}
+    {"type": "steps", "stages": [{"rps": 1, "duration_s": 120}, {"rps": 5, "duration_s": 300}]}
+    {"type": "spike", "base_rps": 2, "spike_rps": 20, "spike_start_s": 300, "spike_duration_s": 60, "duration_s": 900}
+    {"type": "diurnal", "min_rps": 1, "max_rps": 10, "period_s": 3600, "duration_s": 7200}
+    {"type": "trace", "trace": [[0, 1.5], [60, 3.0], [120, 2.0]], "duration_s": 180, "time_scale": 0.1}
+
+All shapes also accept "arrivals" ("poisson", the default, or "uniform") and "max_in_flight",
+the number of outstanding requests above which new arrivals are dropped and counted as failures.
+"""
+
+import math
+import random
+
+DEFAULT_MAX_IN_FLIGHT = 1000
+
+# Length in seconds of the constant-rate stages approximating a diurnal curve
+DIURNAL_STEP_S = 60
+
+
+class ArrivalSchedule():
+    """
+    Piecewise-constant request rate, as a list of (duration in seconds, requests per second) stages.
+    """
+    def __init__(self, stages, arrivals="poisson", max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        if arrivals not in ("poisson", "uniform"):
+            raise ValueError(f"Unknown arrivals '{arrivals}', expected poisson or uniform")
+        if any(duration <= 0 or rps < 0 for duration, rps in stages):
+            raise ValueError("Load shape stages need a positive duration and a non-negative rate")
+        self.stages = stages
+        self.arrivals = arrivals
+        self.max_in_flight = max_in_flight
+
+    @property
+    def duration_s(self):
+        return sum(duration for duration, _ in self.stages)
+
+    @property
+    def expected_requests(self):
+        return sum(duration * rps for duration, rps in self.stages)
+
+    def scaled(self, factor):
+        """
+        Get the same schedule with every rate multiplied by factor, e.g. to split it between workers.
+        """
+        return ArrivalSchedule([(duration, rps * factor) for duration, rps in self.stages],
+                               arrivals=self.arrivals, max_in_flight=self.max_in_flight)
+
+    def arrival_times(self, seed=None):
+        """
+        Yield the arrival offsets in seconds from the start of the test, in increasing order.
+        """
+        rng = random.Random(seed)
+        stage_start = 0.0
+        for duration, rps in self.stages:
+            stage_end = stage_start + duration
+            if rps > 0:
+                gap = 1.0 / rps
+                t = stage_start + (rng.expovariate(rps) if self.arrivals == "poisson" else gap / 2)
+                while t < stage_end:
+                    yield t
+                    t += rng.expovariate(rps) if self.arrivals == "poisson" else gap
+            stage_start = stage_end
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a schedule from a "load_shape" entry of api_configs.json.
+        """
+        shape_type = config.get("type", "constant")
+        if shape_type == "constant":
+            stages = [(config["duration_s"], config["rps"])]
+        elif shape_type == "steps":
+            stages = [(stage["duration_s"], stage["rps"]) for stage in config["stages"]]
+        elif shape_type == "spike":
+            spike_end = config["spike_start_s"] + config["spike_duration_s"]
+            stages = [
+                (config["spike_start_s"], config["base_rps"]),
+                (config["spike_duration_s"], config["spike_rps"]),
+                (config["duration_s"] - spike_end, config["base_rps"]),
+            ]
+            stages = [(duration, rps) for duration, rps in stages if duration > 0]
+        elif shape_type == "diurnal":
+            stages = diurnal_stages(config["min_rps"], config["max_rps"], config["period_s"], config["duration_s"],
+                                    step_s=config.get("step_s", DIURNAL_STEP_S))
+        elif shape_type == "trace":
+            stages = trace_stages(config["trace"], config["duration_s"], time_scale=config.get("time_scale", 1.0))
+        else:
+            raise ValueError(f"Unknown load shape type '{shape_type}'")
+        return cls(stages, arrivals=config.get("arrivals", "poisson"),
+                   max_in_flight=config.get("max_in_flight", DEFAULT_MAX_IN_FLIGHT))
+
+
+def diurnal_stages(min_rps, max_rps, period_s, duration_s, step_s=DIURNAL_STEP_S):
+    """
+    Approximate a cosine day curve, starting at the trough, with constant-rate stages.
+    """
+    stages = []
+    t = 0
+    while t < duration_s:
+        step = min(step_s, duration_s - t)
+        midpoint = t + step / 2
+        rps = min_rps + (max_rps - min_rps) * (1 - math.cos(2 * math.pi * midpoint / period_s)) / 2
+        stages.append((step, rps))
+        t += step
+    return stages
+
+
+def trace_stages(trace, duration_s, time_scale=1.0):
+    """
+    Replay a recorded request-rate trace, such as a day of production traffic.
+
+    Args:
+    - trace (list): (offset in seconds, requests per second) pairs, ordered by offset.
+    - duration_s (float): Duration of the recorded trace, before scaling.
+    - time_scale (float): Factor applied to the offsets, e.g. 0.1 replays a day in 2.4 hours.
+    """
+    points = [(offset, rps) for offset, rps in trace if offset < duration_s] + [(duration_s, 0.0)]
+    return [
+        ((end - start) * time_scale, rps)
+        for (start, rps), (end, _) in zip(points, points[1:])
+        if end > start
+    ]
@@ -0,0 +1,375 @@
+"""
+Local stand-in for API Gateway and Lambda, to load test the Lambda handlers without deploying them.
+
+Each route runs a handler in a pool of simulated Lambda containers. A container loads its own copy of
+the handler module, so module-level initialization runs again on every cold start, and is reused
+for later requests until it has been idle for too long. When all containers of a route are busy and
+the pool is full, requests are throttled with a 429, like a function at its concurrency limit.
+
+With --emulate-endpoint, the SageMaker runtime client of each container is replaced with the endpoint
+emulator, so the handlers can be profiled on a workstation. The --endpoint-* options also make the
+emulator throttle and time out like an overloaded endpoint:
+
+    python api_load_tests/local_api_gateway.py --port 3000 --emulate-endpoint --pool-size 10
+    locust -f api_load_tests/api_load_test.py --headless -u 20 -r 5 --run-time 2m LocalEmailNamesUser
+
+Container statistics are served at GET /_local/stats.
+"""
+
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from endpoint_emulator import EmulatedSageMakerRuntime
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda")
+
+DEFAULT_ROUTES = {
+    "/email-type": ("inference_lambda_email_type", "lambda_handler"),
+    "/email-names": ("inference_lambda_email_names", "lambda_handler"),
+    "/email-profile": ("inference_lambda_email_profile", "lambda_handler"),
+}
+
+# Timeout and memory of the functions in endpoint-config-template.yml
+FUNCTION_SETTINGS = {
+    "inference_lambda_email_type": {"timeout_s": 10, "memory_mb": 128},
+    "inference_lambda_email_names": {"timeout_s": 30, "memory_mb": 1024},
+    "inference_lambda_email_profile": {"timeout_s": 30, "memory_mb": 1024},
+}
+
+# API Gateway gives up on the integration after 29 seconds
+API_GATEWAY_TIMEOUT_S = 29
+
+
+class LambdaContext():
+    """
+    The context object passed to a Lambda handler.
+    """
+    def __init__(self, function_name, memory_mb, timeout_s, container_id):
+        self.function_name = function_name
+        self.function_version = "$LATEST"
+        self.invoked_function_arn = f"arn:aws:lambda:local:000000000000:function:{function_name}"
+        self.memory_limit_in_mb = memory_mb
+        self.aws_request_id = str(uuid.uuid4())
+        self.log_group_name = f"/aws/lambda/{function_name}"
+        self.log_stream_name = container_id
+        self._deadline = time.time() + timeout_s
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.time()) * 1000))
+
+
+class Container():
+    """
+    A simulated Lambda container with its own copy of the handler module.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, module_name, handler_name, endpoint_emulator=None, init_delay_s=0.0):
+        self.container_id = f"{module_name}-{next(self._ids)}"
+        start = time.perf_counter()
+        # Extra delay standing in for downloading the code and starting the runtime
+        time.sleep(init_delay_s)
+        spec = importlib.util.spec_from_file_location(
+            f"{module_name}_{self.container_id.replace('-', '_')}", os.path.join(LAMBDA_DIR, f"{module_name}.py")
+        )
+        self.module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.module)
+        if endpoint_emulator is not None:
+            self.module.sagemaker_runtime = endpoint_emulator
+            # Handlers picking a client per deadline get the emulator whatever the timeouts
+            if hasattr(self.module, "runtime_clients"):
+                self.module.runtime_clients.override = endpoint_emulator
+        self.handler = getattr(self.module, handler_name)
+        self.init_duration_s = time.perf_counter() - start
+        self.last_used = time.time()
+        self.invocations = 0
+
+
+class ContainerPool():
+    """
+    The containers of one function, reused most recently used first like Lambda.
+
+    Args:
+    - size (int): Maximum number of containers, the concurrency limit of the function.
+    - idle_timeout_s (float): Idle time after which a container is discarded.
+    """
+    def __init__(self, module_name, handler_name, size, idle_timeout_s, endpoint_emulator=None, init_delay_s=0.0):
+        self.module_name = module_name
+        self.handler_name = handler_name
+        self.size = size
+        self.idle_timeout_s = idle_timeout_s
+        self.endpoint_emulator = endpoint_emulator
+        self.init_delay_s = init_delay_s
+        self._idle = []
+        self._busy = 0
+        self._lock = threading.Lock()
+        self.cold_starts = 0
+        self.throttles = 0
+        self.init_durations_s = []
+
+    def acquire(self):
+        """
+        Get a warm container, or start one if the pool is not full.
+
+        Returns:
+        - tuple: The container and whether it was a cold start, or (None, False) if throttled.
+        """
+        with self._lock:
+            now = time.time()
+            expired = [container for container in self._idle if now - container.last_used > self.idle_timeout_s]
+            self._idle = [container for container in self._idle if container not in expired]
+            if self._idle:
+                self._busy += 1
+                return self._idle.pop(), False
+            if self._busy >= self.size:
+                self.throttles += 1
+                return None, False
+            self._busy += 1
+            self.cold_starts += 1
+
+        try:
+            container = Container(self.module_name, self.handler_name, self.endpoint_emulator, self.init_delay_s)
+        except Exception:
+            with self._lock:
+                self._busy -= 1
+            raise
+        with self._lock:
+            self.init_durations_s.append(container.init_duration_s)
+        return container, True
+
+    def release(self, container):
+        with self._lock:
+            container.last_used = time.time()
+            container.invocations += 1
+            self._busy -= 1
+            self._idle.append(container)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "module": self.module_name,
+                "pool_size": self.size,
+                "idle_containers": len(self._idle),
+                "busy_containers": self._busy,
+                "cold_starts": self.cold_starts,
+                "throttles": self.throttles,
+                "mean_init_ms": (sum(self.init_durations_s) / len(self.init_durations_s) * 1000
+                                 if self.init_durations_s else None),
+            }
+
+
+def build_proxy_event(method, path, headers, body, stage):
+    """
+    Build an API Gateway REST API proxy integration event.
+    """
+    return {
+        "resource": path,
+        "path": path,
+        "httpMethod": method,
+        "headers": headers,
+        "multiValueHeaders": {key: [value] for key, value in headers.items()},
+        "queryStringParameters": None,
+        "pathParameters": None,
+        "stageVariables": None,
+        "requestContext": {
+            "requestId": str(uuid.uuid4()),
+            "stage": stage,
+            "httpMethod": method,
+            "path": f"/{stage}{path}",
+            "requestTimeEpoch": int(time.time() * 1000),
+            "identity": {"sourceIp": "127.0.0.1"},
+        },
+        "body": body,
+        "isBase64Encoded": False,
+    }
+
+
+def invoke(pool, event):
+    """
+    Invoke the function of a pool like the API Gateway proxy integration.
+
+    Returns:
+    - tuple: The HTTP status, headers and body.
+    """
+    container, cold_start = pool.acquire()
+    if container is None:
+        return 429, {}, json.dumps({"message": "Rate Exceeded."})
+
+    settings = FUNCTION_SETTINGS.get(pool.module_name, {"timeout_s": 30, "memory_mb": 128})
+    context = LambdaContext(pool.module_name, settings["memory_mb"], settings["timeout_s"], container.container_id)
+    start = time.perf_counter()
+    try:
+        result = container.handler(event, context)
+    except Exception as e:
+        print(f"[{container.container_id}] Unhandled {type(e).__name__}: {e}")
+        result = None
+    finally:
+        pool.release(container)
+    duration_s = time.perf_counter() - start
+
+    headers = {
+        "X-Local-Container-Id": container.container_id,
+        "X-Local-Cold-Start": str(cold_start).lower(),
+        "X-Local-Duration-Ms": f"{duration_s * 1000:.1f}",
+    }
+    if duration_s > min(settings["timeout_s"], API_GATEWAY_TIMEOUT_S):
+        return 504, headers, json.dumps({"message": "Endpoint request timed out"})
+    # Like API Gateway, a result without a status code is a malformed proxy response
+    if not isinstance(result, dict) or "statusCode" not in result:
+        return 502, headers, json.dumps({"message": "Internal server error"})
+    headers.update(result.get("headers") or {})
+    return int(result["statusCode"]), headers, result.get("body") or ""
+
+
+def create_request_handler(pools, stage):
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def send(self, status, headers, body):
+            body = body.encode("utf-8")
+            self.send_response(status)
+            headers = {"Content-Type": "application/json", **headers}
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/_local/stats":
+                stats = {path: pool.stats() for path, pool in pools.items()}
+                self.send(200, {}, json.dumps(stats))
+                return
+            self.send(404, {}, json.dumps({"message": "Not Found"}))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length).decode("utf-8") if length else None
+            path = self.path.split("?")[0]
+            # Accept both /email-names and /<stage>/email-names
+            if path.startswith(f"/{stage}/"):
+                path = path[len(stage) + 1:]
+            pool = pools.get(path)
+            if pool is None:
+                self.send(403, {}, json.dumps({"message": "Missing Authentication Token"}))
+                return
+            event = build_proxy_event("POST", path, dict(self.headers), body, stage)
+            self.send(*invoke(pool, event))
+
+        def log_message(self, format, *args):
+            pass
+
+    return RequestHandler
+
+
+def parse_routes(route_args):
+    """
+    Parse --route PATH=MODULE[:HANDLER] options, by default both handlers are served.
+    """
+    if not route_args:
+        return dict(DEFAULT_ROUTES)
+    routes = {}
+    for route in route_args:
+        path, target = route.split("=", 1)
+        module_name, _, handler_name = target.partition(":")
+        routes[path] = (module_name, handler_name or "lambda_handler")
+    return routes
+
+
+def create_server(host="127.0.0.1", port=3000, stage="local", routes=None, pool_size=10, idle_timeout_s=300,
+                  init_delay_s=0.0, emulate_endpoint=False, endpoint_latency_ms=800, endpoint_latency_cv=0.3,
+                  endpoint_concurrency=8, endpoint_throttle_rate=0.0, endpoint_timeout_rate=0.0,
+                  endpoint_max_queue=None, endpoint_read_timeout_s=None):
+    """
+    Create the local API Gateway server, call serve_forever() on it to start serving.
+
+    Returns:
+    - tuple: The server and the container pools by path.
+    """
+    # The handlers create boto3 clients when they are loaded, which needs a region
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    if LAMBDA_DIR not in sys.path:
+        sys.path.insert(0, LAMBDA_DIR)
+
+    pools = {}
+    for path, (module_name, handler_name) in (routes or DEFAULT_ROUTES).items():
+        emulator = None
+        if emulate_endpoint:
+            # One emulated endpoint per route, shared by its containers like a real endpoint
+            emulator = EmulatedSageMakerRuntime(latency_ms=endpoint_latency_ms, latency_cv=endpoint_latency_cv,
+                                                concurrency=endpoint_concurrency,
+                                                throttle_rate=endpoint_throttle_rate,
+                                                timeout_rate=endpoint_timeout_rate,
+                                                max_queue=endpoint_max_queue,
+                                                read_timeout_s=endpoint_read_timeout_s)
+        pools[path] = ContainerPool(module_name, handler_name, pool_size, idle_timeout_s,
+                                    endpoint_emulator=emulator, init_delay_s=init_delay_s)
+
+    server = ThreadingHTTPServer((host, port), create_request_handler(pools, stage))
+    server.daemon_threads = True
+    return server, pools
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--stage", default="local", help="Stage name accepted as a path prefix")
+    parser.add_argument("--route", action="append",
+                        help="Route as PATH=MODULE[:HANDLER], the module is loaded from the lambda directory, "
+                             "can be repeated")
+    parser.add_argument("--pool-size", type=int, default=10,
+                        help="Maximum number of containers per route, requests beyond it are throttled")
+    parser.add_argument("--idle-timeout", type=float, default=300,
+                        help="Seconds after which an idle container is discarded")
+    parser.add_argument("--init-delay", type=float, default=0.0, help="Extra seconds added to each cold start")
+    parser.add_argument("--emulate-endpoint", action="store_true",
+                        help="Replace the SageMaker runtime client with the endpoint emulator")
+    parser.add_argument("--endpoint-latency-ms", type=float, default=800,
+                        help="Mean service time of the emulated endpoint")
+    parser.add_argument("--endpoint-latency-cv", type=float, default=0.3,
+                        help="Coefficient of variation of the emulated service time")
+    parser.add_argument("--endpoint-concurrency", type=int, default=8,
+                        help="Number of requests the emulated endpoint serves at once")
+    parser.add_argument("--endpoint-throttle-rate", type=float, default=0.0,
+                        help="Share of requests the emulated endpoint throttles at random")
+    parser.add_argument("--endpoint-timeout-rate", type=float, default=0.0,
+                        help="Share of requests timing out at random")
+    parser.add_argument("--endpoint-max-queue", type=int, default=None,
+                        help="Number of requests that can queue at the emulated endpoint before it throttles")
+    parser.add_argument("--endpoint-read-timeout", type=float, default=None,
+                        help="Seconds after which a queued or slow request times out")
+    args = parser.parse_args()
+
+    server, pools = create_server(
+        host=args.host,
+        port=args.port,
+        stage=args.stage,
+        routes=parse_routes(args.route),
+        pool_size=args.pool_size,
+        idle_timeout_s=args.idle_timeout,
+        init_delay_s=args.init_delay,
+        emulate_endpoint=args.emulate_endpoint,
+        endpoint_latency_ms=args.endpoint_latency_ms,
+        endpoint_latency_cv=args.endpoint_latency_cv,
+        endpoint_concurrency=args.endpoint_concurrency,
+        endpoint_throttle_rate=args.endpoint_throttle_rate,
+        endpoint_timeout_rate=args.endpoint_timeout_rate,
+        endpoint_max_queue=args.endpoint_max_queue,
+        endpoint_read_timeout_s=args.endpoint_read_timeout,
+    )
+    print(f"Serving {', '.join(sorted(pools))} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    for path, pool in pools.items():
+        print(f"{path}: {json.dumps(pool.stats())}")
@@ -0,0 +1,99 @@
+"""
+Append-only JSONL sink for the responses recorded during a load test.
+
+Records are buffered in memory and written out every few seconds, or as soon as the buffer is
+full, so memory stays flat however long the test runs and an interrupted run keeps everything
+written up to the last flush. Files are rotated once they reach a maximum size.
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+
+MB = 1024 * 1024
+
+
+class ResponseSink():
+    """
+    Buffered JSONL writer with periodic flushes and size-based file rotation.
+
+    Args:
+    - output_dir (str): Directory to write the files to.
+    - prefix (str): File name prefix, the files are named {prefix}_{timestamp}_{pid}_{part}.jsonl.
+    - max_file_mb (float): Size in MB after which a new file is started.
+    - flush_interval_s (float): Maximum time in seconds a record stays in the buffer.
+    - max_buffer_records (int): Number of buffered records that triggers a flush.
+    """
+    def __init__(self, output_dir, prefix="responses", max_file_mb=100, flush_interval_s=5.0, max_buffer_records=500):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.max_file_bytes = int(max_file_mb * MB)
+        self.flush_interval_s = flush_interval_s
+        self.max_buffer_records = max_buffer_records
+        # The process id keeps the files of several locust workers on one machine apart
+        self._run_id = f"{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{os.getpid()}"
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_bytes = 0
+        self._part = 0
+        self._last_flush = time.time()
+        self.paths = []
+        self.records_written = 0
+
+    def record(self, user_class, status_code, latency_ms, response=None, error=None):
+        """
+        Record one response with its latency and status.
+        """
+        self.write({
+            "timestamp": time.time(),
+            "user_class": user_class,
+            "status_code": status_code,
+            "latency_ms": round(latency_ms, 3),
+            "ok": error is None,
+            "error": error,
+            "response": response,
+        })
+
+    def write(self, record):
+        with self._lock:
+            self._buffer.append(json.dumps(record))
+            if (len(self._buffer) >= self.max_buffer_records
+                    or time.time() - self._last_flush >= self.flush_interval_s):
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _open_next_file(self):
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._part += 1
+        path = os.path.join(self.output_dir, f"{self.prefix}_{self._run_id}_{self._part:04d}.jsonl")
+        self._file = open(path, "a")
+        self._file_bytes = 0
+        self.paths.append(path)
+
+    def _flush(self):
+        self._last_flush = time.time()
+        if not self._buffer:
+            return
+        for line in self._buffer:
+            if self._file is None or self._file_bytes >= self.max_file_bytes:
+                self._open_next_file()
+            self._file.write(line + "\n")
+            self._file_bytes += len(line) + 1
+        self._file.flush()
+        self.records_written += len(self._buffer)
+        self._buffer = []
@@ -0,0 +1,380 @@
+"""
+This script simulates the endpoint autoscaling offline to tune the scaling settings in model_configs.json.
+
+It replays a request-arrival trace against a per-instance service-time model and the
+SageMakerVariantInvocationsPerInstance target-tracking policy of endpoint-config-template.yml,
+for every combination of target value and cooldowns, and reports the queueing latency
+percentiles and instance-hours of each setting.
+
+The trace is either a locust stats history (the <csv_name>_stats_history.csv file written with --csv)
+or a synthetic diurnal curve. The recommended setting is the cheapest one meeting the p99 queueing
+latency objective, written with the same keys as model_configs.json so build_deployment_configs.extend_config
+can consume it, e.g.:
+
+    python autoscaling_simulator.py --stack email_names --diurnal 2,40 --duration-hours 6 --service-time 1.2 \
+        --concurrency-per-instance 8 --max-p99-wait 2 --output scaling-recommendation.json
+"""
+
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import math
+import random
+
+# Target tracking creates a scale-out alarm on 3 datapoints above the target and
+# a scale-in alarm on 15 datapoints below 90% of the target, with 1 minute periods.
+METRIC_PERIOD_S = 60
+SCALE_OUT_DATAPOINTS = 3
+SCALE_IN_DATAPOINTS = 15
+SCALE_IN_THRESHOLD = 0.9
+
+
+def load_locust_history_trace(path, name="Aggregated"):
+    """
+    Load a request-rate trace from a locust stats history CSV.
+
+    Returns:
+    - list: (offset in seconds, requests per second) tuples.
+    """
+    trace = []
+    start = None
+    with open(path, "r") as f:
+        for row in csv.DictReader(f):
+            if row.get("Name") != name:
+                continue
+            timestamp = int(row["Timestamp"])
+            start = timestamp if start is None else start
+            trace.append((timestamp - start, float(row["Requests/s"])))
+    return trace
+
+
+def get_trace_end(trace):
+    """
+    Get the end of a trace, one sampling interval after its last offset.
+    """
+    if len(trace) < 2:
+        return trace[-1][0] + 1 if trace else 0
+    return trace[-1][0] + max(1, trace[-1][0] - trace[-2][0])
+
+
+def diurnal_trace(base_rps, peak_rps, duration_s, period_s=86400, step_s=60):
+    """
+    Build a synthetic diurnal request-rate trace, starting at the trough.
+
+    Returns:
+    - list: (offset in seconds, requests per second) tuples.
+    """
+    return [
+        (t, base_rps + (peak_rps - base_rps) * (1 - math.cos(2 * math.pi * t / period_s)) / 2)
+        for t in range(0, int(duration_s), step_s)
+    ]
+
+
+def generate_requests(trace, duration_s, service_time_s, service_time_cv, seed=0):
+    """
+    Draw Poisson arrivals following the trace, each with its service time.
+
+    The same requests are replayed for every setting so that settings are compared on identical load.
+
+    Returns:
+    - list: (arrival time, service time) tuples, ordered by arrival time.
+    """
+    rng = random.Random(seed)
+    # Log-normal service times with the given mean and coefficient of variation
+    sigma = math.sqrt(math.log(1 + service_time_cv ** 2))
+    mu = math.log(service_time_s) - sigma ** 2 / 2
+
+    requests = []
+    segments = list(trace) + [(duration_s, 0.0)]
+    for (start, rps), (end, _) in zip(segments, segments[1:]):
+        if rps <= 0:
+            continue
+        t = start + rng.expovariate(rps)
+        while t < min(end, duration_s):
+            service_time = rng.lognormvariate(mu, sigma) if service_time_cv > 0 else service_time_s
+            requests.append((t, service_time))
+            t += rng.expovariate(rps)
+    return requests
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(math.ceil(q / 100 * len(sorted_values))) - 1)
+    return sorted_values[max(index, 0)]
+
+
+class EndpointSimulator():
+    """
+    Simulates one endpoint variant under target-tracking scaling.
+
+    Each instance serves concurrency_per_instance requests at a time in FIFO order, new
+    instances start serving provisioning_delay_s after the scale-out decision, and removed
+    instances finish their in-flight requests.
+    """
+    def __init__(self, target_value, scale_in_cooldown, scale_out_cooldown, min_capacity, max_capacity,
+                 initial_capacity, concurrency_per_instance, provisioning_delay_s):
+        self.target_value = target_value
+        self.scale_in_cooldown = scale_in_cooldown
+        self.scale_out_cooldown = scale_out_cooldown
+        self.min_capacity = min_capacity
+        self.max_capacity = max_capacity
+        self.concurrency_per_instance = concurrency_per_instance
+        self.provisioning_delay_s = provisioning_delay_s
+
+        self.in_service = initial_capacity
+        self.desired = initial_capacity
+        # Time at which each request slot becomes free
+        self.slots = [0.0] * (initial_capacity * concurrency_per_instance)
+        self.pending = []
+        self.last_scale_out = -math.inf
+        self.last_scale_in = -math.inf
+        self.above = 0
+        self.below = 0
+        self.scaling_events = []
+        self.instance_seconds = 0.0
+        self._accounted_until = 0.0
+
+    def _account(self, now):
+        # Instances are billed from the scale-out decision, so pending ones count too
+        self.instance_seconds += (self.in_service + len(self.pending)) * (now - self._accounted_until)
+        self._accounted_until = now
+
+    def _activate_pending(self, now):
+        while self.pending and self.pending[0] <= now:
+            ready_at = heapq.heappop(self.pending)
+            self._account(ready_at)
+            self.in_service += 1
+            for _ in range(self.concurrency_per_instance):
+                heapq.heappush(self.slots, ready_at)
+
+    def _scale_in(self, now, count):
+        self._account(now)
+        # The busiest slots are removed, their in-flight requests still complete
+        self.slots.sort()
+        del self.slots[len(self.slots) - count * self.concurrency_per_instance:]
+        heapq.heapify(self.slots)
+        self.in_service -= count
+
+    def evaluate_policy(self, now, invocations):
+        """
+        Evaluate the target-tracking alarms at the end of a metric period.
+        """
+        self._activate_pending(now)
+        metric = invocations / max(self.in_service, 1)
+        self.above = self.above + 1 if metric > self.target_value else 0
+        self.below = self.below + 1 if metric < self.target_value * SCALE_IN_THRESHOLD else 0
+
+        capacity = self.in_service + len(self.pending)
+        desired = min(self.max_capacity, max(self.min_capacity, math.ceil(capacity * metric / self.target_value)))
+
+        if self.above >= SCALE_OUT_DATAPOINTS and desired > capacity:
+            # During the scale-out cooldown, only scale out further than the previous activity did
+            if now - self.last_scale_out >= self.scale_out_cooldown or desired > self.desired:
+                self._account(now)
+                for _ in range(desired - capacity):
+                    heapq.heappush(self.pending, now + self.provisioning_delay_s)
+                self.desired = desired
+                self.last_scale_out = now
+                self.scaling_events.append((now, "out", desired))
+        elif self.below >= SCALE_IN_DATAPOINTS and desired < capacity and not self.pending:
+            if (now - self.last_scale_in >= self.scale_in_cooldown
+                    and now - self.last_scale_out >= self.scale_out_cooldown):
+                self._scale_in(now, capacity - desired)
+                self.desired = desired
+                self.last_scale_in = now
+                self.scaling_events.append((now, "in", desired))
+
+    def run(self, requests, duration_s):
+        """
+        Replay the requests.
+
+        Returns:
+        - dict: Queueing latency percentiles, instance-hours and scaling activity.
+        """
+        waits = []
+        next_evaluation = METRIC_PERIOD_S
+        invocations = 0
+        for arrival, service_time in requests:
+            while arrival >= next_evaluation:
+                self.evaluate_policy(next_evaluation, invocations)
+                invocations = 0
+                next_evaluation += METRIC_PERIOD_S
+            self._activate_pending(arrival)
+
+            free_at = heapq.heappop(self.slots)
+            start = max(arrival, free_at)
+            waits.append(start - arrival)
+            heapq.heappush(self.slots, start + service_time)
+            invocations += 1
+
+        while next_evaluation <= duration_s:
+            self.evaluate_policy(next_evaluation, invocations)
+            invocations = 0
+            next_evaluation += METRIC_PERIOD_S
+        self._activate_pending(duration_s)
+        self._account(duration_s)
+
+        waits.sort()
+        return {
+            "requests": len(waits),
+            "p50_wait_s": percentile(waits, 50),
+            "p95_wait_s": percentile(waits, 95),
+            "p99_wait_s": percentile(waits, 99),
+            "max_wait_s": waits[-1] if waits else 0.0,
+            "instance_hours": self.instance_seconds / 3600,
+            "scale_out_events": sum(1 for event in self.scaling_events if event[1] == "out"),
+            "scale_in_events": sum(1 for event in self.scaling_events if event[1] == "in"),
+        }
+
+
+def sweep(requests, duration_s, target_values, scale_in_cooldowns, scale_out_cooldowns, min_capacity,
+          max_capacity, concurrency_per_instance, provisioning_delay_s):
+    """
+    Simulate every combination of target value and cooldowns.
+
+    Returns:
+    - list: One result dictionary per setting.
+    """
+    results = []
+    for target_value, scale_in_cooldown, scale_out_cooldown in itertools.product(
+        target_values, scale_in_cooldowns, scale_out_cooldowns
+    ):
+        simulator = EndpointSimulator(
+            target_value=target_value,
+            scale_in_cooldown=scale_in_cooldown,
+            scale_out_cooldown=scale_out_cooldown,
+            min_capacity=min_capacity,
+            max_capacity=max_capacity,
+            initial_capacity=min_capacity,
+            concurrency_per_instance=concurrency_per_instance,
+            provisioning_delay_s=provisioning_delay_s,
+        )
+        result = simulator.run(requests, duration_s)
+        result.update({
+            "EndpointScalingTargetValue": target_value,
+            "EndpointScaleInCooldown": scale_in_cooldown,
+            "EndpointScaleOutCooldown": scale_out_cooldown,
+        })
+        results.append(result)
+    return results
+
+
+def recommend(results, max_p99_wait_s):
+    """
+    Pick the setting with the fewest instance-hours meeting the p99 queueing latency objective.
+
+    Returns:
+    - dict: The recommended settings as model_configs.json values, or None if no setting meets the objective.
+    """
+    feasible = [result for result in results if result["p99_wait_s"] <= max_p99_wait_s]
+    if not feasible:
+        return None
+    best = min(feasible, key=lambda result: (
+        round(result["instance_hours"], 3), -result["EndpointScalingTargetValue"], result["p99_wait_s"]
+    ))
+    return {
+        "EndpointScalingTargetValue": str(best["EndpointScalingTargetValue"]),
+        "EndpointScaleInCooldown": str(best["EndpointScaleInCooldown"]),
+        "EndpointScaleOutCooldown": str(best["EndpointScaleOutCooldown"]),
+    }
+
+
+def parse_list(value, type_=float):
+    return [type_(item) for item in value.split(",") if item]
+
+
+def print_results(results):
+    print(
+        f"{'target':>8} {'in_cd':>6} {'out_cd':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'inst_h':>8} "
+        f"{'out':>4} {'in':>4}"
+    )
+    for result in results:
+        print(
+            f"{result['EndpointScalingTargetValue']:>8g} {result['EndpointScaleInCooldown']:>6} "
+            f"{result['EndpointScaleOutCooldown']:>6} {result['p50_wait_s']:>8.2f} {result['p95_wait_s']:>8.2f} "
+            f"{result['p99_wait_s']:>8.2f} {result['instance_hours']:>8.2f} {result['scale_out_events']:>4} "
+            f"{result['scale_in_events']:>4}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stack", required=True, help="Key of the stack in model_configs.json, e.g. email_names")
+    parser.add_argument("--model-configs", default="model_configs.json")
+    parser.add_argument("--trace-csv", help="Locust stats history CSV to replay")
+    parser.add_argument("--diurnal", help="Synthetic diurnal trace as BASE_RPS,PEAK_RPS")
+    parser.add_argument("--duration-hours", type=float,
+                        help="Duration of the simulation, by default the length of --trace-csv or 24 hours "
+                             "with --diurnal")
+    parser.add_argument("--service-time", type=float, required=True,
+                        help="Mean service time of one request in seconds")
+    parser.add_argument("--service-time-cv", type=float, default=0.3,
+                        help="Coefficient of variation of the service time")
+    parser.add_argument("--concurrency-per-instance", type=int, default=1,
+                        help="Requests served concurrently by one instance")
+    parser.add_argument("--provisioning-delay", type=float, default=300,
+                        help="Seconds before a new instance serves requests")
+    parser.add_argument("--targets", help="Comma separated target values, by default 50%% to 150%% of the current one")
+    parser.add_argument("--scale-in-cooldowns", default="300,600")
+    parser.add_argument("--scale-out-cooldowns", default="60,300")
+    parser.add_argument("--max-p99-wait", type=float, default=1.0,
+                        help="Objective for the p99 queueing latency in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file to write the results and recommendation to")
+    parser.add_argument("--apply", action="store_true", help="Write the recommendation into the model configs file")
+    args = parser.parse_args()
+
+    if bool(args.trace_csv) == bool(args.diurnal):
+        parser.error("exactly one of --trace-csv and --diurnal is required")
+
+    with open(args.model_configs, "r") as f:
+        model_configs = json.load(f)
+    model_config = model_configs[args.stack]
+
+    if args.trace_csv:
+        trace = load_locust_history_trace(args.trace_csv)
+        if not trace:
+            parser.error(f"{args.trace_csv} has no Aggregated rows")
+        trace_end_s = get_trace_end(trace)
+        # The load stops with the trace instead of holding its last rate
+        trace.append((trace_end_s, 0.0))
+        duration_s = args.duration_hours * 3600 if args.duration_hours is not None else trace_end_s
+    else:
+        duration_s = (args.duration_hours if args.duration_hours is not None else 24.0) * 3600
+        base_rps, peak_rps = parse_list(args.diurnal)
+        trace = diurnal_trace(base_rps, peak_rps, duration_s)
+
+    current_target = float(model_config.get("EndpointScalingTargetValue", "90"))
+    target_values = parse_list(args.targets) if args.targets else [
+        round(current_target * factor, 1) for factor in (0.5, 0.75, 1.0, 1.25, 1.5)
+    ]
+
+    requests = generate_requests(trace, duration_s, args.service_time, args.service_time_cv, seed=args.seed)
+    print(f"Simulating {len(requests)} requests over {duration_s / 3600:.2f} hours")
+    results = sweep(
+        requests,
+        duration_s,
+        target_values,
+        parse_list(args.scale_in_cooldowns, int),
+        parse_list(args.scale_out_cooldowns, int),
+        min_capacity=int(model_config.get("EndpointScalingMinCapacity", "1")),
+        max_capacity=int(model_config.get("EndpointScalingMaxCapacity", "3")),
+        concurrency_per_instance=args.concurrency_per_instance,
+        provisioning_delay_s=args.provisioning_delay,
+    )
+    print_results(results)
+
+    recommendation = recommend(results, args.max_p99_wait)
+    print(f"Recommendation for {args.stack}: {recommendation}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"stack": args.stack, "results": results, "recommendation": recommendation}, f, indent=4)
+    if args.apply and recommendation:
+        model_config.update(recommendation)
+        with open(args.model_configs, "w") as f:
+            json.dump(model_configs, f, indent=2)
+            f.write("\n")
@@ -1,58 +1,208 @@
 import argparse
+import datetime
 import json
 import logging
 import os
-import sagemaker
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 import boto3
 from botocore.exceptions import ClientError
+from botocore.utils import parse_timestamp
 
 logger = logging.getLogger(__name__)
 
+# Guards the on-disk image URI cache when several stacks are resolved concurrently
+_image_uri_cache_lock = threading.Lock()
 
-def get_approved_package(model_package_group_name, sm_client):
+
+class ModelPackageIndex():
+    """Local index of the model package summaries of one model package group.
+
+    The index is synced incrementally: each sync only lists the packages created after
+    the creation-time watermark, and re-checks the packages still pending approval with
+    describe_model_package so that approval decisions on those are picked up too.
+
+    The index file is only a cache. A build without it, e.g. in a fresh CodeBuild
+    workspace, lists the whole group once, so keep the file in a directory that persists
+    between builds (such as a CodeBuild local cache path) to get the delta syncs.
+    """
+
+    def __init__(self, model_package_group_name, packages=None, watermark=None):
+        self.model_package_group_name = model_package_group_name
+        self.packages = packages or {}
+        self.watermark = watermark
+        self._rebuild()
+
+    @classmethod
+    def load(cls, index_path, model_package_group_name):
+        """Load the index of a model package group from the index file, or create an empty one."""
+        if index_path and os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                group_index = json.load(f).get(model_package_group_name, {})
+            return cls(
+                model_package_group_name,
+                packages=group_index.get("packages"),
+                watermark=group_index.get("watermark"),
+            )
+        return cls(model_package_group_name)
+
+    def save(self, index_path):
+        """Save the index, keeping the indexes of other model package groups in the same file."""
+        if not index_path:
+            return
+        indexes = {}
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                indexes = json.load(f)
+        indexes[self.model_package_group_name] = {
+            "watermark": self.watermark,
+            "packages": self.packages,
+        }
+        with open(index_path, "w") as f:
+            json.dump(indexes, f, indent=4, sort_keys=True)
+
+    def _rebuild(self):
+        # Precompute the lookups so latest_approved and approved_version are O(1)
+        approved = [
+            package for package in self.packages.values()
+            if package["ModelApprovalStatus"] == "Approved"
+        ]
+        approved.sort(key=lambda package: package["CreationTime"])
+        self._latest_approved = approved[-1] if approved else None
+        self._approved_by_version = {
+            package["ModelPackageVersion"]: package
+            for package in approved
+            if package.get("ModelPackageVersion") is not None
+        }
+
+    def _add(self, summary):
+        self.packages[summary["ModelPackageArn"]] = {
+            "ModelPackageArn": summary["ModelPackageArn"],
+            "ModelApprovalStatus": summary.get("ModelApprovalStatus"),
+            "CreationTime": summary["CreationTime"].isoformat(),
+            "ModelPackageVersion": summary.get("ModelPackageVersion"),
+        }
+
+    def _get_sync_start(self):
+        if not self.watermark:
+            return None
+        # CreationTimeAfter is exclusive, step back so the boundary package is listed again
+        return parse_timestamp(self.watermark) - datetime.timedelta(seconds=1)
+
+    def _refresh_pending(self, sm_client, listed_arns):
+        """Re-check the approval status of the pending packages that were not just listed."""
+        pending_arns = [
+            arn for arn, package in self.packages.items()
+            if package["ModelApprovalStatus"] == "PendingManualApproval" and arn not in listed_arns
+        ]
+        for arn in pending_arns:
+            try:
+                response = sm_client.describe_model_package(ModelPackageName=arn)
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ValidationException":
+                    raise
+                # The package was deleted since the last sync
+                del self.packages[arn]
+                continue
+            self.packages[arn]["ModelApprovalStatus"] = response["ModelApprovalStatus"]
+        return len(pending_arns)
+
+    def sync(self, sm_client):
+        """List the packages created since the last sync, merge them into the index and
+        re-check the packages still pending approval.
+
+        Returns:
+            The number of package summaries received.
+        """
+        request = {
+            "ModelPackageGroupName": self.model_package_group_name,
+            "SortBy": "CreationTime",
+            "SortOrder": "Ascending",
+            "MaxResults": 100,
+        }
+        sync_start = self._get_sync_start()
+        if sync_start is not None:
+            request["CreationTimeAfter"] = sync_start
+
+        listed_arns = set()
+        while True:
+            response = sm_client.list_model_packages(**request)
+            for summary in response["ModelPackageSummaryList"]:
+                self._add(summary)
+                listed_arns.add(summary["ModelPackageArn"])
+            if "NextToken" not in response:
+                break
+            logger.debug("Getting more packages for token: {}".format(response["NextToken"]))
+            request["NextToken"] = response["NextToken"]
+
+        refreshed = self._refresh_pending(sm_client, listed_arns)
+        if self.packages:
+            self.watermark = max(package["CreationTime"] for package in self.packages.values())
+        self._rebuild()
+        logger.debug(
+            f"Synced {len(listed_arns)} model packages and re-checked {refreshed} pending packages "
+            f"for {self.model_package_group_name}"
+        )
+        return len(listed_arns)
+
+    def refresh(self, sm_client, model_package_arn):
+        """Refresh the approval status of one package, e.g. one approved earlier and since rejected."""
+        response = sm_client.describe_model_package(ModelPackageName=model_package_arn)
+        self.packages[model_package_arn]["ModelApprovalStatus"] = response["ModelApprovalStatus"]
+        self._rebuild()
+        return response["ModelApprovalStatus"] == "Approved"
+
+    def latest_approved(self):
+        """Get the latest approved package, or None."""
+        return self._latest_approved
+
+    def approved_version(self, model_package_version):
+        """Get the approved package at the given version, or None."""
+        return self._approved_by_version.get(int(model_package_version))
+
+
+def get_approved_package(model_package_group_name, sm_client, index_path=".model-package-index.json",
+                         model_package_version=None):
     """Gets the latest approved model package for a model package group.
 
+    The lookup uses the local model package index, synced with a single delta call,
+    and the selected package is re-checked so a revoked approval is never returned.
+
     Args:
         model_package_group_name: The model package group name.
+        sm_client: The SageMaker client.
+        index_path: Path of the model package index file, see ModelPackageIndex.
+        model_package_version: Optional version to get instead of the latest approved one.
 
     Returns:
         The SageMaker Model Package ARN.
     """
     try:
-        # Get the latest approved model package
-        response = sm_client.list_model_packages(
-            ModelPackageGroupName=model_package_group_name,
-            ModelApprovalStatus="Approved",
-            SortBy="CreationTime",
-            MaxResults=100,
-        )
-        approved_packages = response["ModelPackageSummaryList"]
-
-        # Fetch more packages if none returned with continuation token
-        while len(approved_packages) == 0 and "NextToken" in response:
-            logger.debug(
-                "Getting more packages for token: {}".format(
-                    response["NextToken"]
-                )
-            )
-            response = sm_client.list_model_packages(
-                ModelPackageGroupName=model_package_group_name,
-                ModelApprovalStatus="Approved",
-                SortBy="CreationTime",
-                MaxResults=100,
-                NextToken=response["NextToken"],
-            )
-            approved_packages.extend(response["ModelPackageSummaryList"])
+        index = ModelPackageIndex.load(index_path, model_package_group_name)
+        index.sync(sm_client)
+
+        while True:
+            if model_package_version is None:
+                package = index.latest_approved()
+            else:
+                package = index.approved_version(model_package_version)
+
+            # Return error if no packages found
+            if package is None:
+                index.save(index_path)
+                error_message = f"No approved ModelPackage found."
+                logger.error(error_message)
+                raise Exception(error_message)
+
+            if index.refresh(sm_client, package["ModelPackageArn"]):
+                break
 
-        # Return error if no packages found
-        if len(approved_packages) == 0:
-            error_message = f"No approved ModelPackage found."
-            logger.error(error_message)
-            raise Exception(error_message)
+        index.save(index_path)
 
-        # Return the pmodel package arn
-        model_package_arn = approved_packages[0]["ModelPackageArn"]
+        # Return the model package arn
+        model_package_arn = package["ModelPackageArn"]
         logger.debug(
             f"Identified the latest approved model package: {model_package_arn}"
         )
@@ -62,6 +212,195 @@ def get_approved_package(model_package_group_name, sm_client):
         logger.error(error_message)
         raise Exception(error_message)
 
+# The endpoint template renders a primary and an optional secondary production variant
+MAX_VARIANTS = 2
+
+# Scaling settings of a variant, with the defaults used when model_configs.json omits them
+VARIANT_SCALING_DEFAULTS = {
+    "EndpointScalingTargetValue": "90",
+    "EndpointScalingMinCapacity": "1",
+    "EndpointScalingMaxCapacity": "3",
+    "EndpointScaleInCooldown": "300",
+    "EndpointScaleOutCooldown": "300",
+}
+
+def get_variants(model_config):
+    """Get the production variants declared for a stack.
+
+    A stack either declares a "variants" list, where each variant can override the
+    instance_type, model_data_url and scaling settings of the stack and sets its
+    name and initial_weight, or is served by a single AllTraffic variant.
+
+    Args:
+        model_config: The model config from model_configs.json.
+
+    Returns:
+        A list of variant dictionaries with all settings resolved.
+    """
+    defaults = {
+        "name": "AllTraffic",
+        "instance_type": model_config["instance_type"],
+        "model_data_url": model_config["model_data_url"],
+        "initial_weight": "1.0",
+        **{key: model_config.get(key, default) for key, default in VARIANT_SCALING_DEFAULTS.items()},
+    }
+    if not model_config.get("variants"):
+        return [defaults]
+
+    variants = [{**defaults, **variant} for variant in model_config["variants"]]
+    if len(variants) > MAX_VARIANTS:
+        raise Exception(f"At most {MAX_VARIANTS} production variants are supported, got {len(variants)}")
+    names = [variant.get("name") for variant in variants]
+    if len(set(names)) != len(names) or not all(names):
+        raise Exception(f"Production variant names must be unique and non-empty, got {names}")
+    if any(float(variant["initial_weight"]) < 0 for variant in variants):
+        raise Exception("Production variant weights must not be negative")
+    if sum(float(variant["initial_weight"]) for variant in variants) <= 0:
+        raise Exception("At least one production variant must have a positive weight")
+    return variants
+
+def get_variant_params(variants, variant_image_uris, stage_config):
+    """Get the template parameters of the secondary production variant, if any."""
+    if len(variants) < 2:
+        return {}
+    secondary = variants[1]
+    return {
+        "SecondaryVariantName": secondary["name"],
+        "SecondaryModelDataUrl": secondary["model_data_url"],
+        "SecondarySageMakerImageUri": variant_image_uris[secondary["name"]],
+        "SecondaryInstanceType": secondary["instance_type"],
+        "SecondaryInstanceCount": secondary.get(
+            "initial_instance_count", stage_config["Parameters"].get("EndpointInstanceCount", "1")
+        ),
+        "SecondaryInitialVariantWeight": secondary["initial_weight"],
+        "SecondaryScalingTargetValue": secondary["EndpointScalingTargetValue"],
+        "SecondaryScalingMinCapacity": secondary["EndpointScalingMinCapacity"],
+        "SecondaryScalingMaxCapacity": secondary["EndpointScalingMaxCapacity"],
+        "SecondaryScaleInCooldown": secondary["EndpointScaleInCooldown"],
+        "SecondaryScaleOutCooldown": secondary["EndpointScaleOutCooldown"],
+    }
+
+# Settings of the asynchronous endpoint, with the defaults used when model_configs.json omits them
+ASYNC_INFERENCE_DEFAULTS = {
+    "AsyncScalingMaxCapacity": "2",
+    "AsyncBacklogTargetValue": "5",
+    "AsyncMaxConcurrentInvocations": "4",
+}
+
+def get_async_inference_params(model_config):
+    """Get the template parameters of the asynchronous endpoint, enabled by an "async_inference" entry."""
+    async_config = model_config.get("async_inference")
+    if not async_config:
+        return {}
+    return {
+        "EnableAsyncInference": "true",
+        **{key: str(async_config.get(key, default)) for key, default in ASYNC_INFERENCE_DEFAULTS.items()},
+    }
+
+# Settings of the combined email-profile API, with the defaults used when model_configs.json omits them
+PROFILE_API_DEFAULTS = {
+    "ProfileMode": "cascade",
+    "ProfileSkipNamesProbability": "0.97",
+}
+
+def get_profile_api_params(model_config):
+    """Get the template parameters of the email-profile API, enabled by a "profile_api" entry."""
+    profile_config = model_config.get("profile_api")
+    if not profile_config:
+        return {}
+    if profile_config.get("ProfileMode", "cascade") not in ("cascade", "concurrent"):
+        raise Exception("profile_api ProfileMode must be cascade or concurrent")
+    return {
+        "EnableProfileApi": "true",
+        **{key: str(profile_config.get(key, default)) for key, default in PROFILE_API_DEFAULTS.items()},
+    }
+
+# TGI serving settings of the email-names container, with the defaults used when the "serving"
+# entry of model_configs.json omits them. An empty TgiMaxBatchTotalTokens lets TGI size the batch
+# from the free GPU memory, and an empty TgiQuantize serves the model unquantized.
+TGI_SERVING_DEFAULTS = {
+    "TgiMaxConcurrentRequests": "128",
+    "TgiMaxInputLength": "1024",
+    "TgiMaxTotalTokens": "1280",
+    "TgiMaxBatchPrefillTokens": "4096",
+    "TgiMaxBatchTotalTokens": "",
+    "TgiNumShard": "1",
+    "TgiQuantize": "",
+}
+
+# Quantization modes TGI applies on the fly to the fp16 weights of model_data_url. gptq and awq
+# would need a checkpoint quantized ahead of time, which the model package does not hold.
+TGI_QUANTIZE_MODES = ("", "bitsandbytes", "bitsandbytes-nf4", "bitsandbytes-fp4", "eetq", "fp8")
+TGI_PRE_QUANTIZED_MODES = ("gptq", "awq")
+
+# Largest max_new_tokens the email-names Lambda sends, see lambda/name_input_budget.py
+TGI_MIN_NEW_TOKENS = 100
+
+# GPUs of the instance types the model can be sharded over
+INSTANCE_TYPE_GPUS = {
+    "ml.g5.xlarge": 1,
+    "ml.g5.2xlarge": 1,
+    "ml.g5.4xlarge": 1,
+    "ml.g5.8xlarge": 1,
+    "ml.g5.16xlarge": 1,
+    "ml.g5.12xlarge": 4,
+    "ml.g5.24xlarge": 4,
+    "ml.g5.48xlarge": 8,
+    "ml.g6.12xlarge": 4,
+    "ml.g6.48xlarge": 8,
+    "ml.p4d.24xlarge": 8,
+}
+
+def get_serving_params(model_config, variants=None):
+    """Get the template parameters of the TGI serving settings, enabled by a "serving" entry.
+
+    The settings are checked against each other as TGI checks them at startup, so that a bad
+    combination fails the build instead of the endpoint deployment.
+
+    Args:
+        model_config: The model config from model_configs.json.
+        variants: The production variants, whose instance types must have TgiNumShard GPUs.
+
+    Returns:
+        A dictionary of template parameters, empty without a "serving" entry.
+    """
+    serving_config = model_config.get("serving")
+    if not serving_config:
+        return {}
+    unknown = sorted(set(serving_config) - set(TGI_SERVING_DEFAULTS))
+    if unknown:
+        raise Exception(f"Unknown serving settings {unknown}, expected some of {sorted(TGI_SERVING_DEFAULTS)}")
+    serving = {key: str(serving_config.get(key, default)) for key, default in TGI_SERVING_DEFAULTS.items()}
+
+    values = {}
+    for key, value in serving.items():
+        if key == "TgiQuantize" or (key == "TgiMaxBatchTotalTokens" and value == ""):
+            continue
+        if not value.isdigit() or int(value) < 1:
+            raise Exception(f"serving {key} must be a positive integer, got {value!r}")
+        values[key] = int(value)
+
+    if values["TgiMaxTotalTokens"] - values["TgiMaxInputLength"] < TGI_MIN_NEW_TOKENS:
+        raise Exception(f"serving TgiMaxTotalTokens must exceed TgiMaxInputLength by at least {TGI_MIN_NEW_TOKENS}, "
+                        "the largest max_new_tokens of the email-names requests")
+    if values["TgiMaxBatchPrefillTokens"] < values["TgiMaxInputLength"]:
+        raise Exception("serving TgiMaxBatchPrefillTokens must be at least TgiMaxInputLength")
+    if "TgiMaxBatchTotalTokens" in values and values["TgiMaxBatchTotalTokens"] < values["TgiMaxTotalTokens"]:
+        raise Exception("serving TgiMaxBatchTotalTokens must be at least TgiMaxTotalTokens")
+    if serving["TgiQuantize"] in TGI_PRE_QUANTIZED_MODES:
+        raise Exception(f"serving TgiQuantize {serving['TgiQuantize']!r} needs a pre-quantized checkpoint, "
+                        f"use one of {list(TGI_QUANTIZE_MODES)} with the fp16 model")
+    if serving["TgiQuantize"] not in TGI_QUANTIZE_MODES:
+        raise Exception(
+            f"serving TgiQuantize must be one of {list(TGI_QUANTIZE_MODES)}, got {serving['TgiQuantize']!r}"
+        )
+    for variant in variants or []:
+        gpus = INSTANCE_TYPE_GPUS.get(variant["instance_type"])
+        if gpus is not None and values["TgiNumShard"] > gpus:
+            raise Exception(f"serving TgiNumShard {values['TgiNumShard']} exceeds the {gpus} GPUs "
+                            f"of {variant['instance_type']} of variant {variant['name']}")
+    return {"EnableTgiServing": "true", **serving}
+
 def extend_config(
     args,
     sagemaker_image_uri,
@@ -71,10 +410,20 @@ def extend_config(
     project_id,
     project_arn,
     model_execution_role,
+    stack_name=None,
+    variant_image_uris=None,
 ):
     """
     Extend the stage configuration with additional parameters and tags based.
+
+    variant_image_uris maps variant names to their image URI, by default every
+    variant uses sagemaker_image_uri.
     """
+    stack_name = stack_name or args.stack_name
+    variants = get_variants(model_config)
+    primary = variants[0]
+    if variant_image_uris is None:
+        variant_image_uris = {variant["name"]: sagemaker_image_uri for variant in variants}
     # Verify that config has parameters and tags sections
     if (
         not "Parameters" in stage_config
@@ -87,16 +436,22 @@ def extend_config(
     new_params = {
         "DeploymentVersion": model_config["DeploymentVersion"],
         "SageMakerProjectName": args.sagemaker_project_name,
-        "SageMakerImageUri": sagemaker_image_uri,
-        "ModelDataUrl": model_config["model_data_url"],
-        "EndpointInstanceType": model_config["instance_type"],
-        "EndpointScalingTargetValue": model_config.get("EndpointScalingTargetValue", "90"),
-        "EndpointScalingMinCapacity": model_config.get("EndpointScalingMinCapacity", "1"),
-        "EndpointScalingMaxCapacity": model_config.get("EndpointScalingMaxCapacity", "3"),
-        "EndpointScaleInCooldown": model_config.get("EndpointScaleInCooldown", "300"),
-        "EndpointScaleOutCooldown": model_config.get("EndpointScaleOutCooldown", "300"),
+        "SageMakerImageUri": variant_image_uris[primary["name"]],
+        "ModelDataUrl": primary["model_data_url"],
+        "EndpointInstanceType": primary["instance_type"],
+        "EndpointVariantName": primary["name"],
+        "EndpointInitialVariantWeight": primary["initial_weight"],
+        "EndpointScalingTargetValue": primary["EndpointScalingTargetValue"],
+        "EndpointScalingMinCapacity": primary["EndpointScalingMinCapacity"],
+        "EndpointScalingMaxCapacity": primary["EndpointScalingMaxCapacity"],
+        "EndpointScaleInCooldown": primary["EndpointScaleInCooldown"],
+        "EndpointScaleOutCooldown": primary["EndpointScaleOutCooldown"],
         "ModelExecutionRoleArn": model_execution_role,
-        "StackName": args.stack_name,
+        "StackName": stack_name,
+        **get_variant_params(variants, variant_image_uris, stage_config),
+        **get_async_inference_params(model_config),
+        **get_profile_api_params(model_config),
+        **get_serving_params(model_config, variants),
     }
     new_tags = {
         "sagemaker:deployment-stage": stage_config["Parameters"]["StageName"],
@@ -111,10 +466,20 @@ def extend_config(
         "Tags": {**stage_config.get("Tags", {}), **new_tags},
     }
 
+@lru_cache(maxsize=None)
+def get_project_info(sm_client, project_name):
+    """Describe the SageMaker project, memoized so it is fetched once per process."""
+    return sm_client.describe_project(ProjectName=project_name)
+
+@lru_cache(maxsize=None)
+def get_project_tags(sm_client, project_arn):
+    """List the SageMaker project tags, memoized so they are fetched once per process."""
+    response = sm_client.list_tags(ResourceArn=project_arn)
+    return tuple(response["Tags"])
+
 def get_pipeline_custom_tags(args, sm_client, new_tags, project_arn):
     try:
-        response = sm_client.list_tags(ResourceArn=project_arn)
-        project_tags = response["Tags"]
+        project_tags = get_project_tags(sm_client, project_arn)
         for project_tag in project_tags:
             new_tags[project_tag["Key"]] = project_tag["Value"]
     except Exception:
@@ -141,7 +506,9 @@ def create_cfn_params_tags_file(config, export_params_file, export_tags_file):
         json.dump(tags, f, indent=4)
 
 def create_sagemaker_image_uri(model_config, region):
-    
+    # Imported lazily, loading the SDK and the JumpStart metadata is only needed on a cache miss
+    import sagemaker
+
     return sagemaker.image_uris.retrieve(
         region=region,
         framework=model_config.get("framework", None),
@@ -151,14 +518,176 @@ def create_sagemaker_image_uri(model_config, region):
         instance_type=model_config["instance_type"]
     )
 
+def get_image_uri_cache_key(model_config, region):
+    return "|".join([
+        model_config["model_id"],
+        model_config["model_version"],
+        region,
+        model_config["instance_type"],
+        model_config.get("framework") or "",
+    ])
+
+def load_image_uri_cache(cache_path):
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except ValueError:
+        logger.warning(f"Ignoring invalid image URI cache {cache_path}")
+        return {}
+
+def save_image_uri_cache(cache_path, cache):
+    if not cache_path:
+        return
+    with open(cache_path, "w") as f:
+        json.dump(cache, f, indent=4, sort_keys=True)
+
+def resolve_sagemaker_image_uris(model_config, regions, cache_path):
+    """Resolve the image URI of a model in several regions, using the on-disk cache.
+
+    Cache misses are resolved concurrently, and the SageMaker SDK is only imported
+    if there is at least one miss.
+
+    Args:
+        model_config: The model config from model_configs.json.
+        regions: The regions to resolve the image URI for.
+        cache_path: Path of the JSON cache file, or None to disable the cache.
+
+    Returns:
+        A dictionary of image URIs keyed by region.
+    """
+    keys = {region: get_image_uri_cache_key(model_config, region) for region in regions}
+    with _image_uri_cache_lock:
+        cache = load_image_uri_cache(cache_path)
+    resolved = {region: cache[key] for region, key in keys.items() if key in cache}
+    misses = sorted(set(regions) - set(resolved))
+
+    if misses:
+        logger.info(f"Resolving image URIs for regions: {misses}")
+        with ThreadPoolExecutor(max_workers=len(misses)) as executor:
+            image_uris = executor.map(lambda region: create_sagemaker_image_uri(model_config, region), misses)
+            resolved.update(zip(misses, image_uris))
+        with _image_uri_cache_lock:
+            # Reload so entries written concurrently by other stacks are kept
+            cache = load_image_uri_cache(cache_path)
+            cache.update({keys[region]: resolved[region] for region in misses})
+            save_image_uri_cache(cache_path, cache)
+    else:
+        logger.info("All image URIs resolved from cache")
+
+    return resolved
+
+def load_model_configs():
+    """Load all model configs from model_configs.json file
+    """
+    with open("model_configs.json", "r") as f:
+        return json.load(f)
+
 def load_model_config(stack_name):
     """Load model config from model_configs.json file
     """
-    with open("model_configs.json", "r") as f:
-        config = json.load(f)
+    config = load_model_configs()
     model_config = config.get(stack_name.replace('-', '_'))
     return model_config
 
+def get_stages(args):
+    """Get the pipeline stages with their import and export files, region and role."""
+    return [
+        {
+            "name": "staging",
+            "import_config": args.import_staging_config,
+            "export_config": args.export_staging_config,
+            "export_params": args.export_staging_params,
+            "export_tags": args.export_staging_tags,
+            "region": args.region_deploy_us,
+            "role_arn": args.beta_role_arn,
+        },
+        {
+            "name": "prod-us",
+            "import_config": args.import_prod_us_config,
+            "export_config": args.export_prod_us_config,
+            "export_params": args.export_prod_us_params,
+            "export_tags": args.export_prod_us_tags,
+            "region": args.region_deploy_us,
+            "role_arn": args.prod_role_arn,
+        },
+        {
+            "name": "prod-eu",
+            "import_config": args.import_prod_eu_config,
+            "export_config": args.export_prod_eu_config,
+            "export_params": args.export_prod_eu_params,
+            "export_tags": args.export_prod_eu_tags,
+            "region": args.region_deploy_eu,
+            "role_arn": args.prod_role_arn,
+        },
+    ]
+
+def get_stack_export_path(path, stack_name):
+    """Prefix an export file name with the stack name, e.g. email-type-staging-config-export.json"""
+    directory, file_name = os.path.split(path)
+    return os.path.join(directory, f"{stack_name}-{file_name}")
+
+def write_stage_config(config, stage, stack_name, export_cfn_params_tags, prefix_with_stack):
+    export_config = stage["export_config"]
+    export_params = stage["export_params"]
+    export_tags = stage["export_tags"]
+    if prefix_with_stack:
+        export_config = get_stack_export_path(export_config, stack_name)
+        export_params = get_stack_export_path(export_params, stack_name)
+        export_tags = get_stack_export_path(export_tags, stack_name)
+
+    with open(export_config, "w") as f:
+        json.dump(config, f, indent=4)
+    if export_cfn_params_tags:
+        create_cfn_params_tags_file(config, export_params, export_tags)
+    return export_config
+
+def build_stack_configs(args, stack_name, stages, sm_client, project_id, project_arn):
+    """Build the configs of all stages for one stack.
+
+    Returns:
+        A list of (stage, config) tuples.
+    """
+    model_config = load_model_config(stack_name)
+    if model_config is None:
+        raise Exception(f"No model config found for stack {stack_name}")
+    print(f"Model Data URL: {model_config['model_data_url']}")
+
+    # The image URI depends on the instance type, so it is resolved for each variant
+    regions = sorted({stage["region"] for stage in stages})
+    variant_image_uris = {region: {} for region in regions}
+    for variant in get_variants(model_config):
+        image_uris = resolve_sagemaker_image_uris(
+            {**model_config, "instance_type": variant["instance_type"]}, regions, args.image_uri_cache
+        )
+        for region, image_uri in image_uris.items():
+            variant_image_uris[region][variant["name"]] = image_uri
+            logger.info(
+                f"**********Model Image URI - {stack_name} - {variant['name']} - {region}*************: {image_uri}"
+            )
+
+    stage_configs = []
+    for stage in stages:
+        with open(stage["import_config"], "r") as f:
+            config = extend_config(
+                args=args,
+                sagemaker_image_uri=None,
+                variant_image_uris=variant_image_uris[stage["region"]],
+                model_config=model_config,
+                stage_config=json.load(f),
+                sm_client=sm_client,
+                project_id=project_id,
+                project_arn=project_arn,
+                model_execution_role=stage["role_arn"],
+                stack_name=stack_name,
+            )
+        logger.debug(
+            "{} {} config: {}".format(stack_name, stage["name"], json.dumps(config, indent=4))
+        )
+        stage_configs.append((stage, config))
+    return stage_configs
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -172,7 +701,12 @@ if __name__ == "__main__":
     parser.add_argument("--region-deploy-eu", type=str, required=True)
     parser.add_argument("--beta-role-arn", type=str, required=True)
     parser.add_argument("--prod-role-arn", type=str, required=True)
-    parser.add_argument("--stack-name", type=str, required=True)
+    parser.add_argument("--stack-name", type=str, required=False)
+    parser.add_argument(
+        "--all-stacks",
+        action="store_true",
+        help="Generate the configs of every stack in model_configs.json, export files are prefixed with the stack name",
+    )
     parser.add_argument(
         "--model-package-group-name",
         type=str,
@@ -220,7 +754,15 @@ if __name__ == "__main__":
         "--export-prod-eu-tags", type=str, default="prod-eu-tags-export.json"
     )
     parser.add_argument("--export-cfn-params-tags", type=bool, default=False)
+    parser.add_argument(
+        "--image-uri-cache",
+        type=str,
+        default=".image-uri-cache.json",
+        help="JSON file caching resolved image URIs, set to an empty string to disable",
+    )
     args, _ = parser.parse_known_args()
+    if not args.stack_name and not args.all_stacks:
+        parser.error("either --stack-name or --all-stacks is required")
 
     # Configure logging to output the line number and message
     log_format = "%(levelname)s: [%(filename)s:%(lineno)s] %(message)s"
@@ -230,9 +772,7 @@ if __name__ == "__main__":
     sm_client = boto3.client("sagemaker", region_name=args.dev_region)
 
     # Get SageMaker project info
-    project_info = sm_client.describe_project(
-        ProjectName=args.sagemaker_project_name
-    )
+    project_info = get_project_info(sm_client, args.sagemaker_project_name)
     project_id = project_info["ProjectId"]
     project_arn = project_info["ProjectArn"]
 
@@ -244,75 +784,34 @@ if __name__ == "__main__":
             f"{args.sagemaker_project_name}-{project_id}"
         )
 
-    model_config = load_model_config(args.stack_name)
-    print(f"Model Data URL: {model_config['model_data_url']}")
-    
-    model_image_uri_us = create_sagemaker_image_uri(model_config, args.region_deploy_us)
-    model_image_uri_eu = create_sagemaker_image_uri(model_config, args.region_deploy_eu)
-    
-    logger.info(f"**********Model Image URI - US*************: {model_image_uri_us}")
-    logger.info(f"**********Model Image URI - EU*************: {model_image_uri_eu}")
-
-    # Write the staging config
-    with open(args.import_staging_config, "r") as f:
-        staging_config = extend_config(
-            args=args,
-            sagemaker_image_uri=model_image_uri_us,
-            model_config=model_config,
-            stage_config=json.load(f),
-            sm_client=sm_client,
-            project_id=project_id,
-            project_arn=project_arn,
-            model_execution_role=args.beta_role_arn,
-        )
-    logger.debug(
-        "Staging config: {}".format(json.dumps(staging_config, indent=4))
-    )
-    with open(args.export_staging_config, "w") as f:
-        json.dump(staging_config, f, indent=4)
-    if args.export_cfn_params_tags:
-        create_cfn_params_tags_file(
-            staging_config,
-            args.export_staging_params,
-            args.export_staging_tags,
-        )
+    if args.all_stacks:
+        stack_names = [key.replace("_", "-") for key in load_model_configs()]
+    else:
+        stack_names = [args.stack_name]
+    stages = get_stages(args)
 
-    # Write the prod US config for code pipeline
-    with open(args.import_prod_us_config, "r") as f:
-        prod_us_config = extend_config(
-            args=args,
-            sagemaker_image_uri=model_image_uri_us,
-            model_config=model_config,
-            stage_config=json.load(f),
-            sm_client=sm_client,
-            project_id=project_id,
-            project_arn=project_arn,
-            model_execution_role=args.prod_role_arn,
-        )
-    logger.debug("Prod US config: {}".format(json.dumps(prod_us_config, indent=4)))
-    with open(args.export_prod_us_config, "w") as f:
-        json.dump(prod_us_config, f, indent=4)
-    if args.export_cfn_params_tags:
-        create_cfn_params_tags_file(
-            prod_us_config, args.export_prod_us_params, args.export_prod_us_tags
+    # Build the configs of all stacks concurrently, then write every export file concurrently
+    with ThreadPoolExecutor(max_workers=len(stack_names)) as executor:
+        stack_configs = executor.map(
+            lambda stack_name: build_stack_configs(
+                args, stack_name, stages, sm_client, project_id, project_arn
+            ),
+            stack_names,
         )
-    
-    # Write the prod EU config for code pipeline
-    with open(args.import_prod_eu_config, "r") as f:
-        prod_eu_config = extend_config(
-            args=args,
-            sagemaker_image_uri=model_image_uri_eu,
-            model_config=model_config,
-            stage_config=json.load(f),
-            sm_client=sm_client,
-            project_id=project_id,
-            project_arn=project_arn,
-            model_execution_role=args.prod_role_arn,
-        )
-    logger.debug("Prod EU config: {}".format(json.dumps(prod_eu_config, indent=4)))
-    with open(args.export_prod_eu_config, "w") as f:
-        json.dump(prod_eu_config, f, indent=4)
-    if args.export_cfn_params_tags:
-        create_cfn_params_tags_file(
-            prod_eu_config, args.export_prod_eu_params, args.export_prod_eu_tags
-        )
\ No newline at end of file
+        stack_configs = dict(zip(stack_names, stack_configs))
+
+    with ThreadPoolExecutor(max_workers=len(stack_names) * len(stages)) as executor:
+        futures = [
+            executor.submit(
+                write_stage_config,
+                config,
+                stage,
+                stack_name,
+                args.export_cfn_params_tags,
+                args.all_stacks,
+            )
+            for stack_name, stage_configs in stack_configs.items()
+            for stage, config in stage_configs
+        ]
+        for future in futures:
+            logger.info(f"Wrote {future.result()}")
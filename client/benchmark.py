@@ -0,0 +1,176 @@
+"""
+Throughput benchmark of the email API client against the local API Gateway with an emulated endpoint.
+
+It compares hand-rolled sequential requests.post calls, as the API consumers do today, with the
+sync and asyncio batch interfaces of EmailApiClient, and reports the records per second of each:
+
+    python client/benchmark.py --records 500 --duplicate-ratio 0.2 --endpoint-latency-ms 200
+
+With --regions it instead starts a second local stack standing in for the other region and compares
+the per-record latency percentiles of one pinned region with RegionalRouter hedging across both.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api_load_tests"))
+
+from client.email_api import AsyncEmailApiClient, EmailApiClient, EmailApiError  # noqa: E402
+from client.routing import RegionalRouter  # noqa: E402
+from local_api_gateway import create_server  # noqa: E402
+
+FIRST_NAMES = ["John", "Emma", "David", "Maria", "Wei", "Aisha", "Lucas", "Sofia"]
+LAST_NAMES = ["Doe", "Smith", "Brown", "Garcia", "Chen", "Khan", "Silva", "Rossi"]
+
+
+def generate_records(count, duplicate_ratio, seed=0):
+    """
+    Generate email-names records, a share of which repeat earlier records.
+    """
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        if records and rng.random() < duplicate_ratio:
+            records.append(rng.choice(records))
+            continue
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        records.append({
+            "email_address": f"{first.lower()}.{last.lower()}{i}@example.com",
+            "email_display_name": f"{first} {last}",
+        })
+    return records
+
+
+def run_naive(url, records):
+    for record in records:
+        requests.post(url, json=record, headers={"Content-Type": "application/json"}).raise_for_status()
+
+
+def run_sync(url, records, max_connections):
+    with EmailApiClient(email_names_url=url, max_connections=max_connections) as client:
+        results = client.extract_names_batch(records)
+        stats = dict(client.stats)
+    failures = sum(1 for result in results if isinstance(result, EmailApiError))
+    return stats, failures
+
+
+def run_async(url, records, max_connections):
+    async def run():
+        async with AsyncEmailApiClient(email_names_url=url, max_connections=max_connections) as client:
+            results = await client.extract_names_batch(records)
+            return dict(client.client.stats), results
+    stats, results = asyncio.run(run())
+    failures = sum(1 for result in results if isinstance(result, EmailApiError))
+    return stats, failures
+
+
+def run_timed(call, records, concurrency):
+    """
+    Call one record at a time on concurrency threads, returning the sorted latencies in ms and the failures.
+    """
+    def timed(record):
+        start = time.perf_counter()
+        try:
+            call(record)
+        except EmailApiError:
+            return None
+        return (time.perf_counter() - start) * 1000
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, records))
+    return sorted(latency for latency in latencies if latency is not None), latencies.count(None)
+
+
+def format_percentiles(latencies):
+    if not latencies:
+        return "no successful requests"
+    return ", ".join(f"p{p} {latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]:7.1f} ms"
+                     for p in (50, 95, 99))
+
+
+def run_regions(args, records):
+    """
+    Compare a client pinned to one region with the hedging router across two regions.
+    """
+    servers = []
+    urls = {}
+    for i, region in enumerate(("prod-us", "prod-eu")):
+        server, _ = create_server(port=args.port + i, pool_size=args.pool_size, emulate_endpoint=True,
+                                  endpoint_latency_ms=args.endpoint_latency_ms,
+                                  endpoint_latency_cv=args.endpoint_latency_cv,
+                                  endpoint_concurrency=args.endpoint_concurrency)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        urls[region] = f"http://127.0.0.1:{args.port + i}/email-names"
+
+    with EmailApiClient(email_names_url=urls["prod-us"], max_connections=args.max_connections) as client:
+        latencies, failures = run_timed(client.extract_names, records, args.max_connections)
+    print(f"{'pinned to prod-us':<25} {format_percentiles(latencies)}, {failures} failures")
+
+    clients = {region: EmailApiClient(email_names_url=url, max_connections=args.max_connections, max_retries=1)
+               for region, url in urls.items()}
+    with RegionalRouter(clients, hedge_budget=args.hedge_budget) as router:
+        latencies, failures = run_timed(router.extract_names, records, args.max_connections)
+        stats = dict(router.stats)
+    extra = stats.get("hedges", 0) / max(1, stats.get("requests", 0))
+    print(f"{'hedged across regions':<25} {format_percentiles(latencies)}, {failures} failures, "
+          f"{extra:.1%} extra requests, stats {stats}")
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=500, help="Number of records sent by each client")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2,
+                        help="Share of records repeating an earlier record")
+    parser.add_argument("--max-connections", type=int, default=32, help="Connection pool size of the client")
+    parser.add_argument("--pool-size", type=int, default=64, help="Number of simulated Lambda containers")
+    parser.add_argument("--endpoint-latency-ms", type=float, default=200,
+                        help="Mean service time of the emulated endpoint")
+    parser.add_argument("--endpoint-latency-cv", type=float, default=0.3,
+                        help="Coefficient of variation of the endpoint service time")
+    parser.add_argument("--endpoint-concurrency", type=int, default=64,
+                        help="Number of requests the emulated endpoint serves at once")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--skip-naive", action="store_true", help="Skip the sequential requests.post baseline")
+    parser.add_argument("--regions", action="store_true",
+                        help="Compare one pinned region with hedging across two regions")
+    parser.add_argument("--hedge-budget", type=float, default=0.05, help="Maximum share of extra hedged requests")
+    args = parser.parse_args()
+
+    if args.regions:
+        run_regions(args, generate_records(args.records, args.duplicate_ratio))
+        sys.exit(0)
+
+    server, _ = create_server(port=args.port, pool_size=args.pool_size, emulate_endpoint=True,
+                              endpoint_latency_ms=args.endpoint_latency_ms,
+                              endpoint_latency_cv=args.endpoint_latency_cv,
+                              endpoint_concurrency=args.endpoint_concurrency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{args.port}/email-names"
+    records = generate_records(args.records, args.duplicate_ratio)
+
+    runs = [
+        ("sync client", lambda: run_sync(url, records, args.max_connections)),
+        ("asyncio client", lambda: run_async(url, records, args.max_connections)),
+    ]
+    if not args.skip_naive:
+        runs.insert(0, ("sequential requests.post", lambda: (run_naive(url, records), 0)))
+
+    print(f"{len(records)} records, {len(set(r['email_address'] for r in records))} unique")
+    for name, run in runs:
+        start = time.perf_counter()
+        stats, failures = run()
+        seconds = time.perf_counter() - start
+        print(f"{name:<25} {len(records) / seconds:8.1f} records/s in {seconds:6.2f} s, "
+              f"{failures} failures, stats {stats or {}}")
+    server.shutdown()
@@ -0,0 +1,395 @@
+"""
+Python client for the email-type and email-names APIs.
+
+The client keeps a pooled HTTP session, sends the records of a batch concurrently, retries throttled
+and failed requests with exponential backoff, and sends identical records that are in flight at the
+same time only once. Large email-names batches can go through the asynchronous job API instead.
+
+    from client.email_api import EmailApiClient
+
+    with EmailApiClient.for_stage("staging", email_type_host="https://...", email_names_host="https://...") as client:
+        names = client.extract_names_batch(records)
+
+AsyncEmailApiClient offers the same calls as coroutines.
+"""
+
+import asyncio
+import datetime
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+STAGES = ("staging", "prod-us", "prod-eu")
+
+# Payload fields of each API, as in api_load_tests/api_configs.json
+EMAIL_TYPE_FIELDS = ("email_address", "email_name", "email_display_name")
+EMAIL_NAMES_FIELDS = ("email_address", "email_display_name")
+EMAIL_PROFILE_FIELDS = EMAIL_TYPE_FIELDS
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Maximum number of records in one asynchronous email-names job, as accepted by the Lambda
+MAX_JOB_RECORDS = 500
+
+
+class EmailApiError(Exception):
+    """
+    Raised when a request fails for good, after retries.
+    """
+    def __init__(self, message, status_code=None, body=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+def get_backoff_delay(attempt, backoff_s, max_backoff_s):
+    """
+    Exponential backoff with full jitter, so retrying clients spread out instead of retrying together.
+    """
+    return random.uniform(0, min(max_backoff_s, backoff_s * 2 ** attempt))
+
+
+def get_retry_after_s(retry_after):
+    """
+    Get the delay of a Retry-After header, given in seconds or as an HTTP date.
+
+    Returns:
+    - float: The delay in seconds, or None if the header does not parse.
+    """
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def get_record_key(url, body):
+    return url, json.dumps(body, sort_keys=True)
+
+
+class EmailApiClient():
+    """
+    Thread-safe client for the email-type and email-names APIs.
+
+    Args:
+    - email_type_url (str): URL of the email-type API, including the stage path.
+    - email_names_url (str): URL of the email-names API, including the stage path.
+    - email_profile_url (str): URL of the combined email-profile API, by default /profile under email_names_url.
+    - api_key (str): API key sent in the x-api-key header, by default the API_KEY environment variable.
+    - max_connections (int): Size of the connection pool and number of concurrent requests of a batch.
+    - max_retries (int): Number of retries of a throttled or failed request.
+    - backoff_s (float): Initial retry delay, doubled on each retry.
+    - max_backoff_s (float): Maximum retry delay.
+    - timeout_s (float): Timeout of one request.
+    """
+    def __init__(self, email_type_url=None, email_names_url=None, api_key=None, max_connections=32, max_retries=4,
+                 backoff_s=0.2, max_backoff_s=5.0, timeout_s=35.0, email_profile_url=None):
+        self.email_type_url = email_type_url
+        self.email_names_url = email_names_url
+        if email_profile_url is None and email_names_url:
+            email_profile_url = f"{email_names_url.rstrip('/')}/profile"
+        self.email_profile_url = email_profile_url
+        self.api_key = api_key if api_key is not None else os.getenv("API_KEY")
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.timeout_s = timeout_s
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_connections)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        if self.api_key:
+            self.session.headers.update({"x-api-key": self.api_key})
+
+        self._executor = ThreadPoolExecutor(max_workers=max_connections)
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "deduplicated": 0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def for_stage(cls, stage, email_type_host=None, email_names_host=None, **kwargs):
+        """
+        Create a client for the APIs of a deployment stage, e.g. for_stage("prod-us", email_type_host="https://...").
+        """
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage '{stage}', expected one of {', '.join(STAGES)}")
+        return cls(
+            email_type_url=f"{email_type_host.rstrip('/')}/{stage}" if email_type_host else None,
+            email_names_url=f"{email_names_host.rstrip('/')}/{stage}" if email_names_host else None,
+            **kwargs,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _post(self, url, body, max_retries=None):
+        """
+        Post a request, retrying throttled and failed requests.
+
+        Args:
+        - url (str): The API URL.
+        - body (dict): The request body.
+        - max_retries (int): Optional, overrides the retries of the client, e.g. 0 for requests that are not idempotent.
+
+        Returns:
+        - dict: The decoded response body.
+        """
+        if url is None:
+            raise ValueError("The URL of this API is not configured")
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            self._count("requests")
+            try:
+                response = self.session.post(url, json=body, timeout=self.timeout_s)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == max_retries:
+                    raise EmailApiError(f"Request to {url} failed: {e}") from e
+            else:
+                if response.status_code < 400:
+                    try:
+                        return response.json()
+                    except ValueError as e:
+                        raise EmailApiError(f"Request to {url} returned a body that is not JSON",
+                                            status_code=response.status_code, body=response.text) from e
+                if response.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+                    raise EmailApiError(f"Request to {url} failed with status {response.status_code}",
+                                        status_code=response.status_code, body=response.text)
+                retry_after_s = get_retry_after_s(response.headers.get("Retry-After") or "")
+                if retry_after_s is not None:
+                    self._count("retries")
+                    time.sleep(min(retry_after_s, self.max_backoff_s))
+                    continue
+            self._count("retries")
+            time.sleep(get_backoff_delay(attempt, self.backoff_s, self.max_backoff_s))
+
+    def _post_deduplicated(self, url, body):
+        """
+        Post a request, or wait for the identical request already in flight.
+        """
+        key = get_record_key(url, body)
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+        if not owner:
+            self._count("deduplicated")
+            return future.result()
+
+        try:
+            future.set_result(self._post(url, body))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+        return future.result()
+
+    def _post_or_error(self, url, body):
+        # A failed record is returned as its EmailApiError instead of failing the whole batch
+        try:
+            return self._post_deduplicated(url, body)
+        except EmailApiError as e:
+            return e
+
+    def _unique_bodies(self, url, bodies):
+        unique = {}
+        for body in bodies:
+            unique.setdefault(get_record_key(url, body), body)
+        with self._stats_lock:
+            self.stats["deduplicated"] += len(bodies) - len(unique)
+        return unique
+
+    def _post_batch(self, url, bodies):
+        """
+        Post the unique bodies of a batch concurrently and fan the responses back out, in order.
+        """
+        unique = self._unique_bodies(url, bodies)
+        results = dict(zip(unique, self._executor.map(lambda body: self._post_or_error(url, body), unique.values())))
+        return [results[get_record_key(url, body)] for body in bodies]
+
+    def classify_email(self, record):
+        """
+        Classify one email address as Person or Non-Person.
+
+        Args:
+        - record (dict): email_address, email_name and email_display_name.
+
+        Returns:
+        - dict: The API response, with pred_email_type.
+        """
+        return self._post_deduplicated(self.email_type_url, {key: record[key] for key in EMAIL_TYPE_FIELDS})
+
+    def classify_emails(self, records):
+        return self._post_batch(self.email_type_url, [{key: record[key] for key in EMAIL_TYPE_FIELDS}
+                                                      for record in records])
+
+    def extract_names(self, record):
+        """
+        Extract the name components of one email address.
+
+        Args:
+        - record (dict): email_address and email_display_name.
+
+        Returns:
+        - dict: The API response, with extracted_names.
+        """
+        return self._post_deduplicated(self.email_names_url, {key: record[key] for key in EMAIL_NAMES_FIELDS})
+
+    def extract_names_batch(self, records):
+        return self._post_batch(self.email_names_url, [{key: record[key] for key in EMAIL_NAMES_FIELDS}
+                                                       for record in records])
+
+    def get_profile(self, record):
+        """
+        Classify one email address and extract its names in one call.
+
+        Args:
+        - record (dict): email_address, email_name and email_display_name.
+
+        Returns:
+        - dict: The API response, with email_type, names_status and email_names.
+        """
+        return self._post_deduplicated(self.email_profile_url, {key: record[key] for key in EMAIL_PROFILE_FIELDS})
+
+    def get_profiles(self, records):
+        return self._post_batch(self.email_profile_url, [{key: record[key] for key in EMAIL_PROFILE_FIELDS}
+                                                         for record in records])
+
+    def submit_names_jobs(self, records, max_job_records=MAX_JOB_RECORDS):
+        """
+        Submit records to the asynchronous email-names API, split into jobs of at most max_job_records.
+
+        Submissions are not retried: a request that timed out may still have created its job, and
+        sending it again would process its records twice.
+
+        Returns:
+        - list: The job ids, in record order.
+        """
+        chunks = [records[i:i + max_job_records] for i in range(0, len(records), max_job_records)]
+        bodies = [{"records": [{key: record[key] for key in EMAIL_NAMES_FIELDS} for record in chunk]}
+                  for chunk in chunks]
+        return [self._post(self.email_names_url, body, max_retries=0)["job_id"] for body in bodies]
+
+    def get_names_job(self, job_id):
+        return self._post(self.email_names_url, {"job_id": job_id})
+
+    def wait_for_names_jobs(self, job_ids, poll_interval_s=10.0, timeout_s=3600.0):
+        """
+        Wait for asynchronous jobs to finish.
+
+        Returns:
+        - list: The per-record results of all jobs, in record order.
+        """
+        deadline = time.time() + timeout_s
+        jobs = {}
+        while True:
+            pending = [job_id for job_id in job_ids if job_id not in jobs]
+            for job_id, job in zip(pending, self._executor.map(self.get_names_job, pending)):
+                if job["status"] != "InProgress":
+                    jobs[job_id] = job
+            if len(jobs) == len(job_ids):
+                return [result for job_id in job_ids for result in jobs[job_id]["results"]]
+            if time.time() > deadline:
+                raise EmailApiError(f"{len(job_ids) - len(jobs)} jobs did not finish within {timeout_s} seconds")
+            time.sleep(poll_interval_s)
+
+
+class AsyncEmailApiClient():
+    """
+    asyncio interface of EmailApiClient, the requests run on the pooled session of the wrapped client.
+
+    Takes the same arguments as EmailApiClient.
+    """
+    def __init__(self, *args, **kwargs):
+        self.client = EmailApiClient(*args, **kwargs)
+
+    @classmethod
+    def for_stage(cls, stage, email_type_host=None, email_names_host=None, **kwargs):
+        client = cls.__new__(cls)
+        client.client = EmailApiClient.for_stage(stage, email_type_host, email_names_host, **kwargs)
+        return client
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        self.client.close()
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.client._executor, function, *args)
+
+    async def classify_email(self, record):
+        return await self._run(self.client.classify_email, record)
+
+    async def extract_names(self, record):
+        return await self._run(self.client.extract_names, record)
+
+    async def _post_batch(self, url, bodies):
+        unique = self.client._unique_bodies(url, bodies)
+        responses = await asyncio.gather(*(self._run(self.client._post_or_error, url, body)
+                                           for body in unique.values()))
+        results = dict(zip(unique, responses))
+        return [results[get_record_key(url, body)] for body in bodies]
+
+    async def classify_emails(self, records):
+        return await self._post_batch(self.client.email_type_url,
+                                      [{key: record[key] for key in EMAIL_TYPE_FIELDS} for record in records])
+
+    async def extract_names_batch(self, records):
+        return await self._post_batch(self.client.email_names_url,
+                                      [{key: record[key] for key in EMAIL_NAMES_FIELDS} for record in records])
+
+    async def get_profile(self, record):
+        return await self._run(self.client.get_profile, record)
+
+    async def get_profiles(self, records):
+        return await self._post_batch(self.client.email_profile_url,
+                                      [{key: record[key] for key in EMAIL_PROFILE_FIELDS} for record in records])
+
+    async def submit_names_jobs(self, records, max_job_records=MAX_JOB_RECORDS):
+        return await self._run(self.client.submit_names_jobs, records, max_job_records)
+
+    async def get_names_job(self, job_id):
+        return await self._run(self.client.get_names_job, job_id)
+
+    async def wait_for_names_jobs(self, job_ids, poll_interval_s=10.0, timeout_s=3600.0):
+        deadline = time.time() + timeout_s
+        while True:
+            jobs = await asyncio.gather(*(self.get_names_job(job_id) for job_id in job_ids))
+            if all(job["status"] != "InProgress" for job in jobs):
+                return [result for job in jobs for result in job["results"]]
+            if time.time() > deadline:
+                raise EmailApiError(f"Jobs did not finish within {timeout_s} seconds")
+            await asyncio.sleep(poll_interval_s)
@@ -0,0 +1,362 @@
+"""
+Latency-aware routing of API calls across the regional deployments, with hedged requests and failover.
+
+Each call goes to the healthy region with the lowest EWMA latency. If it has not answered by that
+region's recent p95 latency, a hedged duplicate goes to the next region, the first success is used
+and the slower request is abandoned. Hedges are limited by a budget, e.g. at most 5% extra requests.
+A region whose error rate spikes is skipped by a circuit breaker until a probe request succeeds.
+
+    from client.email_api import EmailApiClient
+    from client.routing import RegionalRouter
+
+    router = RegionalRouter({
+        "prod-us": EmailApiClient.for_stage("prod-us", email_names_host=US_HOST, max_retries=1),
+        "prod-eu": EmailApiClient.for_stage("prod-eu", email_names_host=EU_HOST, max_retries=1),
+    })
+    names = router.extract_names(record)
+
+The regional clients should retry little, since the router fails over to the other region instead.
+"""
+
+import collections
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from client.email_api import EmailApiError
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half-open"
+
+
+def is_region_failure(error):
+    """
+    Check whether an error is the region's fault: a connection error, a throttle or a server error.
+
+    Other errors, e.g. a 400 for an invalid record, would fail in any region. An unexpected exception
+    that is not an EmailApiError counts as a failure of the region.
+    """
+    if not isinstance(error, EmailApiError):
+        return True
+    return error.status_code is None or error.status_code == 429 or error.status_code >= 500
+
+
+class RegionLatency():
+    """
+    EWMA and recent percentiles of the latency of one region.
+
+    Args:
+    - alpha (float): Weight of the newest sample in the EWMA.
+    - window (int): Number of recent samples the percentiles are computed from.
+    """
+    def __init__(self, alpha=0.2, window=200):
+        self.alpha = alpha
+        self.ewma_s = None
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency_s):
+        with self._lock:
+            self.ewma_s = latency_s if self.ewma_s is None else self.alpha * latency_s + (1 - self.alpha) * self.ewma_s
+            self._samples.append(latency_s)
+
+    def percentile(self, p):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, max(0, math.ceil(p / 100 * len(samples)) - 1))]
+
+
+class CircuitBreaker():
+    """
+    Opens when the error rate of the recent requests of a region exceeds a threshold.
+
+    While open, the region gets no requests. After the cooldown one probe request is let through
+    (half-open), and its success closes the circuit again while its failure reopens it.
+
+    Args:
+    - error_rate_threshold (float): Error rate above which the circuit opens.
+    - window (int): Number of recent requests the error rate is computed over.
+    - min_requests (int): Minimum number of requests in the window before the circuit can open.
+    - cooldown_s (float): Time the circuit stays open before a probe is allowed.
+    """
+    def __init__(self, error_rate_threshold=0.5, window=20, min_requests=10, cooldown_s=30.0):
+        self.error_rate_threshold = error_rate_threshold
+        self.min_requests = min_requests
+        self.cooldown_s = cooldown_s
+        self.state = CIRCUIT_CLOSED
+        self._outcomes = collections.deque(maxlen=window)
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        return self.acquire() is not None
+
+    def acquire(self):
+        """
+        Let a request through if the circuit allows it.
+
+        Returns:
+        - str: CIRCUIT_CLOSED for a regular request, CIRCUIT_HALF_OPEN for the probe, or None if not allowed.
+        """
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return CIRCUIT_CLOSED
+            if self.state == CIRCUIT_OPEN and time.time() - self._opened_at >= self.cooldown_s:
+                self.state = CIRCUIT_HALF_OPEN
+            if self.state == CIRCUIT_HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return CIRCUIT_HALF_OPEN
+            return None
+
+    def release_probe(self):
+        """
+        Release the probe of a request that was let through but never sent, so another can probe.
+        """
+        with self._lock:
+            if self.state == CIRCUIT_HALF_OPEN:
+                self._probe_in_flight = False
+
+    def record(self, success):
+        with self._lock:
+            if self.state == CIRCUIT_HALF_OPEN:
+                self._probe_in_flight = False
+                if success:
+                    self.state = CIRCUIT_CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (self.state == CIRCUIT_CLOSED and len(self._outcomes) >= self.min_requests
+                    and failures / len(self._outcomes) > self.error_rate_threshold):
+                self._open()
+
+    def _open(self):
+        self.state = CIRCUIT_OPEN
+        self._opened_at = time.time()
+
+
+class HedgeBudget():
+    """
+    Token bucket limiting hedged requests to a share of the primary requests.
+
+    Each primary request adds ratio tokens, up to max_tokens, and each hedge spends one token.
+    """
+    def __init__(self, ratio=0.05, max_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def on_request(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class RegionalRouter():
+    """
+    Routes calls to the regional API clients with hedging and failover.
+
+    Args:
+    - clients (dict): Region name to EmailApiClient, in order of preference when latencies are unknown.
+    - hedge_budget (float): Maximum share of extra requests sent as hedges.
+    - hedge_percentile (float): Latency percentile of the primary region after which a hedge is sent.
+    - min_hedge_delay_s (float): Lower bound of the hedge delay.
+    - default_hedge_delay_s (float): Hedge delay while a region has no latency samples yet.
+    - max_workers (int): Number of calls in flight at once, including hedges.
+    """
+    def __init__(self, clients, hedge_budget=0.05, hedge_percentile=95, min_hedge_delay_s=0.05,
+                 default_hedge_delay_s=1.0, max_workers=64, breaker_kwargs=None):
+        self.clients = clients
+        self.regions = list(clients)
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay_s = min_hedge_delay_s
+        self.default_hedge_delay_s = default_hedge_delay_s
+        self.latency = {region: RegionLatency() for region in self.regions}
+        self.breakers = {region: CircuitBreaker(**(breaker_kwargs or {})) for region in self.regions}
+        self.budget = HedgeBudget(ratio=hedge_budget)
+        # Separate pools, so batch calls waiting on their requests can never starve the requests
+        self._request_executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._batch_executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.stats = collections.Counter()
+        self._stats_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._batch_executor.shutdown(wait=True)
+        self._request_executor.shutdown(wait=True)
+        for client in self.clients.values():
+            client.close()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def get_region_order(self):
+        """
+        Get the regions to try, healthy ones first by EWMA latency, then by preference.
+        """
+        def key(region):
+            ewma_s = self.latency[region].ewma_s
+            return (ewma_s is None, ewma_s or 0.0, self.regions.index(region))
+        return sorted(self.regions, key=key)
+
+    def get_hedge_delay(self, region):
+        p = self.latency[region].percentile(self.hedge_percentile)
+        return max(self.min_hedge_delay_s, p if p is not None else self.default_hedge_delay_s)
+
+    def _attempt(self, region, method_name, record):
+        start = time.perf_counter()
+        try:
+            result = getattr(self.clients[region], method_name)(record)
+        except Exception as e:
+            # A client error is an answer of a healthy region. Any other error is recorded as well,
+            # so the probe of a half-open circuit is never left in flight.
+            self.breakers[region].record(not is_region_failure(e))
+            raise
+        self.latency[region].record(time.perf_counter() - start)
+        self.breakers[region].record(True)
+        return result
+
+    def _next_region(self, candidates):
+        """
+        Pop the next region whose circuit allows a request.
+
+        Returns:
+        - tuple: The region and whether its request is the probe of a half-open circuit, or None and False.
+        """
+        while candidates:
+            region = candidates.pop(0)
+            allowed = self.breakers[region].acquire()
+            if allowed is not None:
+                return region, allowed == CIRCUIT_HALF_OPEN
+            self._count("skipped_open_circuit")
+        return None, False
+
+    def _cancel(self, in_flight, probes):
+        """
+        Cancel the requests still in flight. A request cancelled before it was sent releases its probe.
+        """
+        for future, region in in_flight.items():
+            if future.cancel() and future in probes:
+                self.breakers[region].release_probe()
+
+    def call(self, method_name, record):
+        """
+        Call a client method, e.g. "extract_names", with hedging and failover.
+
+        Returns:
+        - dict: The response of the first region to succeed.
+        """
+        candidates = self.get_region_order()
+        region, probe = self._next_region(candidates)
+        if region is None:
+            # Every circuit is open, try the preferred region rather than failing outright
+            region = self.regions[0]
+            candidates = [r for r in self.regions if r != region]
+        self.budget.on_request()
+        self._count("requests")
+
+        in_flight = {}
+        # Futures of the requests that are the probe of a half-open circuit
+        probes = set()
+
+        def submit(region, probe):
+            future = self._request_executor.submit(self._attempt, region, method_name, record)
+            in_flight[future] = region
+            if probe:
+                probes.add(future)
+
+        submit(region, probe)
+        hedge_delay = self.get_hedge_delay(region)
+        last_error = None
+        while in_flight:
+            timeout = hedge_delay if hedge_delay is not None and len(in_flight) == 1 and candidates else None
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # The request is slower than usual, hedge it on the next region if the budget allows.
+                # Either way there is at most one hedge per call.
+                hedge_delay = None
+                if self.budget.try_spend():
+                    next_region, probe = self._next_region(candidates)
+                    if next_region is not None:
+                        self._count("hedges")
+                        submit(next_region, probe)
+                    else:
+                        self._count("hedges_skipped")
+                else:
+                    self._count("hedges_over_budget")
+                continue
+
+            for future in done:
+                finished_region = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if not is_region_failure(e):
+                        # The other regions would reject the record too
+                        self._cancel(in_flight, probes)
+                        raise
+                    last_error = e
+                    continue
+                if len(in_flight):
+                    # The other request is abandoned, it cannot be interrupted once sent
+                    self._cancel(in_flight, probes)
+                    self._count("hedge_wins" if finished_region != region else "primary_wins")
+                return result
+
+            # Failed without a success, fail over to the next region
+            if not in_flight:
+                next_region, probe = self._next_region(candidates)
+                if next_region is not None:
+                    self._count("failovers")
+                    submit(next_region, probe)
+        raise last_error
+
+    def _call_batch(self, method_name, records):
+        def call(record):
+            try:
+                return self.call(method_name, record)
+            except EmailApiError as e:
+                return e
+        return list(self._batch_executor.map(call, records))
+
+    def classify_email(self, record):
+        return self.call("classify_email", record)
+
+    def extract_names(self, record):
+        return self.call("extract_names", record)
+
+    def classify_emails(self, records):
+        return self._call_batch("classify_email", records)
+
+    def extract_names_batch(self, records):
+        return self._call_batch("extract_names", records)
+
+    def get_region_stats(self):
+        return {
+            region: {
+                "ewma_ms": self.latency[region].ewma_s * 1000 if self.latency[region].ewma_s is not None else None,
+                "p95_ms": (self.latency[region].percentile(95) or 0) * 1000,
+                "circuit": self.breakers[region].state,
+            }
+            for region in self.regions
+        }
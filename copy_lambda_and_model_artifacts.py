@@ -8,12 +8,25 @@ Below is the list of steps that are executed in the script:
 
 import boto3
 import argparse
+import datetime
+import hashlib
 import json
 import botocore
 import logging
+import sys
+import threading
+import time
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 logger = logging.getLogger(__name__)
 
+MB = 1024 * 1024
+
+# The manifest is stored next to (not inside) the artifacts prefix so it is never loaded as model data
+MANIFEST_SUFFIX = ".replication-manifest.json"
+
 def assume_role(role_arn, session_name, region):
     sts_client = boto3.client('sts', region_name=region)
     try:
@@ -26,103 +39,636 @@ def assume_role(role_arn, session_name, region):
         print(f"Error assuming role: {e}")
         return None
 
-def upload_file_to_s3(file_path, bucket, key, credentials, region):
-    s3_client = boto3.client(
+def create_s3_client(credentials, region, max_pool_connections=10):
+    """
+    Create an S3 client using the assumed role credentials.
+
+    Args:
+    - credentials (dict): The credentials returned by assume_role.
+    - region (str): The AWS region of the client.
+    - max_pool_connections (int): Size of the HTTP connection pool, should cover all copy threads.
+
+    Returns:
+    - botocore.client.S3: The S3 client.
+    """
+    return boto3.client(
         's3',
         region_name=region,
         aws_access_key_id=credentials['AccessKeyId'],
         aws_secret_access_key=credentials['SecretAccessKey'],
-        aws_session_token=credentials['SessionToken']
+        aws_session_token=credentials['SessionToken'],
+        config=Config(max_pool_connections=max_pool_connections)
     )
+
+def upload_file_to_s3(file_path, bucket, key, credentials, region):
+    s3_client = create_s3_client(credentials, region)
     try:
         s3_client.upload_file(file_path, bucket, key)
         print(f"Uploaded {file_path} to s3://{bucket}/{key}")
+        return True
     except botocore.exceptions.ClientError as e:
         print(f"Failed to upload {file_path} to s3://{bucket}/{key}: {e}")
+        return False
 
-def copy_s3_objects(src_bucket_name, src_prefix, dest_bucket_name, dest_prefix, credentials, dest_region):
-    # Create a new S3 client using the assumed role credentials
-    s3_client = boto3.client(
-        's3',
-        region_name=dest_region,
-        aws_access_key_id=credentials['AccessKeyId'],
-        aws_secret_access_key=credentials['SecretAccessKey'],
-        aws_session_token=credentials['SessionToken']
+def get_transfer_config(multipart_threshold_mb=64, multipart_chunksize_mb=64, max_concurrency=8):
+    """
+    Build the transfer configuration used for each individual object copy.
+
+    Objects above the multipart threshold are copied with UploadPartCopy, with up to
+    max_concurrency parts of multipart_chunksize_mb copied in parallel.
+
+    Args:
+    - multipart_threshold_mb (int): Size in MB above which multipart copy is used.
+    - multipart_chunksize_mb (int): Size in MB of each part.
+    - max_concurrency (int): Number of parts copied concurrently within one object.
+
+    Returns:
+    - boto3.s3.transfer.TransferConfig: The transfer configuration.
+    """
+    return TransferConfig(
+        multipart_threshold=multipart_threshold_mb * MB,
+        multipart_chunksize=multipart_chunksize_mb * MB,
+        max_concurrency=max_concurrency,
+        use_threads=True,
     )
 
-    # List all objects in the source bucket and prefix
+def list_s3_objects(s3_client, bucket, prefix):
+    """
+    List all objects in a bucket under the given prefix.
+
+    Args:
+    - s3_client (botocore.client.S3): The S3 client.
+    - bucket (str): The bucket name.
+    - prefix (str): The key prefix.
+
+    Returns:
+    - list: The object summaries (Key, Size, ETag, ...) returned by list_objects_v2.
+    """
+    objects = []
     paginator = s3_client.get_paginator('list_objects_v2')
-    for page in paginator.paginate(Bucket=src_bucket_name, Prefix=src_prefix):
-        for obj in page.get('Contents', []):
-            src_key = obj['Key']
-            dest_key = dest_prefix + src_key[len(src_prefix):]  # Maintain the suffix of the source key in the destination key
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        objects.extend(page.get('Contents', []))
+    return objects
+
+class CopyProgress():
+    """
+    Thread-safe progress and throughput tracker shared by all copy workers.
+    """
+    def __init__(self, total_objects, total_bytes, report_interval=10):
+        self.total_objects = total_objects
+        self.total_bytes = total_bytes
+        self.report_interval = report_interval
+        self.copied_objects = 0
+        self.copied_bytes = 0
+        self.failed = []
+        self.start_time = time.time()
+        self._last_report = self.start_time
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount):
+        # Used as the boto3 transfer callback, invoked from the transfer threads
+        with self._lock:
+            self.copied_bytes += bytes_amount
+            now = time.time()
+            if now - self._last_report < self.report_interval:
+                return
+            self._last_report = now
+        self.report()
+
+    def object_done(self, key, error=None):
+        with self._lock:
+            if error is None:
+                self.copied_objects += 1
+            else:
+                self.failed.append((key, error))
+
+    def throughput_mb_s(self):
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        return self.copied_bytes / MB / elapsed
+
+    def report(self):
+        print(
+            f"Progress: {self.copied_objects}/{self.total_objects} objects, "
+            f"{self.copied_bytes / MB:.1f}/{self.total_bytes / MB:.1f} MB, "
+            f"{self.throughput_mb_s():.1f} MB/s, {len(self.failed)} failed"
+        )
+
+def copy_s3_objects(src_bucket_name, src_prefix, dest_bucket_name, dest_prefix, credentials, dest_region,
+                    max_workers=8, transfer_config=None, objects=None):
+    """
+    Copy all objects under the source prefix to the destination prefix.
+
+    Objects are copied concurrently by a bounded pool of max_workers threads, and each large
+    object is itself copied in parallel parts according to transfer_config.
+
+    Args:
+    - src_bucket_name (str): The source bucket.
+    - src_prefix (str): The source key prefix.
+    - dest_bucket_name (str): The destination bucket.
+    - dest_prefix (str): The destination key prefix.
+    - credentials (dict): The credentials returned by assume_role.
+    - dest_region (str): The destination region.
+    - max_workers (int): Number of objects copied concurrently.
+    - transfer_config (TransferConfig): Per-object multipart configuration.
+    - objects (list): Optional object summaries to copy, by default everything under src_prefix is listed and copied.
+
+    Returns:
+    - CopyProgress: The final progress, including the list of failed keys.
+    """
+    if transfer_config is None:
+        transfer_config = get_transfer_config()
+
+    # Create a new S3 client using the assumed role credentials, with a pool large enough for all threads
+    s3_client = create_s3_client(
+        credentials, dest_region, max_pool_connections=max_workers * transfer_config.max_concurrency
+    )
+
+    # List all objects in the source bucket and prefix
+    if objects is None:
+        objects = list_s3_objects(s3_client, src_bucket_name, src_prefix)
+    progress = CopyProgress(len(objects), sum(obj['Size'] for obj in objects))
+    print(f"Copying {progress.total_objects} objects ({progress.total_bytes / MB:.1f} MB) with {max_workers} workers")
+
+    def copy_object(src_key):
+        # Maintain the suffix of the source key in the destination key
+        dest_key = dest_prefix + src_key[len(src_prefix):]
+        s3_client.copy(
+            {'Bucket': src_bucket_name, 'Key': src_key},
+            dest_bucket_name,
+            dest_key,
+            Callback=progress,
+            Config=transfer_config,
+        )
+        return dest_key
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(copy_object, obj['Key']): obj['Key'] for obj in objects}
+        for future in as_completed(futures):
+            src_key = futures[future]
             try:
-                # Copy each object individually
-                s3_client.copy(
-                    {'Bucket': src_bucket_name, 'Key': src_key},
-                    dest_bucket_name,
-                    dest_key
-                )
+                dest_key = future.result()
+                progress.object_done(src_key)
                 print(f"Copied {src_key} to {dest_key}")
-            except botocore.exceptions.ClientError as e:
-                print(f"Error copying {src_key} to {dest_key}: {e}")
+            except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError,
+                    boto3.exceptions.S3TransferFailedError) as e:
+                # e.g. a connection reset or read timeout on one object, the others are still copied
+                progress.object_done(src_key, error=e)
+                print(f"Error copying {src_key}: {e}")
+
+    progress.report()
+    print(f"Copy finished in {time.time() - progress.start_time:.2f} seconds")
+    return progress
+
+def get_manifest_key(dest_prefix):
+    return dest_prefix.rstrip('/') + MANIFEST_SUFFIX
+
+def read_manifest(s3_client, bucket, key):
+    """
+    Read the replication manifest written by the previous run.
+
+    Returns:
+    - dict: The manifest, or None if there is no usable manifest.
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        return json.loads(response['Body'].read())
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            print(f"Error reading manifest s3://{bucket}/{key}: {e}")
+        return None
+    except ValueError as e:
+        print(f"Ignoring invalid manifest s3://{bucket}/{key}: {e}")
+        return None
+
+def write_manifest(s3_client, bucket, key, manifest):
+    s3_client.put_object(Bucket=bucket, Key=key, Body=json.dumps(manifest, indent=4), ContentType='application/json')
+    print(f"Wrote manifest to s3://{bucket}/{key}")
+
+def get_object_checksum(s3_client, bucket, obj):
+    """
+    Get the additional S3 checksum of an object, only fetched when the listing reports one.
+    """
+    if not obj.get('ChecksumAlgorithm'):
+        return None
+    response = s3_client.head_object(Bucket=bucket, Key=obj['Key'], ChecksumMode='ENABLED')
+    for algorithm in ('SHA256', 'SHA1', 'CRC32C', 'CRC32'):
+        if f'Checksum{algorithm}' in response:
+            return f"{algorithm}:{response[f'Checksum{algorithm}']}"
+    return None
+
+def diff_objects(src_objects, src_prefix, dest_objects, dest_prefix, manifest):
+    """
+    Compare the source listing against the previous manifest and the destination listing.
+
+    A server-side multipart copy does not preserve the source ETag, so source objects are
+    compared against the source ETag recorded in the manifest, and the destination listing
+    is only used to check the copy is still present with the same size.
+
+    Returns:
+    - tuple: (source objects to copy, destination keys no longer present in the source)
+    """
+    manifest_objects = (manifest or {}).get('objects', {})
+    dest_sizes = {obj['Key']: obj['Size'] for obj in dest_objects}
+
+    to_copy = []
+    src_suffixes = set()
+    for obj in src_objects:
+        suffix = obj['Key'][len(src_prefix):]
+        src_suffixes.add(suffix)
+        entry = manifest_objects.get(suffix)
+        unchanged = (
+            entry is not None
+            and entry['Size'] == obj['Size']
+            and entry['ETag'] == obj['ETag']
+            and dest_sizes.get(dest_prefix + suffix) == obj['Size']
+        )
+        if not unchanged:
+            to_copy.append(obj)
+
+    manifest_key = get_manifest_key(dest_prefix)
+    stale = [
+        key for key in dest_sizes
+        if key != manifest_key and key[len(dest_prefix):] not in src_suffixes
+    ]
+    return to_copy, stale
+
+def delete_s3_objects(s3_client, bucket, keys):
+    # delete_objects accepts at most 1000 keys per request
+    for i in range(0, len(keys), 1000):
+        batch = keys[i:i + 1000]
+        s3_client.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+        for key in batch:
+            print(f"Deleted stale object s3://{bucket}/{key}")
+
+def sync_s3_objects(src_bucket_name, src_prefix, dest_bucket_name, dest_prefix, credentials, dest_region,
+                    max_workers=8, transfer_config=None, delete_stale=False, src_objects=None):
+    """
+    Copy only new or changed objects, based on the manifest written next to the destination artifacts.
+
+    Args:
+    - delete_stale (bool): Delete destination objects that are no longer in the source.
+    - src_objects (list): Optional source listing, by default the source prefix is listed.
+    - Other arguments are the same as copy_s3_objects.
+
+    Returns:
+    - tuple: (CopyProgress, manifest) where manifest is the previous manifest, or None if there was none.
+    """
+    s3_client = create_s3_client(credentials, dest_region)
+    manifest_key = get_manifest_key(dest_prefix)
+    manifest = read_manifest(s3_client, dest_bucket_name, manifest_key)
+
+    if src_objects is None:
+        src_objects = list_s3_objects(s3_client, src_bucket_name, src_prefix)
+    dest_objects = list_s3_objects(s3_client, dest_bucket_name, dest_prefix)
+    to_copy, stale = diff_objects(src_objects, src_prefix, dest_objects, dest_prefix, manifest)
+    print(f"{len(to_copy)} of {len(src_objects)} objects are new or changed, {len(stale)} stale objects in destination")
+
+    progress = copy_s3_objects(src_bucket_name, src_prefix, dest_bucket_name, dest_prefix, credentials, dest_region,
+                               max_workers=max_workers, transfer_config=transfer_config, objects=to_copy)
+    if progress.failed:
+        # Keep the previous manifest so the failed objects are retried on the next run
+        return progress, manifest
+
+    if delete_stale and stale:
+        delete_s3_objects(s3_client, dest_bucket_name, stale)
+    elif manifest is not None and not to_copy:
+        # Nothing changed, the previous manifest is still accurate
+        return progress, manifest
+
+    previous_objects = (manifest or {}).get('objects', {})
+    copied_keys = {obj['Key'] for obj in to_copy}
+    objects = {}
+    for obj in src_objects:
+        suffix = obj['Key'][len(src_prefix):]
+        if obj['Key'] in copied_keys:
+            checksum = get_object_checksum(s3_client, src_bucket_name, obj)
+        else:
+            checksum = previous_objects.get(suffix, {}).get('Checksum')
+        objects[suffix] = {'Size': obj['Size'], 'ETag': obj['ETag'], 'Checksum': checksum}
+
+    new_manifest = {
+        'source': f"s3://{src_bucket_name}/{src_prefix}",
+        'updated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'objects': objects,
+        'lambda': (manifest or {}).get('lambda'),
+    }
+    write_manifest(s3_client, dest_bucket_name, manifest_key, new_manifest)
+    return progress, new_manifest
+
+def get_file_sha256(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(MB), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def upload_lambda_if_changed(file_path, bucket, key, credentials, region, manifest_key):
+    """
+    Upload the Lambda zip unless the manifest records the same content at the same key.
+
+    Returns:
+    - bool: True if the zip is up to date in the destination, else False.
+    """
+    s3_client = create_s3_client(credentials, region)
+    sha256 = get_file_sha256(file_path)
+    manifest = read_manifest(s3_client, bucket, manifest_key) or {}
+    previous = manifest.get('lambda') or {}
+    if previous.get('Key') == key and previous.get('Sha256') == sha256:
+        try:
+            s3_client.head_object(Bucket=bucket, Key=key)
+            print(f"Lambda zip s3://{bucket}/{key} is unchanged, skipping upload")
+            return True
+        except botocore.exceptions.ClientError:
+            pass
+
+    if not upload_file_to_s3(file_path, bucket, key, credentials, region):
+        return False
+    if manifest:
+        manifest['lambda'] = {'Key': key, 'Sha256': sha256}
+        write_manifest(s3_client, bucket, manifest_key, manifest)
+    return True
+
+# Config parameters holding model artifacts that are replicated with the primary ModelDataUrl
+EXTRA_MODEL_DATA_URL_PARAMS = ['SecondaryModelDataUrl']
 
 def get_model_data_url_from_config(config_file_path):
     with open(config_file_path, 'r') as f:
         config = json.load(f)
     return config['Parameters']['ModelDataUrl']
 
-def update_config_file(config_file_path, dest_bucket_name, dest_prefix, lambda_s3_key, stack_name):
+def get_extra_model_data_urls_from_config(config_file_path):
+    """
+    Get the model data URLs of the additional production variants set in the config file.
+
+    Returns:
+    - dict: Parameter name to model data URL.
+    """
+    with open(config_file_path, 'r') as f:
+        config = json.load(f)
+    return {
+        param: config['Parameters'][param]
+        for param in EXTRA_MODEL_DATA_URL_PARAMS
+        if config['Parameters'].get(param)
+    }
+
+def update_config_file(config_file_path, dest_bucket_name, dest_prefix, lambda_s3_key, stack_name,
+                       extra_prefixes=None):
+    """
+    Point the config file at the replicated artifacts.
+
+    Args:
+    - extra_prefixes (dict): Optional parameter name to destination prefix, for additional model artifacts.
+    """
     with open(config_file_path, 'r') as f:
         config = json.load(f)
     config['Parameters']['ModelDataUrl'] = f"s3://{dest_bucket_name}/{dest_prefix}"
+    for param, prefix in (extra_prefixes or {}).items():
+        config['Parameters'][param] = f"s3://{dest_bucket_name}/{prefix}"
     config['Parameters']['ApiFunctionSourceCodeBucket'] = dest_bucket_name
     config['Parameters']['ApiFunctionSourceCodeKey'] = lambda_s3_key
-    
+
     # Dynamically update the handler based on the use case
     handler_name = "inference_lambda_email_type.lambda_handler" if stack_name == "email-type" else "inference_lambda_email_names.lambda_handler"
     config['Parameters']['ApiFunctionHandler'] = handler_name
-    
+
     with open(config_file_path, 'w') as f:
         json.dump(config, f, indent=4)
 
+class CredentialsCache():
+    """
+    Assume each role at most once per run, shared by all targets using that role.
+    """
+    def __init__(self, session_name="s3-replicate"):
+        self.session_name = session_name
+        self._credentials = {}
+        self._lock = threading.Lock()
+
+    def get(self, role_arn, region):
+        with self._lock:
+            if role_arn not in self._credentials:
+                self._credentials[role_arn] = assume_role(role_arn, self.session_name, region)
+            return self._credentials[role_arn]
+
+def parse_s3_url(url):
+    return url.split('/')[2], '/'.join(url.split('/')[3:])
+
+def parse_targets(args):
+    """
+    Build the replication targets, either from the repeated --target option or the single-target options.
+
+    Returns:
+    - list: Dictionaries with region, bucket, role_arn and param_file.
+    """
+    if not args.target:
+        return [{
+            'region': args.region_deploy,
+            'bucket': args.dest_bucket,
+            'role_arn': args.role_arn,
+            'param_file': args.param_file,
+        }]
+
+    targets = []
+    for target in args.target:
+        # The role ARN contains colons, so the fields are comma separated
+        parts = target.split(',')
+        if len(parts) != 4:
+            raise ValueError(f"Invalid target '{target}', expected REGION,BUCKET,ROLE_ARN,PARAM_FILE")
+        region, bucket, role_arn, param_file = parts
+        targets.append({'region': region, 'bucket': bucket, 'role_arn': role_arn, 'param_file': param_file})
+    return targets
+
+def replicate_model_data(src_url, src_objects, dest_bucket, credentials, region, transfer_config, args):
+    """
+    Replicate the model artifacts under one source URL to the same prefix in the destination bucket.
+
+    Returns:
+    - CopyProgress: The progress of the copy.
+    """
+    src_bucket_name, src_prefix = parse_s3_url(src_url)
+    print(f"[{region}] Replicating s3://{src_bucket_name}/{src_prefix} to s3://{dest_bucket}/{src_prefix}")
+    if args.incremental:
+        progress, _ = sync_s3_objects(src_bucket_name, src_prefix, dest_bucket, src_prefix, credentials, region,
+                                      max_workers=args.max_workers, transfer_config=transfer_config,
+                                      delete_stale=args.delete_stale, src_objects=src_objects)
+        return progress
+    return copy_s3_objects(src_bucket_name, src_prefix, dest_bucket, src_prefix, credentials, region,
+                           max_workers=args.max_workers, transfer_config=transfer_config,
+                           objects=src_objects)
+
+def replicate_to_target(target, src_listings, credentials, transfer_config, args):
+    """
+    Replicate the Lambda zip and model artifacts to one target and update its config file.
+
+    The artifacts of additional production variants are replicated the same way as the primary ones.
+
+    Args:
+    - src_listings (dict): Source objects by model data URL.
+
+    Returns:
+    - dict: The per-target summary.
+    """
+    start_time = time.time()
+    region, dest_bucket = target['region'], target['bucket']
+    _, src_prefix = parse_s3_url(target['model_data_url'])
+
+    progresses = []
+    extra_prefixes = {}
+    for param, src_url in target['extra_model_data_urls'].items():
+        extra_prefixes[param] = parse_s3_url(src_url)[1]
+        if src_url == target['model_data_url']:
+            continue
+        progresses.append(replicate_model_data(src_url, src_listings[src_url], dest_bucket, credentials, region,
+                                               transfer_config, args))
+    progresses.append(replicate_model_data(target['model_data_url'], src_listings[target['model_data_url']],
+                                           dest_bucket, credentials, region, transfer_config, args))
+
+    if args.incremental:
+        # Upload Lambda zip to S3, after the sync so its entry is recorded in the fresh manifest
+        uploaded = upload_lambda_if_changed(args.lambda_zip_path, dest_bucket, args.lambda_s3_key, credentials,
+                                            region, get_manifest_key(src_prefix))
+    else:
+        # Upload Lambda zip to S3
+        uploaded = upload_file_to_s3(args.lambda_zip_path, dest_bucket, args.lambda_s3_key, credentials, region)
+
+    failed_objects = sum(len(progress.failed) for progress in progresses)
+    succeeded = uploaded and not failed_objects
+    if succeeded:
+        # update the config file with the destination bucket name
+        update_config_file(target['param_file'], dest_bucket, src_prefix, args.lambda_s3_key, args.stack_name,
+                           extra_prefixes=extra_prefixes)
+
+    return {
+        'region': region,
+        'bucket': dest_bucket,
+        'succeeded': succeeded,
+        'lambda_uploaded': uploaded,
+        'copied_objects': sum(progress.copied_objects for progress in progresses),
+        'copied_mb': sum(progress.copied_bytes for progress in progresses) / MB,
+        'failed_objects': failed_objects,
+        'seconds': time.time() - start_time,
+    }
+
+def print_summary(summaries):
+    print("Replication summary:")
+    for summary in summaries:
+        status = "OK" if summary['succeeded'] else "FAILED"
+        print(
+            f"  {summary['region']:<15} s3://{summary['bucket']:<40} {status:<7} "
+            f"{summary['copied_objects']} objects, {summary['copied_mb']:.1f} MB copied, "
+            f"{summary['failed_objects']} failed, lambda uploaded={summary['lambda_uploaded']}, "
+            f"{summary['seconds']:.2f} seconds"
+        )
+        if summary.get('error'):
+            print(f"  {'':<15} error: {summary['error']}")
+
 def main(args):
-    # Read the Model Data URL from the parameters file
-    model_data_url = get_model_data_url_from_config(args.param_file)
-    src_bucket_name = model_data_url.split('/')[2]
-    src_prefix = '/'.join(model_data_url.split('/')[3:])
-    # logger.info(f"Model Data URL: {model_data_url}")
-    # logger.info(f"Source Bucket: {src_bucket_name}")
-    # logger.info(f"Source Prefix: {src_prefix}")
-    print(f"Model Data URL: {model_data_url}")
-    print(f"Source Bucket: {src_bucket_name}")
-    print(f"Source Prefix: {src_prefix}")
-
-    # Assume the role in the destination account
-    credentials = assume_role(args.role_arn, "s3-replicate", args.region_deploy)
-
-    print(f"Dest Bucket: {args.dest_bucket}")
-    print(f"Dest regions: {args.region_deploy}")
-    
-    # Upload Lambda zip to S3
-    upload_file_to_s3(args.lambda_zip_path, args.dest_bucket, args.lambda_s3_key, credentials, args.region_deploy)
-    
-    # Copy the model artifacts to the destination bucket
-    copy_s3_objects(src_bucket_name, src_prefix, args.dest_bucket, src_prefix, credentials, args.region_deploy)
-    
-    # update the config file with the destination bucket name
-    update_config_file(args.param_file, args.dest_bucket, src_prefix, args.lambda_s3_key, args.stack_name)
+    targets = parse_targets(args)
+    credentials_cache = CredentialsCache()
+
+    # Read the Model Data URL from each target's parameters file
+    for target in targets:
+        target['model_data_url'] = get_model_data_url_from_config(target['param_file'])
+        target['extra_model_data_urls'] = get_extra_model_data_urls_from_config(target['param_file'])
+        # Assume the role in the destination account
+        if credentials_cache.get(target['role_arn'], target['region']) is None:
+            sys.exit(1)
+        print(f"Dest Bucket: {target['bucket']}")
+        print(f"Dest region: {target['region']}")
+
+    # List each distinct source prefix once, with the credentials of the first target that uses it
+    src_listings = {}
+    for target in targets:
+        for model_data_url in [target['model_data_url'], *target['extra_model_data_urls'].values()]:
+            if model_data_url in src_listings:
+                continue
+            src_bucket_name, src_prefix = parse_s3_url(model_data_url)
+            print(f"Model Data URL: {model_data_url}")
+            print(f"Source Bucket: {src_bucket_name}")
+            print(f"Source Prefix: {src_prefix}")
+            s3_client = create_s3_client(credentials_cache.get(target['role_arn'], target['region']), target['region'])
+            src_listings[model_data_url] = list_s3_objects(s3_client, src_bucket_name, src_prefix)
+
+    transfer_config = get_transfer_config(
+        multipart_threshold_mb=args.multipart_threshold_mb,
+        multipart_chunksize_mb=args.multipart_chunksize_mb,
+        max_concurrency=args.max_concurrency,
+    )
+
+    # Replicate to all targets concurrently, so the wall time is that of the slowest target
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        futures = []
+        for target in targets:
+            futures.append(executor.submit(
+                replicate_to_target,
+                target,
+                src_listings,
+                credentials_cache.get(target['role_arn'], target['region']),
+                transfer_config,
+                args,
+            ))
+        summaries = []
+        for target, future in zip(targets, futures):
+            try:
+                summaries.append(future.result())
+            except Exception as e:
+                # A failed target must not hide the summary of the others
+                print(f"Error replicating to {target['region']}: {e}")
+                summaries.append({
+                    'region': target['region'],
+                    'bucket': target['bucket'],
+                    'succeeded': False,
+                    'lambda_uploaded': False,
+                    'copied_objects': 0,
+                    'copied_mb': 0.0,
+                    'failed_objects': 0,
+                    'seconds': time.time() - start_time,
+                    'error': f"{type(e).__name__}: {e}",
+                })
+
+    print_summary(summaries)
+    if not all(summary['succeeded'] for summary in summaries):
+        print("Replication failed for at least one target")
+        sys.exit(1)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--region", required=True, help="Source AWS Region of the S3 bucket")
-    parser.add_argument("--region-deploy", required=True, help="Destination AWS Region for deployment")
-    parser.add_argument("--role-arn", required=True, help="ARN of the role to assume for deployment in the destination account")
-    parser.add_argument("--param-file", required=True, help="Path to the staging-config-export.json file")
-    parser.add_argument("--dest-bucket", required=True, help="Destination S3 bucket name")
+    parser.add_argument("--region-deploy", help="Destination AWS Region for deployment")
+    parser.add_argument("--role-arn", help="ARN of the role to assume for deployment in the destination account")
+    parser.add_argument("--param-file", help="Path to the staging-config-export.json file")
+    parser.add_argument("--dest-bucket", help="Destination S3 bucket name")
+    parser.add_argument(
+        "--target",
+        action="append",
+        help="Replication target as REGION,BUCKET,ROLE_ARN,PARAM_FILE, can be repeated to replicate to several "
+             "regions concurrently",
+    )
     parser.add_argument("--lambda-zip-path", required=True, help="Path to the Lambda zip file")
     parser.add_argument("--lambda-s3-key", required=True, help="S3 key for the Lambda zip file")
     parser.add_argument("--stack-name", required=True, help="Name of the stack")
-    
+    parser.add_argument("--max-workers", type=int, default=8, help="Number of objects copied concurrently")
+    parser.add_argument(
+        "--max-concurrency", type=int, default=8, help="Number of parts copied concurrently within one object"
+    )
+    parser.add_argument(
+        "--multipart-threshold-mb", type=int, default=64, help="Object size in MB above which multipart copy is used"
+    )
+    parser.add_argument("--multipart-chunksize-mb", type=int, default=64, help="Part size in MB for multipart copy")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only copy objects that changed since the last run, based on the replication manifest",
+    )
+    parser.add_argument(
+        "--delete-stale",
+        action="store_true",
+        help="With --incremental, delete destination objects that are no longer in the source",
+    )
+
     args = parser.parse_args()
+    if not args.target and not all([args.region_deploy, args.role_arn, args.param_file, args.dest_bucket]):
+        parser.error(
+            "either --target or all of --region-deploy, --role-arn, --param-file and --dest-bucket are required"
+        )
     main(args)
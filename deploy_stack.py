@@ -1,12 +1,32 @@
 import argparse
+import hashlib
 import json
 import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 from botocore.exceptions import ClientError
 
+from deployment_timeline import STACK_TERMINAL_STATUSES, CloudFormationEventSource, DeploymentTimeline
+
 logger = logging.getLogger(__name__)
 
+TEMPLATE_FILE = "endpoint-config-template.yml"
+CAPABILITIES = ['CAPABILITY_IAM', 'CAPABILITY_NAMED_IAM']
+
+# Stack tag holding the hash of the template, parameters and tags of the last deployment
+CONFIG_HASH_TAG = "deployment:config-hash"
+
+STACK_SUCCESS_STATUSES = {"CREATE_COMPLETE", "UPDATE_COMPLETE", "IMPORT_COMPLETE"}
+
+# Longest wait for a stack operation, endpoint updates usually take 10 to 20 minutes
+MAX_STACK_WAIT_S = 3600
+
+# Status reasons of a change set that failed only because nothing changed
+NO_CHANGES_REASONS = ("didn't contain changes", "No updates are to be performed")
+
 
 def read_parameters(param_file):
     logging.info(f"Reading param_file from {param_file}")
@@ -44,6 +64,207 @@ def assume_role(role_arn, session_name):
         logger.error(f"Error assuming role: {e}")
         return None
 
+def create_cfn_client(credentials, region):
+    return boto3.client("cloudformation", region_name=region,
+                    aws_access_key_id=credentials["AccessKeyId"],
+                    aws_secret_access_key=credentials["SecretAccessKey"],
+                    aws_session_token=credentials["SessionToken"])
+
+def get_config_hash(template_body, parameters, tags):
+    """
+    Hash the template, parameters and tags of a deployment, independently of their order.
+    """
+    config = {
+        "template": template_body,
+        "parameters": sorted((p["ParameterKey"], str(p["ParameterValue"])) for p in parameters),
+        "tags": sorted((t["Key"], t["Value"]) for t in tags if t["Key"] != CONFIG_HASH_TAG),
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+def describe_stack(cfn_client, stack_name):
+    """
+    Describe a stack, returns None if it does not exist.
+    """
+    try:
+        return cfn_client.describe_stacks(StackName=stack_name)["Stacks"][0]
+    except ClientError as e:
+        if "does not exist" in e.response["Error"]["Message"]:
+            return None
+        raise
+
+def get_backoff_delays(initial_delay=2, max_delay=30, factor=2):
+    """
+    Yield exponentially growing polling delays, capped at max_delay.
+    """
+    delay = initial_delay
+    while True:
+        yield delay
+        delay = min(delay * factor, max_delay)
+
+def create_change_set(cfn_client, stack_name, template_body, parameters, tags, change_set_type):
+    """
+    Create a change set and wait until it is ready to execute.
+
+    Returns:
+    - str: The change set name, or None if the change set contains no changes.
+    """
+    change_set_name = f"deploy-{int(time.time())}"
+    cfn_client.create_change_set(
+        StackName=stack_name,
+        ChangeSetName=change_set_name,
+        ChangeSetType=change_set_type,
+        TemplateBody=template_body,
+        Parameters=parameters,
+        Capabilities=CAPABILITIES,
+        Tags=tags,
+    )
+
+    for delay in get_backoff_delays(initial_delay=1, max_delay=10):
+        change_set = cfn_client.describe_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+        if change_set["Status"] == "CREATE_COMPLETE":
+            return change_set_name
+        if change_set["Status"] == "FAILED":
+            reason = change_set.get("StatusReason", "")
+            if any(no_changes in reason for no_changes in NO_CHANGES_REASONS):
+                cfn_client.delete_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+                return None
+            raise Exception(f"Change set {change_set_name} for {stack_name} failed: {reason}")
+        time.sleep(delay)
+
+def add_new_events(event_source, timeline, region):
+    """
+    Add the new events of the source to the timeline, logging them.
+
+    Returns:
+    - list: The new events.
+    """
+    new_events = event_source.get_new_events()
+    for event in new_events:
+        logger.info(
+            f"[{region}] {event['LogicalResourceId']} {event['ResourceStatus']} "
+            f"{event.get('ResourceStatusReason', '')}".rstrip()
+        )
+    timeline.add_events(new_events)
+    return new_events
+
+def wait_for_stack(event_source, timeline, region, cfn_client=None, stack_name=None, max_wait_s=MAX_STACK_WAIT_S):
+    """
+    Wait for a stack operation to finish, logging new stack events as they arrive.
+
+    Polling backs off exponentially while nothing happens and resets when new events arrive. The
+    events are filtered by the local clock, so with a cfn_client the stack status is also checked
+    with describe_stacks, and the wait ends even if the final stack event is never seen.
+
+    Args:
+    - event_source: Object with a get_new_events() method, e.g. CloudFormationEventSource.
+    - timeline (DeploymentTimeline): The timeline the events are added to.
+    - region (str): The region, used in log messages.
+    - cfn_client: Optional CloudFormation client to check the stack status with.
+    - stack_name (str): The stack name, required with cfn_client.
+    - max_wait_s (float): Time after which the wait fails.
+
+    Returns:
+    - str: The final stack status.
+    """
+    deadline = time.time() + max_wait_s
+    delays = get_backoff_delays()
+    started = False
+    while True:
+        new_events = add_new_events(event_source, timeline, region)
+        if timeline.is_finished():
+            return timeline.stack_status
+
+        if cfn_client is not None:
+            stack = describe_stack(cfn_client, stack_name)
+            status = stack["StackStatus"] if stack is not None else "DELETE_COMPLETE"
+            # Right after execution the stack may still report the status of the previous operation
+            started = started or bool(timeline.events) or status.endswith("_IN_PROGRESS")
+            if started and status in STACK_TERMINAL_STATUSES:
+                add_new_events(event_source, timeline, region)
+                logger.info(f"[{region}] {stack_name} reached {status}")
+                return status
+
+        remaining_s = deadline - time.time()
+        if remaining_s <= 0:
+            raise Exception(f"Timed out after {max_wait_s} seconds waiting for {stack_name or 'the stack'} in {region}")
+        if new_events:
+            delays = get_backoff_delays()
+        time.sleep(min(next(delays), remaining_s))
+
+def deploy_target(target, stack_name, template_body, credentials, timeline_dir=None, event_source=None):
+    """
+    Deploy the stack to one target with a change set, skipping it if nothing changed.
+
+    Args:
+    - timeline_dir (str): Optional directory to write the deployment timeline to.
+    - event_source: Optional stack event source, by default the events are read with describe_stack_events.
+
+    Returns:
+    - dict: The per-target summary.
+    """
+    start_time = time.time()
+    region = target["region"]
+    cfn_client = create_cfn_client(credentials, region)
+
+    parameters, tags = read_parameters(target["param_file"])
+    config_hash = get_config_hash(template_body, parameters, tags)
+    tags.append({"Key": CONFIG_HASH_TAG, "Value": config_hash})
+
+    summary = {"region": region, "stack_name": stack_name, "param_file": target["param_file"]}
+
+    stack = describe_stack(cfn_client, stack_name)
+    if stack is not None and stack["StackStatus"] in STACK_SUCCESS_STATUSES:
+        deployed_hash = {t["Key"]: t["Value"] for t in stack.get("Tags", [])}.get(CONFIG_HASH_TAG)
+        if deployed_hash == config_hash:
+            logger.info(f"[{region}] {stack_name} is up to date, skipping deployment")
+            return {**summary, "result": "SKIPPED", "status": stack["StackStatus"], "seconds": time.time() - start_time}
+
+    # A stack left in REVIEW_IN_PROGRESS by a failed first deployment is still created with a CREATE change set
+    change_set_type = "CREATE" if stack is None or stack["StackStatus"] == "REVIEW_IN_PROGRESS" else "UPDATE"
+    change_set_name = create_change_set(cfn_client, stack_name, template_body, parameters, tags, change_set_type)
+    if change_set_name is None:
+        logger.info(f"[{region}] {stack_name} change set contains no changes")
+        return {**summary, "result": "NO_CHANGES", "status": stack["StackStatus"], "seconds": time.time() - start_time}
+
+    logger.info(f"[{region}] Executing {change_set_type} change set {change_set_name} for {stack_name}")
+    execute_time = time.time()
+    cfn_client.execute_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+    if event_source is None:
+        event_source = CloudFormationEventSource(cfn_client, stack_name, execute_time)
+    timeline = DeploymentTimeline(stack_name)
+    status = wait_for_stack(event_source, timeline, region, cfn_client=cfn_client, stack_name=stack_name)
+
+    logger.info(f"[{region}] Deployment timeline:\n{timeline.format_gantt()}")
+    if timeline_dir:
+        timeline.write(timeline_dir, prefix=f"{stack_name}-{region}")
+
+    result = "DEPLOYED" if status in STACK_SUCCESS_STATUSES else "FAILED"
+    return {**summary, "result": result, "status": status, "seconds": time.time() - start_time}
+
+def deploy_targets(targets, stack_name, template_body, credentials, timeline_dir=None):
+    """
+    Deploy the stack to all targets concurrently, so the deployment time is that of the slowest target.
+    """
+    def deploy(target):
+        try:
+            return deploy_target(target, stack_name, template_body, credentials, timeline_dir=timeline_dir)
+        except Exception as e:
+            logger.error(f"[{target['region']}] Deployment of {stack_name} failed: {e}")
+            return {"region": target["region"], "stack_name": stack_name, "param_file": target["param_file"],
+                    "result": "FAILED", "status": str(e), "seconds": 0.0}
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        return list(executor.map(deploy, targets))
+
+def parse_targets(target_args):
+    targets = []
+    for target in target_args:
+        parts = target.split(",")
+        if len(parts) != 2:
+            raise ValueError(f"Invalid target '{target}', expected REGION,PARAM_FILE")
+        targets.append({"region": parts[0], "param_file": parts[1]})
+    return targets
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--stack-name")
@@ -51,40 +272,57 @@ if __name__ == "__main__":
     parser.add_argument("--param-file")
     parser.add_argument("--project-name")
     parser.add_argument("--role-arn")
+    parser.add_argument(
+        "--target",
+        action="append",
+        help="Deployment target as REGION,PARAM_FILE, can be repeated. Targets are deployed concurrently "
+             "with change sets, unchanged targets are skipped and the script waits for completion.",
+    )
+    parser.add_argument(
+        "--timeline-dir", help="With --target, directory to write the per-resource deployment timelines to"
+    )
     args, _ = parser.parse_known_args()
 
     # Configure logging to output the line number and message
     log_format = "%(levelname)s: [%(filename)s:%(lineno)s] %(message)s"
     logging.basicConfig(format=log_format, level=logging.INFO)
-    
+
     credentials = assume_role(args.role_arn, "cfn-deploy")
 
-    cfn_client = boto3.client("cloudformation", region_name=args.region, 
-                    aws_access_key_id=credentials["AccessKeyId"], 
-                    aws_secret_access_key=credentials["SecretAccessKey"], 
-                    aws_session_token=credentials["SessionToken"])
     stack_name = (
         args.project_name
         + "-"
         + args.stack_name
     )
 
-    # Read parameters and tags
-    parameters, tags = read_parameters(args.param_file)
-
     # Read Cfn template body
-    with open("endpoint-config-template.yml", "r") as f:
+    with open(TEMPLATE_FILE, "r") as f:
         template_body = f.read()
 
+    if args.target:
+        summaries = deploy_targets(
+            parse_targets(args.target), stack_name, template_body, credentials, timeline_dir=args.timeline_dir
+        )
+        for summary in summaries:
+            logging.info(
+                f"{summary['region']}: {summary['stack_name']} {summary['result']} "
+                f"({summary['status']}) in {summary['seconds']:.1f} seconds"
+            )
+        if any(summary["result"] == "FAILED" for summary in summaries):
+            sys.exit(1)
+        sys.exit(0)
+
+    cfn_client = create_cfn_client(credentials, args.region)
+
+    # Read parameters and tags
+    parameters, tags = read_parameters(args.param_file)
+
     try:
         cfn_client.create_stack(
             StackName=stack_name,
             TemplateBody=template_body,
             Parameters=parameters,
-            Capabilities=[
-                'CAPABILITY_IAM',
-                'CAPABILITY_NAMED_IAM'
-            ],
+            Capabilities=CAPABILITIES,
             Tags=tags,
         )
         logging.info("Creating a new stack...")
@@ -93,10 +331,7 @@ if __name__ == "__main__":
             StackName=stack_name,
             TemplateBody=template_body,
             Parameters=parameters,
-            Capabilities=[
-                'CAPABILITY_IAM',
-                'CAPABILITY_NAMED_IAM'
-            ],
+            Capabilities=CAPABILITIES,
             Tags=tags,
         )
         logging.info("Updating existing stack...")
@@ -0,0 +1,282 @@
+"""
+This script builds a per-resource timeline of a CloudFormation deployment from its stack events.
+
+It is used by deploy_stack.py while a deployment runs, and can be run offline against recorded
+stack events (the StackEvents returned by describe_stack_events, saved as JSON):
+
+    python deployment_timeline.py --events example_stack_events.json --stack-name my-project-email-names \
+        --output-dir timeline
+
+example_stack_events.json is a recorded update of an email-names stack, which RecordedEventSource
+also replays to exercise deploy_stack.wait_for_stack offline.
+"""
+
+import argparse
+import datetime
+import json
+import os
+
+STACK_RESOURCE_TYPE = "AWS::CloudFormation::Stack"
+
+# Final statuses of the stack itself, once one of these is reported the operation is over
+STACK_TERMINAL_STATUSES = {
+    "CREATE_COMPLETE",
+    "CREATE_FAILED",
+    "UPDATE_COMPLETE",
+    "UPDATE_FAILED",
+    "UPDATE_ROLLBACK_COMPLETE",
+    "UPDATE_ROLLBACK_FAILED",
+    "ROLLBACK_COMPLETE",
+    "ROLLBACK_FAILED",
+    "DELETE_COMPLETE",
+    "DELETE_FAILED",
+    "IMPORT_COMPLETE",
+}
+
+
+def parse_timestamp(timestamp):
+    """
+    Parse an ISO 8601 timestamp, e.g. 2024-05-14T09:39:23.123+00:00 or 2024-05-14T09:39:23Z.
+
+    datetime.fromisoformat is not available before Python 3.7, nor is a colon in the offset of %z.
+    """
+    if isinstance(timestamp, datetime.datetime):
+        return timestamp
+    if timestamp.endswith("Z"):
+        timestamp = timestamp[:-1] + "+0000"
+    elif len(timestamp) > 6 and timestamp[-6] in "+-" and timestamp[-3] == ":":
+        timestamp = timestamp[:-3] + timestamp[-2:]
+    has_offset = len(timestamp) > 5 and timestamp[-5] in "+-"
+    time_format = "%Y-%m-%dT%H:%M:%S" + (".%f" if "." in timestamp else "") + ("%z" if has_offset else "")
+    return datetime.datetime.strptime(timestamp, time_format)
+
+
+class CloudFormationEventSource():
+    """
+    Event source reading the new events of a stack with describe_stack_events.
+    """
+    def __init__(self, cfn_client, stack_name, start_time):
+        self.cfn_client = cfn_client
+        self.stack_name = stack_name
+        self.start_time = start_time
+        self._seen_event_ids = set()
+
+    def get_new_events(self):
+        """
+        Get the events not returned yet, oldest first.
+        """
+        new_events = []
+        paginator = self.cfn_client.get_paginator("describe_stack_events")
+        for page in paginator.paginate(StackName=self.stack_name):
+            # Events are returned newest first, stop at the first one already seen or too old
+            page_events = [
+                event for event in page["StackEvents"]
+                if event["EventId"] not in self._seen_event_ids
+                and parse_timestamp(event["Timestamp"]).timestamp() >= self.start_time
+            ]
+            new_events.extend(page_events)
+            if len(page_events) < len(page["StackEvents"]):
+                break
+
+        new_events.reverse()
+        self._seen_event_ids.update(event["EventId"] for event in new_events)
+        return new_events
+
+
+class RecordedEventSource():
+    """
+    Event source replaying recorded stack events, a few at a time, for offline use.
+    """
+    def __init__(self, events, batch_size=None):
+        self.events = sorted(events, key=lambda event: parse_timestamp(event["Timestamp"]))
+        self.batch_size = batch_size or len(self.events) or 1
+        self._position = 0
+
+    @classmethod
+    def from_file(cls, path, batch_size=None):
+        with open(path, "r") as f:
+            events = json.load(f)
+        # Accept both a plain list and a saved describe_stack_events response
+        if isinstance(events, dict):
+            events = events["StackEvents"]
+        return cls(events, batch_size=batch_size)
+
+    def get_new_events(self):
+        events = self.events[self._position:self._position + self.batch_size]
+        self._position += len(events)
+        return events
+
+
+class DeploymentTimeline():
+    """
+    Per-resource timeline of a deployment, built from stack events.
+    """
+    def __init__(self, stack_name):
+        self.stack_name = stack_name
+        self.events = []
+        self.stack_status = None
+
+    def add_events(self, events):
+        for event in events:
+            self.events.append(event)
+            if (event.get("ResourceType") == STACK_RESOURCE_TYPE
+                    and event["LogicalResourceId"] == self.stack_name):
+                self.stack_status = event["ResourceStatus"]
+
+    def is_finished(self):
+        return self.stack_status in STACK_TERMINAL_STATUSES
+
+    def resources(self):
+        """
+        Get the start, end and duration of each resource, ordered by start time.
+
+        A resource starts at its first IN_PROGRESS event and ends at its last COMPLETE
+        or FAILED event. Cleanup of replaced resources is not counted.
+        """
+        resources = {}
+        cleanup = False
+        for event in self.events:
+            logical_id = event["LogicalResourceId"]
+            if logical_id == self.stack_name:
+                cleanup = "CLEANUP" in event["ResourceStatus"]
+                continue
+            if cleanup:
+                # Deletion of the resources replaced by the update
+                continue
+            status = event["ResourceStatus"]
+            timestamp = parse_timestamp(event["Timestamp"])
+            resource = resources.setdefault(logical_id, {
+                "logical_id": logical_id,
+                "resource_type": event.get("ResourceType"),
+                "start": None,
+                "end": None,
+                "status": None,
+            })
+            if status.endswith("_IN_PROGRESS") and "CLEANUP" not in status:
+                if resource["start"] is None:
+                    resource["start"] = timestamp
+            elif status.endswith("_COMPLETE") or status.endswith("_FAILED"):
+                resource["end"] = timestamp
+                resource["status"] = status
+                if resource["start"] is None:
+                    resource["start"] = timestamp
+
+        timeline = []
+        for resource in resources.values():
+            if resource["start"] is None:
+                continue
+            end = resource["end"] or resource["start"]
+            timeline.append({**resource, "duration": (end - resource["start"]).total_seconds()})
+        return sorted(timeline, key=lambda resource: resource["start"])
+
+    def critical_path(self, tolerance_seconds=1.0):
+        """
+        Approximate the critical path by walking back from the last resource to finish.
+
+        The predecessor of a resource is the resource that finished last before it started,
+        which is the dependency that unblocked it when CloudFormation starts it immediately.
+
+        Returns:
+        - list: The logical resource ids on the critical path, first to last.
+        """
+        resources = [resource for resource in self.resources() if resource["end"] is not None]
+        if not resources:
+            return []
+
+        current = max(resources, key=lambda resource: resource["end"])
+        path = [current["logical_id"]]
+        while True:
+            cutoff = current["start"] + datetime.timedelta(seconds=tolerance_seconds)
+            candidates = [
+                resource for resource in resources
+                if resource["end"] <= cutoff and resource["logical_id"] not in path
+            ]
+            if not candidates:
+                break
+            current = max(candidates, key=lambda resource: resource["end"])
+            path.append(current["logical_id"])
+        path.reverse()
+        return path
+
+    def to_dict(self):
+        resources = self.resources()
+        critical_path = self.critical_path()
+        start = min((resource["start"] for resource in resources), default=None)
+        end = max((resource["end"] or resource["start"] for resource in resources), default=None)
+        return {
+            "stack_name": self.stack_name,
+            "stack_status": self.stack_status,
+            "start": start.isoformat() if start else None,
+            "end": end.isoformat() if end else None,
+            "duration": (end - start).total_seconds() if start else 0.0,
+            "critical_path": critical_path,
+            "resources": [
+                {
+                    **resource,
+                    "start": resource["start"].isoformat(),
+                    "end": resource["end"].isoformat() if resource["end"] else None,
+                    "critical": resource["logical_id"] in critical_path,
+                }
+                for resource in resources
+            ],
+        }
+
+    def format_gantt(self, width=50):
+        """
+        Format the timeline as a compact text Gantt chart, critical path resources are marked with '*'.
+        """
+        resources = self.resources()
+        if not resources:
+            return f"{self.stack_name}: no resource events"
+
+        critical_path = set(self.critical_path())
+        start = min(resource["start"] for resource in resources)
+        end = max(resource["end"] or resource["start"] for resource in resources)
+        total = max((end - start).total_seconds(), 1.0)
+        name_width = max(len(resource["logical_id"]) for resource in resources)
+
+        lines = [f"{self.stack_name} ({self.stack_status}) {total:.0f}s"]
+        for resource in resources:
+            offset = int((resource["start"] - start).total_seconds() / total * width)
+            length = max(1, int(resource["duration"] / total * width))
+            bar = " " * offset + "#" * min(length, width - offset)
+            marker = "*" if resource["logical_id"] in critical_path else " "
+            lines.append(
+                f"{marker} {resource['logical_id']:<{name_width}} |{bar:<{width}}| "
+                f"{resource['duration']:>7.1f}s {resource['status'] or ''}".rstrip()
+            )
+        return "\n".join(lines)
+
+    def write(self, output_dir, prefix=None):
+        """
+        Write the timeline as JSON and as a text Gantt summary.
+
+        Returns:
+        - tuple: The paths of the JSON and text files.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        prefix = prefix or self.stack_name
+        json_path = os.path.join(output_dir, f"{prefix}-timeline.json")
+        text_path = os.path.join(output_dir, f"{prefix}-timeline.txt")
+        with open(json_path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+        with open(text_path, "w") as f:
+            f.write(self.format_gantt() + "\n")
+        return json_path, text_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", required=True, help="JSON file with recorded stack events")
+    parser.add_argument("--stack-name", required=True, help="Name of the stack the events belong to")
+    parser.add_argument("--output-dir", default=None, help="Directory to write the timeline JSON and text summary to")
+    args = parser.parse_args()
+
+    event_source = RecordedEventSource.from_file(args.events)
+    timeline = DeploymentTimeline(args.stack_name)
+    timeline.add_events(event_source.get_new_events())
+
+    print(timeline.format_gantt())
+    if args.output_dir:
+        for path in timeline.write(args.output_dir):
+            print(f"Wrote {path}")
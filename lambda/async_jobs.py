@@ -0,0 +1,306 @@
+"""
+Asynchronous inference jobs for the email-names API.
+
+A job is a batch of records. The input payload of each record is written to a job store and
+submitted to the asynchronous endpoint, which writes the response to the output location
+returned at submission. Collecting a job reads the outputs that are available so far.
+
+S3JobStore and SageMakerAsyncSubmitter are used in Lambda. LocalJobStore and LocalSubmitter
+keep everything in a local directory and stand in for them in tests and local runs.
+"""
+
+import json
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import circuit_breaker
+
+JOB_STATUS_IN_PROGRESS = "InProgress"
+JOB_STATUS_COMPLETED = "Completed"
+JOB_STATUS_FAILED = "Failed"
+
+# Number of records submitted or collected concurrently
+MAX_WORKERS = 16
+
+# Seconds a record submission may take, no record is submitted with less time left so the job file can be written
+SUBMIT_MIN_S = 2.0
+
+# Job ids are generated with uuid4().hex and become part of the store paths
+JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+class AsyncJobsNotConfigured(ValueError):
+    """
+    Raised when the stage has no asynchronous endpoint to submit jobs to.
+    """
+
+
+def is_valid_job_id(job_id):
+    return isinstance(job_id, str) and JOB_ID_PATTERN.fullmatch(job_id) is not None
+
+
+class S3JobStore():
+    """
+    Job store keeping the job metadata and input payloads in S3.
+    """
+    def __init__(self, s3_client, bucket, prefix):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def job_location(self, job_id):
+        return f"s3://{self.bucket}/{self.prefix}/jobs/{job_id}.json"
+
+    def input_location(self, job_id, index):
+        return f"s3://{self.bucket}/{self.prefix}/input/{job_id}/{index}.json"
+
+    def write(self, location, body):
+        bucket, key = location[len("s3://"):].split("/", 1)
+        self.s3_client.put_object(Bucket=bucket, Key=key, Body=body.encode("utf-8"), ContentType="application/json")
+
+    def read(self, location):
+        """
+        Read an object, returns None if it does not exist yet.
+        """
+        bucket, key = location[len("s3://"):].split("/", 1)
+        try:
+            response = self.s3_client.get_object(Bucket=bucket, Key=key)
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        except self.s3_client.exceptions.ClientError as e:
+            # A missing key can also come back as a bare 404, e.g. from a HEAD-style error response
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return None
+            raise
+        return response["Body"].read().decode("utf-8")
+
+
+class LocalJobStore():
+    """
+    Job store keeping the job metadata and input payloads in a local directory.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def job_location(self, job_id):
+        return os.path.join(self.directory, "jobs", f"{job_id}.json")
+
+    def input_location(self, job_id, index):
+        return os.path.join(self.directory, "input", job_id, f"{index}.json")
+
+    def write(self, location, body):
+        os.makedirs(os.path.dirname(location), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial object
+        tmp_location = f"{location}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_location, "w") as f:
+            f.write(body)
+        os.replace(tmp_location, location)
+
+    def read(self, location):
+        if not os.path.exists(location):
+            return None
+        with open(location, "r") as f:
+            return f.read()
+
+
+class SageMakerAsyncSubmitter():
+    """
+    Submitter queuing requests on a SageMaker asynchronous inference endpoint.
+    """
+    def __init__(self, sagemaker_runtime, endpoint_name):
+        self.sagemaker_runtime = sagemaker_runtime
+        self.endpoint_name = endpoint_name
+
+    def submit(self, input_location, inference_id):
+        """
+        Returns:
+        - tuple: The output location and failure location of the request.
+        """
+        response = self.sagemaker_runtime.invoke_endpoint_async(
+            EndpointName=self.endpoint_name,
+            InputLocation=input_location,
+            ContentType="application/json",
+            InferenceId=inference_id,
+            CustomAttributes="accept_eula=true",
+        )
+        return response["OutputLocation"], response.get("FailureLocation")
+
+
+class LocalSubmitter():
+    """
+    Stand-in for an asynchronous endpoint, queuing requests in a local directory.
+
+    Queued requests are only run when process() is called, like an endpoint working through its backlog.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.store = LocalJobStore(directory)
+
+    def submit(self, input_location, inference_id):
+        output_location = os.path.join(self.directory, "output", f"{inference_id}.out")
+        failure_location = os.path.join(self.directory, "failure", f"{inference_id}.out")
+        request = {"input_location": input_location, "output_location": output_location,
+                   "failure_location": failure_location}
+        self.store.write(os.path.join(self.directory, "queue", f"{inference_id}.json"), json.dumps(request))
+        return output_location, failure_location
+
+    def process(self, predict_fn, max_requests=None):
+        """
+        Run the queued requests, oldest first.
+
+        Args:
+        - predict_fn (function): Called with the request payload, returns the response.
+        - max_requests (int): Optional maximum number of requests to run.
+
+        Returns:
+        - int: The number of requests run.
+        """
+        queue_dir = os.path.join(self.directory, "queue")
+        if not os.path.isdir(queue_dir):
+            return 0
+        paths = sorted((os.path.join(queue_dir, name) for name in os.listdir(queue_dir) if name.endswith(".json")),
+                       key=os.path.getmtime)
+        for path in paths[:max_requests]:
+            request = json.loads(self.store.read(path))
+            try:
+                response = predict_fn(json.loads(self.store.read(request["input_location"])))
+                self.store.write(request["output_location"], json.dumps(response))
+            except Exception as e:
+                self.store.write(request["failure_location"], f"{type(e).__name__}: {e}")
+            os.remove(path)
+        return len(paths[:max_requests])
+
+
+def create_job_backend(sagemaker_runtime=None):
+    """
+    Create the job store and submitter configured by the environment.
+
+    ASYNC_JOB_LOCAL_DIR selects the local directory-backed stand-ins, otherwise the jobs are kept
+    under ASYNC_JOB_PREFIX in ASYNC_JOB_BUCKET and submitted to ASYNC_ENDPOINT_NAME.
+
+    Returns:
+    - tuple: The job store and the submitter.
+    """
+    local_dir = os.environ.get("ASYNC_JOB_LOCAL_DIR")
+    if local_dir:
+        return LocalJobStore(os.path.join(local_dir, "jobs")), LocalSubmitter(os.path.join(local_dir, "endpoint"))
+
+    bucket = os.environ.get("ASYNC_JOB_BUCKET")
+    endpoint_name = os.environ.get("ASYNC_ENDPOINT_NAME")
+    if not bucket or not endpoint_name:
+        raise AsyncJobsNotConfigured("Asynchronous inference is not configured for this stage")
+
+    import boto3
+    store = S3JobStore(boto3.client("s3"), bucket, os.environ.get("ASYNC_JOB_PREFIX", "async-inference"))
+    submitter = SageMakerAsyncSubmitter(sagemaker_runtime or boto3.client("sagemaker-runtime"), endpoint_name)
+    return store, submitter
+
+
+def submit_job(records, build_payload, store, submitter, job_id=None, budget=None, breaker=None):
+    """
+    Write the payload of each record to the job store and submit it.
+
+    A record that fails to be written or submitted is kept in the job as failed, with its error.
+    So are the records left when the budget runs short or the breaker opens. The job file is
+    written in any case, so the records already queued on the endpoint can be collected with the
+    job id.
+
+    Args:
+    - records (list): The input records of the job.
+    - build_payload (function): Builds the endpoint payload of a record.
+    - store: The job store, e.g. S3JobStore.
+    - submitter: The submitter, e.g. SageMakerAsyncSubmitter.
+    - job_id (str): Optional job id, generated by default.
+    - budget (Deadline): Optional deadline of the invocation, see deadline.py.
+    - breaker (CircuitBreaker): Optional circuit breaker of the asynchronous endpoint, see circuit_breaker.py.
+
+    Returns:
+    - dict: The job metadata.
+    """
+    job_id = job_id or uuid.uuid4().hex
+    if not is_valid_job_id(job_id):
+        raise ValueError(f"Invalid job id: {job_id!r}")
+
+    def submit_record(index):
+        record = {"index": index, "input": records[index]}
+        if budget is not None and not budget.has_budget(SUBMIT_MIN_S):
+            return {**record, "status": JOB_STATUS_FAILED, "error": "Not submitted before the request deadline"}
+        if breaker is not None and breaker.get_retry_after() is not None:
+            return {**record, "status": JOB_STATUS_FAILED, "error": "Not submitted, the endpoint is overloaded"}
+        try:
+            input_location = store.input_location(job_id, index)
+            store.write(input_location, json.dumps(build_payload(records[index])))
+            output_location, failure_location = submitter.submit(input_location, f"{job_id}-{index}")
+        except Exception as e:
+            print(f"Submission of record {index} of job {job_id} failed:", e)
+            kind = circuit_breaker.classify_error(e)
+            if breaker is not None and kind is not None:
+                breaker.record_overload(kind)
+            return {**record, "status": JOB_STATUS_FAILED, "error": f"{type(e).__name__}: {e}"}
+        if breaker is not None:
+            breaker.record_success()
+        return {**record, "output_location": output_location, "failure_location": failure_location}
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        job_records = list(executor.map(submit_record, range(len(records))))
+
+    job = {"job_id": job_id, "submitted_at": time.time(), "records": job_records}
+    store.write(store.job_location(job_id), json.dumps(job))
+    return job
+
+
+def collect_job(job_id, store, parse_output):
+    """
+    Collect the results of a job that are available so far.
+
+    Args:
+    - job_id (str): The job id.
+    - store: The job store the job was submitted with.
+    - parse_output (function): Parses the endpoint response of a record.
+
+    Returns:
+    - dict: The job status and per-record results, or None if the job does not exist.
+    """
+    if not is_valid_job_id(job_id):
+        return None
+    job = store.read(store.job_location(job_id))
+    if job is None:
+        return None
+    job = json.loads(job)
+
+    def collect_record(record):
+        result = {"index": record["index"], "input": record["input"]}
+        if record.get("status") == JOB_STATUS_FAILED:
+            # Never submitted
+            return {**result, "status": JOB_STATUS_FAILED, "error": record["error"]}
+        output = store.read(record["output_location"])
+        if output is not None:
+            return {**result, "status": JOB_STATUS_COMPLETED, "output": parse_output(json.loads(output))}
+        failure = store.read(record["failure_location"]) if record.get("failure_location") else None
+        if failure is not None:
+            return {**result, "status": JOB_STATUS_FAILED, "error": failure}
+        return {**result, "status": JOB_STATUS_IN_PROGRESS}
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(executor.map(collect_record, job["records"]))
+
+    counts = {status: sum(1 for result in results if result["status"] == status)
+              for status in (JOB_STATUS_COMPLETED, JOB_STATUS_FAILED, JOB_STATUS_IN_PROGRESS)}
+    if counts[JOB_STATUS_IN_PROGRESS]:
+        status = JOB_STATUS_IN_PROGRESS
+    elif counts[JOB_STATUS_FAILED] and not counts[JOB_STATUS_COMPLETED]:
+        status = JOB_STATUS_FAILED
+    else:
+        status = JOB_STATUS_COMPLETED
+    return {
+        "job_id": job_id,
+        "status": status,
+        "submitted_at": job["submitted_at"],
+        "completed": counts[JOB_STATUS_COMPLETED],
+        "failed": counts[JOB_STATUS_FAILED],
+        "pending": counts[JOB_STATUS_IN_PROGRESS],
+        "results": results,
+    }
@@ -0,0 +1,215 @@
+"""
+Load shedding for the inference Lambdas when the SageMaker endpoint is overloaded.
+
+Each Lambda container keeps a circuit breaker around invoke_endpoint. Throttles and timeouts,
+classified from the botocore errors, count as overload. After failure_threshold consecutive
+overload errors the circuit opens, and requests fail fast with 503 and Retry-After instead of
+adding to the endpoint's queue. After the cooldown the circuit is half-open: probe requests go
+through, their success closes it again and an overload error opens it for another cooldown.
+
+A container serves one request at a time, but the records of an asynchronous job are submitted
+from several threads, so the breaker state is updated under a lock.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+import botocore.exceptions
+from botocore.config import Config
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half-open"
+
+OVERLOAD_THROTTLE = "throttle"
+OVERLOAD_TIMEOUT = "timeout"
+
+# Error codes of throttled or temporarily unavailable endpoints
+THROTTLE_ERROR_CODES = {
+    "ThrottlingException",
+    "Throttling",
+    "TooManyRequestsException",
+    "ServiceUnavailable",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+TIMEOUT_ERROR_CODES = {"RequestTimeout", "RequestTimeoutException"}
+# Status codes of the model container that SageMaker wraps in a ModelError (424), e.g. the
+# 429 TGI answers once it holds max_concurrent_requests
+MODEL_OVERLOAD_STATUS_CODES = {429, 503}
+TIMEOUT_EXCEPTIONS = (
+    botocore.exceptions.ReadTimeoutError,
+    botocore.exceptions.ConnectTimeoutError,
+    botocore.exceptions.ConnectionClosedError,
+)
+
+# Retry-After of a throttled request while the circuit is still closed
+THROTTLE_RETRY_AFTER_S = 1
+
+
+def get_original_status_code(error):
+    """
+    Get the status code the model container answered with, from a ModelError of invoke_endpoint.
+    """
+    status_code = error.response.get("OriginalStatusCode", error.response.get("Error", {}).get("OriginalStatusCode"))
+    try:
+        return int(status_code)
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error):
+    """
+    Classify an invoke_endpoint error as an overload of the endpoint.
+
+    Args:
+    - error (Exception): The error raised by the SageMaker runtime client.
+
+    Returns:
+    - str: OVERLOAD_THROTTLE, OVERLOAD_TIMEOUT, or None if the error is not an overload.
+    """
+    if isinstance(error, TIMEOUT_EXCEPTIONS):
+        return OVERLOAD_TIMEOUT
+    if isinstance(error, botocore.exceptions.ClientError):
+        code = error.response.get("Error", {}).get("Code", "")
+        status_code = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if code in THROTTLE_ERROR_CODES or status_code in (429, 503):
+            return OVERLOAD_THROTTLE
+        if code == "ModelError" and get_original_status_code(error) in MODEL_OVERLOAD_STATUS_CODES:
+            return OVERLOAD_THROTTLE
+        if code in TIMEOUT_ERROR_CODES or status_code == 504:
+            return OVERLOAD_TIMEOUT
+    return None
+
+
+def get_client_config():
+    """
+    Configuration of the SageMaker runtime client, without the retries of botocore.
+
+    Throttled requests are shed and retried by the callers after Retry-After instead of being
+    retried inside the Lambda, and the read timeout ends before the Lambda does.
+    """
+    return Config(
+        connect_timeout=float(os.environ.get("ENDPOINT_CONNECT_TIMEOUT_S", "2")),
+        read_timeout=float(os.environ.get("ENDPOINT_READ_TIMEOUT_S", "25")),
+        retries={"max_attempts": 1, "mode": "standard"},
+    )
+
+
+class CircuitBreaker():
+    """
+    Circuit breaker of the endpoint calls of one Lambda container.
+
+    Args:
+    - failure_threshold (int): Number of consecutive overload errors opening the circuit.
+    - cooldown_s (float): Time the circuit stays open before probe requests are let through.
+    - half_open_probes (int): Number of successful probes closing the circuit again.
+    """
+    def __init__(self, failure_threshold=5, cooldown_s=10.0, half_open_probes=1):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.half_open_probes = half_open_probes
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.probe_successes = 0
+        self.opened_at = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            failure_threshold=int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            cooldown_s=float(os.environ.get("CIRCUIT_COOLDOWN_S", "10")),
+            half_open_probes=int(os.environ.get("CIRCUIT_HALF_OPEN_PROBES", "1")),
+        )
+
+    def get_retry_after(self):
+        """
+        Check whether a request may call the endpoint.
+
+        Returns:
+        - int: Seconds the caller should wait if the circuit is open, else None.
+        """
+        with self._lock:
+            if self.state != CIRCUIT_OPEN:
+                return None
+            remaining_s = self.opened_at + self.cooldown_s - time.time()
+            if remaining_s > 0:
+                return max(1, math.ceil(remaining_s))
+            self.state = CIRCUIT_HALF_OPEN
+            self.probe_successes = 0
+            print("Circuit half-open, probing the endpoint")
+            return None
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            if self.state == CIRCUIT_HALF_OPEN:
+                self.probe_successes += 1
+                if self.probe_successes >= self.half_open_probes:
+                    self.state = CIRCUIT_CLOSED
+                    print("Circuit closed, the endpoint recovered")
+
+    def record_overload(self, kind):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = CIRCUIT_OPEN
+                self.opened_at = time.time()
+                print(f"Circuit open for {self.cooldown_s} seconds after {self.consecutive_failures} "
+                      f"consecutive overload errors, last one a {kind}")
+
+
+def error_response(status_code, message, retry_after=None):
+    headers = {"Content-Type": "application/json"}
+    if retry_after is not None:
+        headers["Retry-After"] = str(retry_after)
+    return {
+        "statusCode": status_code,
+        "headers": headers,
+        "body": json.dumps({"status": "error", "message": message}),
+    }
+
+
+def invoke_endpoint(breaker, sagemaker_runtime, timeout_response=None, **kwargs):
+    """
+    Call invoke_endpoint through the circuit breaker.
+
+    Args:
+    - breaker (CircuitBreaker): The breaker of the container.
+    - sagemaker_runtime: The SageMaker runtime client.
+    - timeout_response (function): Optional, builds the response returned when the call times out instead of the 503.
+    - kwargs: The arguments of invoke_endpoint.
+
+    Returns:
+    - tuple: The invoke_endpoint response and None, or None and the API error response to return.
+    """
+    retry_after = breaker.get_retry_after()
+    if retry_after is not None:
+        return None, error_response(503, "The model endpoint is overloaded, retry later", retry_after)
+
+    try:
+        response = sagemaker_runtime.invoke_endpoint(**kwargs)
+    except Exception as e:
+        kind = classify_error(e)
+        print(f"Error invoking SageMaker endpoint ({kind or 'not an overload'}):", e)
+        if kind is None:
+            if isinstance(e, botocore.exceptions.ClientError):
+                # The endpoint answered with an error, so it is not overloaded
+                breaker.record_success()
+            return None, error_response(502, "Error invoking the model endpoint")
+        breaker.record_overload(kind)
+        retry_after = breaker.get_retry_after() or THROTTLE_RETRY_AFTER_S
+        if kind == OVERLOAD_THROTTLE:
+            return None, error_response(429, "The model endpoint is throttling requests", retry_after)
+        if timeout_response is not None:
+            response = timeout_response()
+            response["headers"]["Retry-After"] = str(retry_after)
+            return None, response
+        return None, error_response(503, "The model endpoint timed out", retry_after)
+
+    breaker.record_success()
+    return response, None
@@ -0,0 +1,185 @@
+"""
+Deadline budgets for the endpoint calls of the inference Lambdas and the offline inference classes.
+
+A Deadline is computed once, at handler entry from context.get_remaining_time_in_millis() or from a
+per-row time limit offline. Each endpoint call then gets a client whose connect timeout, read
+timeout and number of attempts fit in the remaining time. botocore sets these per client, so the
+clients are cached by configuration, with the read timeout rounded down to a few buckets to keep
+the number of clients per container small.
+
+    budget = deadline.Deadline.from_context(context)
+    client = runtime_clients.get(budget)
+"""
+
+import json
+import os
+import time
+
+from botocore.config import Config
+
+# Time kept back at handler entry to build and return the response
+DEFAULT_RESERVE_S = 0.5
+
+# Read timeouts the remaining time is rounded down to
+READ_TIMEOUT_BUCKETS_S = (1, 2, 3, 5, 8, 12, 20, 25, 60)
+
+DEFAULT_CONNECT_TIMEOUT_S = 2.0
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when the remaining time is too short for another endpoint call.
+    """
+
+
+class Deadline():
+    """
+    A point in time work has to finish by.
+
+    Args:
+    - expires_at (float): time.time() at which the deadline expires, None for no deadline.
+    """
+    def __init__(self, expires_at=None):
+        self.started_at = time.time()
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_context(cls, context, reserve_s=DEFAULT_RESERVE_S):
+        """
+        Deadline of a Lambda invocation, reserve_s before the function times out.
+
+        Returns a deadline without a limit when there is no context, e.g. when a handler is called directly.
+        """
+        if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+            return cls()
+        return cls(time.time() + context.get_remaining_time_in_millis() / 1000 - reserve_s)
+
+    @classmethod
+    def from_timeout(cls, timeout_s):
+        """
+        Deadline timeout_s from now, or without a limit if timeout_s is None.
+        """
+        return cls(None if timeout_s is None else time.time() + timeout_s)
+
+    def remaining_s(self):
+        if self.expires_at is None:
+            return float("inf")
+        return max(0.0, self.expires_at - time.time())
+
+    def elapsed_s(self):
+        return time.time() - self.started_at
+
+    def expired(self):
+        return self.remaining_s() <= 0
+
+    def has_budget(self, seconds):
+        """
+        Check whether at least seconds remain, e.g. before optional work.
+        """
+        return self.remaining_s() >= seconds
+
+
+def get_read_timeout_bucket(seconds):
+    """
+    Round a read timeout down to the largest bucket, None if it is below the smallest bucket.
+    """
+    fitting = [bucket for bucket in READ_TIMEOUT_BUCKETS_S if bucket <= seconds]
+    return fitting[-1] if fitting else None
+
+
+def get_call_settings(deadline, max_attempts=1, connect_timeout_s=DEFAULT_CONNECT_TIMEOUT_S, max_read_timeout_s=None):
+    """
+    Get the timeouts and number of attempts of an endpoint call that fit in the remaining time.
+
+    The read timeout is the longest bucket that fits, up to the maximum, and retries are only
+    allowed when whole attempts with that timeout still fit.
+
+    Args:
+    - deadline (Deadline): The deadline of the call.
+    - max_attempts (int): Maximum number of attempts, including the first one.
+    - connect_timeout_s (float): Maximum connect timeout.
+    - max_read_timeout_s (float): Maximum read timeout, by default the ENDPOINT_READ_TIMEOUT_S environment variable.
+
+    Returns:
+    - tuple: The connect timeout, read timeout and number of attempts.
+
+    Raises:
+    - DeadlineExceeded: If not even one attempt fits in the remaining time.
+    """
+    if max_read_timeout_s is None:
+        max_read_timeout_s = float(os.environ.get("ENDPOINT_READ_TIMEOUT_S", "25"))
+    remaining_s = deadline.remaining_s()
+    # Only two connect timeouts, so they add few cached clients
+    connect_s = connect_timeout_s if remaining_s >= 4 * connect_timeout_s else connect_timeout_s / 4
+    read_s = get_read_timeout_bucket(min(max_read_timeout_s, remaining_s - connect_s))
+    if read_s is None:
+        raise DeadlineExceeded(f"{remaining_s:.2f} seconds left, too little for an endpoint call")
+    if deadline.expires_at is None:
+        return connect_s, read_s, max_attempts
+    attempts = max(1, min(max_attempts, int(remaining_s // (connect_s + read_s))))
+    return connect_s, read_s, attempts
+
+
+class ClientCache():
+    """
+    Clients created by create_client(config), one per call configuration.
+
+    Args:
+    - create_client (function): Creates a client from a botocore Config.
+    - max_attempts (int): Maximum number of attempts of a call, by default the ENDPOINT_MAX_ATTEMPTS environment
+      variable.
+    """
+    def __init__(self, create_client, max_attempts=None):
+        self.create_client = create_client
+        if max_attempts is None:
+            max_attempts = int(os.environ.get("ENDPOINT_MAX_ATTEMPTS", "1"))
+        self.max_attempts = max_attempts
+        # A stand-in client used for every configuration, e.g. the endpoint emulator of local runs
+        self.override = None
+        self._clients = {}
+
+    def get(self, deadline):
+        """
+        Get the client for the next call within a deadline.
+
+        Raises:
+        - DeadlineExceeded: If not even one attempt fits in the remaining time.
+        """
+        settings = get_call_settings(deadline, max_attempts=self.max_attempts)
+        if self.override is not None:
+            return self.override
+        if settings not in self._clients:
+            connect_s, read_s, attempts = settings
+            self._clients[settings] = self.create_client(Config(
+                connect_timeout=connect_s,
+                read_timeout=read_s,
+                retries={"max_attempts": attempts, "mode": "standard"},
+            ))
+        return self._clients[settings]
+
+
+def timeout_response(deadline, stage, input_data=None):
+    """
+    API response of a request that ran out of time, with how far it got.
+
+    Args:
+    - deadline (Deadline): The deadline of the request.
+    - stage (str): The step the request was at, e.g. "invoke_endpoint".
+    - input_data (dict): The input of the request, echoed back.
+
+    Returns:
+    - dict: A 504 response.
+    """
+    body = {
+        "status": "timeout",
+        "message": f"The request ran out of time at {stage}",
+        "stage": stage,
+        "elapsed_ms": int(deadline.elapsed_s() * 1000),
+    }
+    if input_data is not None:
+        body["input_data"] = input_data
+    return {
+        "statusCode": 504,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(body),
+    }
@@ -5,7 +5,29 @@ import re
 import os
 import time
 
-sagemaker_runtime = boto3.client('sagemaker-runtime')
+import async_jobs
+import circuit_breaker
+import deadline
+import name_input_budget
+
+sagemaker_runtime = boto3.client('sagemaker-runtime', config=circuit_breaker.get_client_config())
+
+# Clients whose timeouts and retries fit in the remaining time of an invocation
+runtime_clients = deadline.ClientCache(lambda config: boto3.client('sagemaker-runtime', config=config))
+
+# Sheds load while the endpoint is throttling or timing out
+endpoint_breaker = circuit_breaker.CircuitBreaker.from_env()
+# Stops submissions while the asynchronous endpoint is throttling or timing out
+async_endpoint_breaker = circuit_breaker.CircuitBreaker.from_env()
+
+# Remaining seconds below which optional work is skipped
+OPTIONAL_WORK_MIN_S = 1.0
+
+# Job store and submitter of the asynchronous path, created on first use
+async_job_backend = None
+
+# Maximum number of records in one asynchronous job
+MAX_ASYNC_RECORDS = int(os.environ.get("ASYNC_MAX_RECORDS", "500"))
 
 def extract_names(response):
     """
@@ -156,30 +178,22 @@ def get_prompt():
     }
     return prompt_email_names
 
-
-def lambda_handler(event, context):
+def get_payload(email_address, display_name, input_budget=None):
     """
-    Checks the email names from the result generated by the Mistral model.
+    Build the endpoint payload for extracting the names of one email address.
+
+    The display name is cleaned and cut to its budget, and max_new_tokens is sized from it, see
+    name_input_budget.py.
 
     Args:
-    - response (list): The result generated by the Mistral model.
+    - email_address (str): The email address.
+    - display_name (str): The display name associated with the email address.
+    - input_budget (bool): Apply the input budget, by default unless NAME_INPUT_BUDGET_ENABLED is false.
 
     Returns:
-    - dict: A dictionary containing the email names
+    - dict: The payload for the Mistral model.
     """
-    start_time = time.time()
-    endpoint_name = os.environ.get("ENDPOINT_NAME", "sagemaker-sigparser-llmops-staging-email-names")
-
-    body = ""
-    try:
-        body = json.loads(event.get("body", "{}"))
-    except Exception as e:
-        return {"status": "bad request"}
-    
-    email_address = body["email_address"]
-    display_name = body["email_display_name"]
-    print("Request received email_address: %s, display_name: %s", email_address, display_name)
-
+    display_name, parameters = name_input_budget.prepare_name_input(email_address, display_name, input_budget)
     prompt_obj = get_prompt()
     system_prompt = prompt_obj["system_prompt"]
     instruction = prompt_obj["instruction"]
@@ -199,19 +213,162 @@ def lambda_handler(event, context):
     payload = {
         "inputs": prompt
         + input_output_demarkation_key,
-        "parameters": {"max_new_tokens": 100, "temperature":0.1, 'top_p':0.1},
+        "parameters": parameters,
     }
+    return payload
+
+def get_async_job_backend():
+    global async_job_backend
+    if async_job_backend is None:
+        async_job_backend = async_jobs.create_job_backend(sagemaker_runtime)
+    return async_job_backend
+
+def json_response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps(body)
+    }
+
+def submit_async_job(records, budget=None):
+    """
+    Submit a batch of records to the asynchronous endpoint.
+
+    Records left when the invocation runs out of time or the endpoint is overloaded are not
+    submitted, and are reported as failed in the job.
+
+    Args:
+    - records (list): Dictionaries with email_address and email_display_name.
+    - budget (Deadline): The deadline of the invocation.
+
+    Returns:
+    - dict: The API response with the job id.
+    """
+    if not isinstance(records, list) or not records:
+        return json_response(400, {"status": "bad request", "message": "records must be a non-empty list"})
+    if len(records) > MAX_ASYNC_RECORDS:
+        return json_response(400, {"status": "bad request", "message": f"at most {MAX_ASYNC_RECORDS} records per job"})
+    if not all(isinstance(record, dict) and "email_address" in record and "email_display_name" in record
+               for record in records):
+        return json_response(400, {"status": "bad request",
+                                   "message": "each record needs email_address and email_display_name"})
+
+    try:
+        store, submitter = get_async_job_backend()
+    except async_jobs.AsyncJobsNotConfigured as e:
+        return json_response(501, {"status": "not implemented", "message": str(e)})
+    retry_after = async_endpoint_breaker.get_retry_after()
+    if retry_after is not None:
+        return circuit_breaker.error_response(503, "The asynchronous endpoint is overloaded, retry later", retry_after)
+    job = async_jobs.submit_job(
+        records,
+        lambda record: get_payload(record["email_address"], record["email_display_name"]),
+        store,
+        submitter,
+        budget=budget,
+        breaker=async_endpoint_breaker,
+    )
+    failed = sum(1 for record in job["records"] if record.get("status") == async_jobs.JOB_STATUS_FAILED)
+    print(f"Submitted async job {job['job_id']} with {len(records) - failed} of {len(records)} records")
+    status = async_jobs.JOB_STATUS_FAILED if failed == len(records) else async_jobs.JOB_STATUS_IN_PROGRESS
+    return json_response(202, {"job_id": job["job_id"], "status": status, "records": len(records),
+                               "failed": failed})
+
+def get_async_job(job_id):
+    """
+    Collect the results of an asynchronous job available so far.
+
+    Returns:
+    - dict: The API response with the job status and the extracted names of the finished records.
+    """
+    if not async_jobs.is_valid_job_id(job_id):
+        return json_response(400, {"status": "bad request", "message": "job_id must be the id returned at submission"})
+    try:
+        store, _ = get_async_job_backend()
+    except async_jobs.AsyncJobsNotConfigured as e:
+        return json_response(501, {"status": "not implemented", "message": str(e)})
+    job = async_jobs.collect_job(job_id, store, extract_names)
+    if job is None:
+        return json_response(404, {"status": "not found", "job_id": job_id})
+
+    results = []
+    for result in job.pop("results"):
+        record = {
+            "index": result["index"],
+            "status": result["status"],
+            "input_data": {
+                "email_address": result["input"]["email_address"],
+                "email_display_name": result["input"]["email_display_name"]
+            }
+        }
+        if "output" in result:
+            record["extracted_names"] = result["output"]
+        if "error" in result:
+            record["error"] = result["error"]
+        results.append(record)
+    return json_response(200, {**job, "results": results})
+
+def lambda_handler(event, context):
+    """
+    Checks the email names from the result generated by the Mistral model.
+
+    A body with "records" submits an asynchronous job and a body with "job_id" collects its
+    results, any other body is answered synchronously.
+
+    Args:
+    - response (list): The result generated by the Mistral model.
+
+    Returns:
+    - dict: A dictionary containing the email names
+    """
+    start_time = time.time()
+    # Time left before the function times out, shared by all the work below
+    budget = deadline.Deadline.from_context(context)
+    endpoint_name = os.environ.get("ENDPOINT_NAME", "sagemaker-sigparser-llmops-staging-email-names")
+
+    body = ""
+    try:
+        body = json.loads(event.get("body", "{}"))
+    except Exception as e:
+        return {"status": "bad request"}
+
+    if "records" in body:
+        return submit_async_job(body["records"], budget)
+    if "job_id" in body:
+        return get_async_job(body["job_id"])
+
+    email_address = body["email_address"]
+    display_name = body["email_display_name"]
+    print("Request received email_address: %s, display_name: %s", email_address, display_name)
+
+    payload = get_payload(email_address, display_name)
+    print(f"Prompt length: {len(payload['inputs'])} characters, "
+          f"max_new_tokens: {payload['parameters']['max_new_tokens']}")
+    input_data = {"email_address": email_address, "email_display_name": display_name}
+    try:
+        client = runtime_clients.get(budget)
+    except deadline.DeadlineExceeded as e:
+        print("Skipping the SageMaker endpoint call:", e)
+        return deadline.timeout_response(budget, "before_invoke_endpoint", input_data)
 
     pre_invoke_time = time.time()
-    response = sagemaker_runtime.invoke_endpoint(
+    response, error = circuit_breaker.invoke_endpoint(
+        endpoint_breaker,
+        client,
+        timeout_response=lambda: deadline.timeout_response(budget, "invoke_endpoint", input_data),
         EndpointName=endpoint_name,
         ContentType="application/json",
         Body=json.dumps(payload),
         CustomAttributes="accept_eula=true",
     )
+    if error is not None:
+        return error
     
     post_invoke_time = time.time()
     print(f"SageMaker invocation duration: {post_invoke_time - pre_invoke_time} seconds")
+    # Production variant that served the request, to compare latency between variants
+    invoked_variant = response.get("InvokedProductionVariant")
+    print(f"Invoked production variant: {invoked_variant}")
     # Read and decode the response body
     response_body = response["Body"].read().decode("utf8")
 
@@ -230,10 +387,13 @@ def lambda_handler(event, context):
         "input_data":{
             "email_address": email_address,
             "email_display_name": display_name
-        }
+        },
+        "invoked_production_variant": invoked_variant
     }
 
-    logging.info("Response received: %s", response_body)
+    # Logging the whole response is optional work, skipped when little time is left
+    if budget.has_budget(OPTIONAL_WORK_MIN_S):
+        logging.info("Response received: %s", response_body)
     
     end_time = time.time()
     print(f"Total Lambda handler duration: {end_time - start_time} seconds")
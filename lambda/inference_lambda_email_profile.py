@@ -0,0 +1,174 @@
+import boto3
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import circuit_breaker
+import deadline
+import inference_lambda_email_names as email_names
+import inference_lambda_email_type as email_type
+
+# Created once per container and reused across invocations, one per call configuration
+runtime_clients = deadline.ClientCache(lambda config: boto3.client('sagemaker-runtime', config=config))
+
+# One breaker per endpoint, so an overloaded email-names endpoint does not stop email-type calls
+type_breaker = circuit_breaker.CircuitBreaker.from_env()
+names_breaker = circuit_breaker.CircuitBreaker.from_env()
+
+# Runs the email-names call next to the email-type call in concurrent mode
+executor = ThreadPoolExecutor(max_workers=1)
+
+PROFILE_MODE_CASCADE = "cascade"
+PROFILE_MODE_CONCURRENT = "concurrent"
+
+# Non-person probability above which the names are not extracted in cascade mode. Predictions
+# between NON_PERSON_THRESHOLD and this are uncertain, and still get their names extracted.
+SKIP_NAMES_PROBABILITY = float(os.environ.get("PROFILE_SKIP_NAMES_PROBABILITY", "0.97"))
+
+def classify_email(budget, body, input_data):
+    """
+    Classify the email address from the role address index, or else with the email-type endpoint.
+
+    Returns:
+    - tuple: The email type document and None, or None and the API error response to return.
+    """
+    role_result = email_type.get_role_address_result(body)
+    if role_result is not None:
+        return role_result, None
+
+    endpoint_name = os.environ.get("EMAIL_TYPE_ENDPOINT_NAME", "sagemaker-sigparser-llmops-staging-email-type")
+    try:
+        client = runtime_clients.get(budget)
+    except deadline.DeadlineExceeded as e:
+        print("Skipping the email-type endpoint call:", e)
+        return None, deadline.timeout_response(budget, "before_email_type", input_data)
+
+    response, error = circuit_breaker.invoke_endpoint(
+        type_breaker,
+        client,
+        timeout_response=lambda: deadline.timeout_response(budget, "email_type", input_data),
+        EndpointName=endpoint_name,
+        ContentType='text/csv',
+        Body=email_type.get_input_str(body),
+    )
+    if error is not None:
+        return None, error
+
+    result = json.loads(response['Body'].read().decode())
+    return {
+        "pred_email_type": email_type.get_email_type(result),
+        "response": email_type.get_prediction_result(result),
+        "invoked_production_variant": response.get("InvokedProductionVariant"),
+        "source": "endpoint",
+    }, None
+
+def extract_names(budget, body, input_data):
+    """
+    Call the email-names endpoint.
+
+    Returns:
+    - tuple: The email names document and None, or None and the API error response to return.
+    """
+    endpoint_name = os.environ.get("ENDPOINT_NAME", "sagemaker-sigparser-llmops-staging-email-names")
+    try:
+        client = runtime_clients.get(budget)
+    except deadline.DeadlineExceeded as e:
+        print("Skipping the email-names endpoint call:", e)
+        return None, deadline.timeout_response(budget, "before_email_names", input_data)
+
+    payload = email_names.get_payload(body["email_address"], body["email_display_name"])
+    response, error = circuit_breaker.invoke_endpoint(
+        names_breaker,
+        client,
+        timeout_response=lambda: deadline.timeout_response(budget, "email_names", input_data),
+        EndpointName=endpoint_name,
+        ContentType="application/json",
+        Body=json.dumps(payload),
+        CustomAttributes="accept_eula=true",
+    )
+    if error is not None:
+        return None, error
+
+    result = json.loads(response["Body"].read().decode("utf8"))
+    return {
+        "extracted_names": email_names.extract_names(result),
+        "invoked_production_variant": response.get("InvokedProductionVariant"),
+    }, None
+
+def needs_names(email_type_doc):
+    """
+    Check whether the names of an email address are worth extracting, i.e. it is not confidently Non-Person.
+    """
+    nonperson = email_type_doc["response"][0]["probabilities"]["non_person"]
+    return email_type_doc["pred_email_type"] == "Person" or nonperson <= SKIP_NAMES_PROBABILITY
+
+def lambda_handler(event, context):
+    """
+    Classify an email address and extract its names in one call.
+
+    In cascade mode, the default, the email-names endpoint is only called when the email-type
+    prediction is Person or uncertain. In concurrent mode both endpoints are called at once, for
+    the lowest latency at the cost of a name extraction for every request. The mode is set with
+    the PROFILE_MODE environment variable and can be overridden with "mode" in the request body.
+
+    Returns:
+    - dict: The API response with the email type and, if extracted, the email names.
+    """
+    start_time = time.time()
+    # Time left before the function times out, shared by both endpoint calls
+    budget = deadline.Deadline.from_context(context)
+
+    try:
+        body = json.loads(event.get("body", "{}"))
+    except Exception:
+        return circuit_breaker.error_response(400, "The body must be JSON")
+
+    missing = [key for key in ("email_address", "email_name", "email_display_name") if key not in body]
+    if missing:
+        return circuit_breaker.error_response(400, f"Missing {', '.join(missing)}")
+    mode = body.get("mode", os.environ.get("PROFILE_MODE", PROFILE_MODE_CASCADE))
+    if mode not in (PROFILE_MODE_CASCADE, PROFILE_MODE_CONCURRENT):
+        return circuit_breaker.error_response(400, f"mode must be {PROFILE_MODE_CASCADE} or {PROFILE_MODE_CONCURRENT}")
+
+    input_data = {key: body[key] for key in ("email_address", "email_name", "email_display_name")}
+    names_future = None
+    if mode == PROFILE_MODE_CONCURRENT:
+        names_future = executor.submit(extract_names, budget, body, input_data)
+
+    email_type_doc, error = classify_email(budget, body, input_data)
+    if error is not None:
+        if names_future is not None and not names_future.cancel():
+            # Lambda freezes the container once the handler returns, a names call left running
+            # would resume in the next invocation and hold up its own names call
+            wait([names_future], timeout=budget.remaining_s() if budget.expires_at is not None else None)
+        return error
+
+    names_doc = None
+    if names_future is not None:
+        names_doc, error = names_future.result()
+        names_status = "extracted"
+    elif needs_names(email_type_doc):
+        names_doc, error = extract_names(budget, body, input_data)
+        names_status = "extracted"
+    else:
+        names_status = "skipped_non_person"
+    if error is not None:
+        return error
+    print(f"Email type {email_type_doc['pred_email_type']}, names {names_status}, mode {mode}")
+
+    result = {
+        "input_data": input_data,
+        "mode": mode,
+        "email_type": email_type_doc,
+        "names_status": names_status,
+        "email_names": names_doc,
+    }
+    logging.info("Profile response: %s", result)
+    print(f"Total Lambda handler duration: {time.time() - start_time} seconds")
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps(result)
+    }
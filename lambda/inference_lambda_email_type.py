@@ -3,10 +3,89 @@ import json
 import os
 import logging
 
+import circuit_breaker
+import deadline
+import role_address_index
+
+# Created once per container and reused across invocations, one per call configuration.
+# Their timeouts and retries fit in the remaining time of an invocation.
+runtime_clients = deadline.ClientCache(lambda config: boto3.client('runtime.sagemaker', config=config))
+
+# Sheds load while the endpoint is throttling or timing out
+endpoint_breaker = circuit_breaker.CircuitBreaker.from_env()
+
+# Role and no-reply addresses answered without calling the endpoint, None when disabled
+role_index = role_address_index.load_index()
+
+# Remaining seconds below which optional work is skipped
+OPTIONAL_WORK_MIN_S = 1.0
+
+# Non-person probability above which an email address is classified as Non-Person
+NON_PERSON_THRESHOLD = 0.9
+
+def get_input_str(body):
+    return ', '.join([body["email_address"], body["email_name"], body["email_display_name"]])
+
+def get_prediction_result(result):
+    """
+    Format the probabilities of each classified sentence.
+
+    Args:
+    - result (list): The decoded endpoint response.
+
+    Returns:
+    - list: The input string and person/non-person probabilities of each sentence.
+    """
+    return [{
+        "input_string": item["sentence"],
+        "probabilities": {
+            "person": item["probabilities"][0],
+            "non_person": item["probabilities"][1]
+        }
+    } for item in result]
+
+def get_email_type(result):
+    """
+    Classify an email address as Person or Non-Person from the endpoint response.
+
+    Returns:
+    - str: 'Person' or 'Non-Person'.
+    """
+    probabilities = result[0]['probabilities']
+    nonperson = probabilities[1]
+    if nonperson > NON_PERSON_THRESHOLD:
+        return 'Non-Person'
+    return 'Person'
+
+def get_role_address_result(body):
+    """
+    Classify a role or no-reply email address from the role address index, without the endpoint.
+
+    Returns:
+    - dict: The email type document, in the schema of the endpoint path, or None if the address is not in the index.
+    """
+    if role_index is None:
+        return None
+    matched_rule = role_index.match(body["email_address"])
+    if matched_rule is None:
+        return None
+    return {
+        "pred_email_type": "Non-Person",
+        "response": [{
+            "input_string": get_input_str(body),
+            "probabilities": {"person": 0.0, "non_person": 1.0}
+        }],
+        "invoked_production_variant": None,
+        "source": "role_index",
+        "matched_rule": matched_rule,
+        "index_version": role_index.version,
+    }
+
 def lambda_handler(event, context):
+    # Time left before the function times out, shared by all the work below
+    budget = deadline.Deadline.from_context(context)
     #TODO: update the endpoint name for staging and production as needed
     endpoint_name = os.environ.get("ENDPOINT_NAME", "sagemaker-sigparser-llmops-staging-email-type")
-    runtime = boto3.client('runtime.sagemaker')
     #Getting payload from API endpoint
     body = ""
     try:
@@ -14,42 +93,48 @@ def lambda_handler(event, context):
     except Exception as e:
         return {"status": "bad request"}
     
-    input_str = ', '.join([body["email_address"], body["email_name"], body["email_display_name"]])
+    input_str = get_input_str(body)
 
     logging.info("Request received input_str: %s", input_str)
     
-    #Calling SageMaker endpoint
-    #add try catch block for the below
+    input_data = {key: body[key] for key in ("email_address", "email_name", "email_display_name")}
+
+    # Role and no-reply addresses are answered from the index, only the rest goes to the endpoint
+    role_result = get_role_address_result(body)
+    if role_result is not None:
+        logging.info("Matched role address rule %s", role_result["matched_rule"])
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json'
+            },
+            'body': json.dumps(role_result)
+        }
+
     try:
-        response = runtime.invoke_endpoint(EndpointName=endpoint_name,
-                                            ContentType='text/csv',
-                                            Body=input_str)
-        
-    except Exception as e:
-        print("Error invoking SageMaker endpoint:", e)
-        return {"status": "error"}
+        client = runtime_clients.get(budget)
+    except deadline.DeadlineExceeded as e:
+        print("Skipping the SageMaker endpoint call:", e)
+        return deadline.timeout_response(budget, "before_invoke_endpoint", input_data)
+
+    #Calling SageMaker endpoint, failing fast with 429/503 and Retry-After when it is overloaded
+    response, error = circuit_breaker.invoke_endpoint(endpoint_breaker, client,
+                                                      timeout_response=lambda: deadline.timeout_response(
+                                                          budget, "invoke_endpoint", input_data),
+                                                      EndpointName=endpoint_name,
+                                                      ContentType='text/csv',
+                                                      Body=input_str)
+    if error is not None:
+        return error
     
-    prediction = ""
+    # Production variant that served the request, to compare latency between variants
+    invoked_variant = response.get("InvokedProductionVariant")
     result = json.loads(response['Body'].read().decode())
     
-    prediction_result = [{
-        "input_string": item["sentence"],
-        "probabilities": {
-            "person": item["probabilities"][0],
-            "non_person": item["probabilities"][1]
-        }
-    } for item in result]
+    prediction_result = get_prediction_result(result)
     
     #Parsing result
-    probabilities = result[0]['probabilities']
-    person = probabilities[0]
-    nonperson = probabilities[1]
-    
-    if nonperson > 0.9:
-        prediction = 'Non-Person'
-    else:
-        prediction = 'Person'
-        
+    prediction = get_email_type(result)
 
     #Return result to API
     response =     {
@@ -59,8 +144,12 @@ def lambda_handler(event, context):
         },
         'body': json.dumps({
             "pred_email_type": prediction,
-            "response": prediction_result
+            "response": prediction_result,
+            "invoked_production_variant": invoked_variant,
+            "source": "endpoint"
         })
     }
-    logging.info("API response: %s", response)
+    # Logging the whole response is optional work, skipped when little time is left
+    if budget.has_budget(OPTIONAL_WORK_MIN_S):
+        logging.info("API response: %s", response)
     return response
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+Input budget and generation parameters of the email-names prompt.
+
+Some display names carry a whole signature: job titles, company names, phone numbers, addresses
+and links. They lengthen the prompt the model prefills, while a fixed max_new_tokens reserves
+room for an answer that a short name never needs. Before a display name goes into the prompt,
+obvious noise is stripped and the name is cut to a character budget. max_new_tokens is then sized
+from the words left to parse, and never exceeds the former fixed value.
+"""
+
+import math
+import os
+import re
+
+# Characters of the display name kept in the prompt
+MAX_DISPLAY_NAME_CHARS = int(os.environ.get("DISPLAY_NAME_MAX_CHARS", "80"))
+
+# The answer of five name components without the names takes about BASE_NEW_TOKENS tokens, each
+# name word adds up to NEW_TOKENS_PER_WORD. Words beyond MAX_NAME_WORDS are titles or company
+# names that are not part of the answer.
+BASE_NEW_TOKENS = 56
+NEW_TOKENS_PER_WORD = 4
+MAX_NAME_WORDS = 6
+MAX_NEW_TOKENS = int(os.environ.get("NAMES_MAX_NEW_TOKENS", "100"))
+
+# Rough number of characters per token of the Mistral tokenizer
+CHARS_PER_TOKEN = 4
+
+SAMPLING_PARAMETERS = {"temperature": 0.1, "top_p": 0.1}
+
+EMAIL_PATTERN = re.compile(r"<?[\w.+'\-]+@[\w\-]+(\.[\w\-]+)+>?")
+URL_PATTERN = re.compile(r"(https?://|www\.)\S+", re.IGNORECASE)
+PHONE_PATTERN = re.compile(r"\+?\d[\d\s().\-]{6,}\d")
+# Separators between the name and the rest of a signature, e.g. "John Doe | VP Sales - Acme"
+SEGMENT_SEPARATOR_PATTERN = re.compile(r"\s+[-–—/~•·]+\s+|\s*\|+\s*|[\r\n\t]+")
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+# Context of the offline email-names rows, as built by get_context of the Lambda
+CONTEXT_PATTERN = re.compile(r'"Email Address": "(?P<email_address>.*?)", "Display Name": "(?P<display_name>.*)"\}\s*$',
+                             re.DOTALL)
+
+
+def is_enabled(enabled=None):
+    if enabled is not None:
+        return enabled
+    return os.environ.get("NAME_INPUT_BUDGET_ENABLED", "true").lower() != "false"
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_words(text, max_chars):
+    """
+    Cut a text to at most max_chars characters, at a word boundary when there is one.
+    """
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars + 1].rsplit(" ", 1)[0] if " " in text[:max_chars + 1] else text[:max_chars]
+    return cut[:max_chars].rstrip(" ,;:-")
+
+
+def clean_display_name(display_name, max_chars=None):
+    """
+    Strip the noise of a display name and cut it to a character budget.
+
+    Email addresses, links and phone numbers are removed. The remaining segments of a signature
+    are kept in order while they fit in the budget, so the name, which usually comes first,
+    survives. A display name made only of noise is cut to the budget as is.
+
+    Args:
+    - display_name (str): The display name.
+    - max_chars (int): Character budget, by default MAX_DISPLAY_NAME_CHARS.
+
+    Returns:
+    - str: The cleaned display name.
+    """
+    max_chars = MAX_DISPLAY_NAME_CHARS if max_chars is None else max_chars
+    original = re.sub(r"\s+", " ", display_name).strip()
+    text = EMAIL_PATTERN.sub(" ", display_name)
+    text = URL_PATTERN.sub(" ", text)
+    text = PHONE_PATTERN.sub(" ", text)
+
+    segments = [re.sub(r"\s+", " ", segment).strip(" ,;:\"'()[]<>")
+                for segment in SEGMENT_SEPARATOR_PATTERN.split(text)]
+    segments = [segment for segment in segments if WORD_PATTERN.search(segment)]
+    if not segments:
+        return truncate_words(original, max_chars)
+
+    cleaned = segments[0]
+    for segment in segments[1:]:
+        if len(cleaned) + len(" | ") + len(segment) > max_chars:
+            break
+        cleaned = f"{cleaned} | {segment}"
+    return truncate_words(cleaned, max_chars)
+
+
+def get_max_new_tokens(email_address, display_name):
+    """
+    Size max_new_tokens from the words of the display name, or of the local part when the name has fewer.
+    """
+    local_part = email_address.split("@", 1)[0]
+    words = max(len(WORD_PATTERN.findall(display_name)), len(WORD_PATTERN.findall(local_part)))
+    return min(MAX_NEW_TOKENS, BASE_NEW_TOKENS + NEW_TOKENS_PER_WORD * min(words, MAX_NAME_WORDS))
+
+
+def prepare_name_input(email_address, display_name, enabled=None):
+    """
+    Clean the display name of a record and choose its generation parameters.
+
+    Args:
+    - email_address (str): The email address.
+    - display_name (str): The display name.
+    - enabled (bool): Apply the budget, by default unless NAME_INPUT_BUDGET_ENABLED is false.
+
+    Returns:
+    - tuple: The display name to prompt with and the generation parameters.
+    """
+    if not is_enabled(enabled):
+        return display_name, {"max_new_tokens": MAX_NEW_TOKENS, **SAMPLING_PARAMETERS}
+    display_name = clean_display_name(display_name)
+    return display_name, {"max_new_tokens": get_max_new_tokens(email_address, display_name), **SAMPLING_PARAMETERS}
+
+
+def prepare_context(context, enabled=None):
+    """
+    Apply prepare_name_input to the display name of a prompt context built by get_context.
+
+    Returns:
+    - tuple: The context and the generation parameters, the context as is when it has no display name.
+    """
+    match = CONTEXT_PATTERN.search(context)
+    if match is None or not is_enabled(enabled):
+        return context, {"max_new_tokens": MAX_NEW_TOKENS, **SAMPLING_PARAMETERS}
+    display_name, parameters = prepare_name_input(match.group("email_address"), match.group("display_name"), True)
+    return context[:match.start("display_name")] + display_name + context[match.end("display_name"):], parameters
@@ -0,0 +1,135 @@
+"""
+Fast path of the email-type classification for role and no-reply addresses.
+
+Addresses like noreply@, info@ or support@, and addresses on known bulk-sender domains, are
+Non-Person without asking the model. The index of these local parts and domains is built offline
+by utils/build_role_address_index.py and shipped with the Lambda code as role_address_index.json.
+It is loaded once per container and answers in microseconds: local parts are looked up in a hash
+set after normalization, local part prefixes in a trie, and domains in a hash set with each of
+their parent domains.
+"""
+
+import json
+import os
+import re
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "role_address_index.json")
+
+# Marks the end of a prefix in the trie
+TRIE_END = "$"
+
+
+def normalize_local_part(local_part):
+    """
+    Normalize the local part of an email address, so that no-reply, no_reply, NoReply+news and noreply2 match noreply.
+    """
+    local_part = local_part.strip().lower().split("+", 1)[0]
+    local_part = re.sub(r"[.\-_]", "", local_part)
+    return re.sub(r"\d+$", "", local_part)
+
+
+def split_email_address(email_address):
+    """
+    Split an email address into its normalized local part and its lower case domain, None if it is not an address.
+    """
+    local_part, separator, domain = email_address.strip().rpartition("@")
+    if not separator or not local_part or not domain:
+        return None
+    return normalize_local_part(local_part), domain.lower().rstrip(".")
+
+
+def build_trie(prefixes):
+    trie = {}
+    for prefix in prefixes:
+        node = trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[TRIE_END] = True
+    return trie
+
+
+class RoleAddressIndex():
+    """
+    Index of local parts, local part prefixes and domains of Non-Person email addresses.
+
+    Args:
+    - local_parts (iterable): Normalized local parts, e.g. "noreply".
+    - local_part_prefixes (iterable): Normalized local part prefixes, e.g. "donotreply".
+    - domains (iterable): Domains whose addresses, including those of their subdomains, are all Non-Person.
+    - version (str): Version of the index, reported with each match.
+    """
+    def __init__(self, local_parts=(), local_part_prefixes=(), domains=(), version=None):
+        self.local_parts = frozenset(local_parts)
+        self.local_part_prefixes = tuple(local_part_prefixes)
+        self.domains = frozenset(domains)
+        self.version = version
+        self._trie = build_trie(self.local_part_prefixes)
+
+    @classmethod
+    def from_dict(cls, index):
+        return cls(
+            local_parts=index.get("local_parts", []),
+            local_part_prefixes=index.get("local_part_prefixes", []),
+            domains=index.get("domains", []),
+            version=index.get("version"),
+        )
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def __len__(self):
+        return len(self.local_parts) + len(self.local_part_prefixes) + len(self.domains)
+
+    def _match_prefix(self, local_part):
+        node = self._trie
+        for i, char in enumerate(local_part):
+            node = node.get(char)
+            if node is None:
+                return None
+            if TRIE_END in node:
+                return local_part[:i + 1]
+        return None
+
+    def match(self, email_address):
+        """
+        Match an email address against the index.
+
+        Returns:
+        - str: The rule that matched, e.g. "local_part:noreply" or "domain:mailchimp.com", else None.
+        """
+        parts = split_email_address(email_address)
+        if parts is None:
+            return None
+        local_part, domain = parts
+        if local_part in self.local_parts:
+            return f"local_part:{local_part}"
+        prefix = self._match_prefix(local_part)
+        if prefix is not None:
+            return f"local_part_prefix:{prefix}"
+        labels = domain.split(".")
+        for i in range(len(labels) - 1):
+            parent = ".".join(labels[i:])
+            if parent in self.domains:
+                return f"domain:{parent}"
+        return None
+
+
+def load_index(path=None):
+    """
+    Load the index shipped with the Lambda code, or the one at ROLE_INDEX_PATH.
+
+    Returns None when the fast path is disabled with ROLE_INDEX_ENABLED=false or the index cannot
+    be loaded, so every request goes to the endpoint.
+    """
+    if os.environ.get("ROLE_INDEX_ENABLED", "true").lower() == "false":
+        return None
+    path = path or os.environ.get("ROLE_INDEX_PATH", DEFAULT_INDEX_PATH)
+    try:
+        index = RoleAddressIndex.from_file(path)
+    except (OSError, ValueError) as e:
+        print(f"Role address index not loaded from {path}:", e)
+        return None
+    print(f"Loaded role address index {index.version} with {len(index)} entries")
+    return index
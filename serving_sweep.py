@@ -0,0 +1,314 @@
+"""
+This script compares TGI serving settings of the email-names endpoint locally, to tune the "serving" entry of
+model_configs.json.
+
+It drives the endpoint emulator of api_load_tests with email-names payloads built by the Lambda,
+from a fixed number of concurrent clients, for every combination of the settings given. The
+emulator admits and batches requests like TGI: it rejects requests beyond TgiMaxConcurrentRequests
+and prompts beyond TgiMaxInputLength. It prefills at most TgiMaxBatchPrefillTokens prompt tokens at
+once and decodes the requests whose tokens fit in TgiMaxBatchTotalTokens, with slower decode steps
+in larger batches. Sharding and quantization scale the per-token times and the KV cache by the rough
+factors below, so compare settings relative to each other and calibrate --decode-ms-per-token with a
+real load test. The recommended setting is the one with the highest throughput meeting the p99
+latency and error rate objectives, written with the same keys as model_configs.json, e.g.:
+
+    python serving_sweep.py --stack email_names --max-batch-total-tokens auto,8000,16000 --quantize none,eetq \
+        --clients 64 --duration 10 --output serving-recommendation.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import botocore.exceptions
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api_load_tests"))
+# The email-names Lambda builds the payloads, and imports its sibling modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "lambda"))
+
+import circuit_breaker  # noqa: E402
+from build_deployment_configs import TGI_SERVING_DEFAULTS, get_serving_params, get_variants  # noqa: E402
+from endpoint_emulator import EmulatedSageMakerRuntime  # noqa: E402
+
+# Decode speedup of sharding over n GPUs is about n ** SHARD_SPEEDUP_EXPONENT, tensor parallelism being sublinear
+SHARD_SPEEDUP_EXPONENT = 0.7
+
+# Rough per-token time factor and KV cache size factor of each quantization mode, against fp16 weights
+QUANTIZE_PROFILES = {
+    "": (1.0, 1.0),
+    "bitsandbytes": (1.4, 1.5),
+    "bitsandbytes-nf4": (1.6, 2.0),
+    "bitsandbytes-fp4": (1.6, 2.0),
+    "eetq": (1.0, 1.5),
+    "fp8": (0.8, 1.5),
+}
+
+# Settings swept from the command line and their values that stand for an empty setting
+SWEPT_SETTINGS = {
+    "TgiMaxConcurrentRequests": "max_concurrent_requests",
+    "TgiMaxBatchPrefillTokens": "max_batch_prefill_tokens",
+    "TgiMaxBatchTotalTokens": "max_batch_total_tokens",
+    "TgiNumShard": "num_shard",
+    "TgiQuantize": "quantize",
+}
+EMPTY_VALUES = ("auto", "none")
+
+FIRST_NAMES = ["John", "Emma", "David", "Maria", "Wei", "Aisha", "Lucas", "Sofia"]
+LAST_NAMES = ["Doe", "Smith", "Brown", "Garcia", "Chen", "Khan", "Silva", "Rossi"]
+
+
+def generate_payloads(count, noisy_ratio, seed=0):
+    """
+    Build email-names payloads with the Lambda, a share of which have signature display names.
+    """
+    import inference_lambda_email_names as email_names
+
+    rng = random.Random(seed)
+    payloads = []
+    for _ in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        display_name = f"{first} {last}"
+        if rng.random() < noisy_ratio:
+            display_name += f" | Senior Account Executive | Acme Corp | +1 (555) {rng.randint(100, 999)}-0100"
+        payloads.append(json.dumps(email_names.get_payload(f"{first}.{last}@acme.com".lower(), display_name)))
+    return payloads
+
+
+def get_kv_cache_tokens(serving, kv_cache_tokens_per_gpu):
+    """
+    Estimate the tokens TGI can batch when TgiMaxBatchTotalTokens is empty, from the free GPU memory.
+    """
+    _, memory_factor = QUANTIZE_PROFILES[serving["TgiQuantize"]]
+    return int(kv_cache_tokens_per_gpu * int(serving["TgiNumShard"]) * memory_factor)
+
+
+def create_emulator(serving, args):
+    """
+    Create an endpoint emulator that serves like TGI with the given settings.
+    """
+    time_factor, _ = QUANTIZE_PROFILES[serving["TgiQuantize"]]
+    speedup = int(serving["TgiNumShard"]) ** SHARD_SPEEDUP_EXPONENT
+    kv_cache_tokens = get_kv_cache_tokens(serving, args.kv_cache_tokens)
+    max_concurrent_requests = int(serving["TgiMaxConcurrentRequests"])
+    return EmulatedSageMakerRuntime(
+        latency_ms=args.latency_ms,
+        latency_cv=args.latency_cv,
+        concurrency=max_concurrent_requests,
+        seed=args.seed,
+        prefill_ms_per_token=args.prefill_ms_per_token * time_factor / speedup,
+        decode_ms_per_token=args.decode_ms_per_token * time_factor / speedup,
+        batch_decode_factor=args.batch_decode_factor,
+        max_concurrent_requests=max_concurrent_requests,
+        max_input_tokens=int(serving["TgiMaxInputLength"]),
+        max_total_tokens=int(serving["TgiMaxTotalTokens"]),
+        max_batch_prefill_tokens=int(serving["TgiMaxBatchPrefillTokens"]),
+        max_batch_total_tokens=int(serving["TgiMaxBatchTotalTokens"] or kv_cache_tokens),
+    )
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run_load(emulator, payloads, clients, duration_s):
+    """
+    Send payloads from concurrent clients for a duration, each client sending its next request when the last one
+    returns.
+
+    Returns:
+    - dict: Throughput in requests per second, latency percentiles in seconds and error counts.
+    """
+    lock = threading.Lock()
+    latencies = []
+    errors = {"throttled": 0, "model_error": 0, "other": 0}
+    stop_at = time.perf_counter() + duration_s
+
+    def client(index):
+        i = index
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                emulator.invoke_endpoint(EndpointName="email-names", Body=payloads[i % len(payloads)],
+                                         ContentType="application/json", CustomAttributes="accept_eula=true")
+                kind = None
+            except botocore.exceptions.ClientError as e:
+                # A ModelError wrapping the 429 of TGI is a throttle, as the Lambdas classify it
+                if circuit_breaker.classify_error(e) == circuit_breaker.OVERLOAD_THROTTLE:
+                    kind = "throttled"
+                else:
+                    kind = {"ModelError": "model_error"}.get(e.response["Error"]["Code"], "other")
+            latency = time.perf_counter() - start
+            with lock:
+                if kind is None:
+                    latencies.append(latency)
+                else:
+                    errors[kind] += 1
+            if kind == "throttled":
+                # Back off like a client honoring Retry-After would, instead of spinning
+                time.sleep(0.05)
+            i += clients
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    total = len(latencies) + sum(errors.values())
+    return {
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_s": percentile(latencies, 0.5),
+        "p95_s": percentile(latencies, 0.95),
+        "p99_s": percentile(latencies, 0.99),
+        "error_rate": sum(errors.values()) / total if total else 0.0,
+        **errors,
+    }
+
+
+def get_candidates(base_serving, grid):
+    """
+    Combine the swept values with the other settings of the stack.
+
+    Returns:
+    - list: Serving settings dictionaries, one per combination.
+    """
+    keys = list(grid)
+    return [{**base_serving, **dict(zip(keys, values))} for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def sweep(candidates, model_config, payloads, args):
+    """
+    Validate and load test every candidate setting.
+
+    Returns:
+    - list: One result dictionary per setting, with a "skipped" reason for the settings that cannot be deployed.
+    """
+    variants = get_variants(model_config)
+    results = []
+    for serving in candidates:
+        result = {"serving": serving}
+        try:
+            get_serving_params({"serving": serving}, variants)
+        except Exception as e:
+            result["skipped"] = str(e)
+            results.append(result)
+            continue
+        kv_cache_tokens = get_kv_cache_tokens(serving, args.kv_cache_tokens)
+        if serving["TgiMaxBatchTotalTokens"] and int(serving["TgiMaxBatchTotalTokens"]) > kv_cache_tokens:
+            result["skipped"] = f"TgiMaxBatchTotalTokens exceeds the estimated KV cache of {kv_cache_tokens} tokens"
+            results.append(result)
+            continue
+        result.update(run_load(create_emulator(serving, args), payloads, args.clients, args.duration))
+        results.append(result)
+    return results
+
+
+def recommend(results, max_p99_latency_s, max_error_rate):
+    """
+    Pick the setting with the highest throughput meeting the p99 latency and error rate objectives.
+
+    Returns:
+    - dict: The recommended settings as model_configs.json values, or None if no setting meets the objectives.
+    """
+    feasible = [result for result in results if "skipped" not in result and result["p99_s"] is not None
+                and result["p99_s"] <= max_p99_latency_s and result["error_rate"] <= max_error_rate]
+    if not feasible:
+        return None
+    return max(feasible, key=lambda result: (round(result["throughput_rps"], 1), -result["p99_s"]))["serving"]
+
+
+def parse_list(value, type_=str):
+    return ["" if item in EMPTY_VALUES else str(type_(item)) for item in value.split(",") if item]
+
+
+def print_results(results):
+    print(f"{'max_req':>8} {'prefill':>8} {'batch':>8} {'shard':>5} {'quantize':>16} {'rps':>8} {'p50':>7} "
+          f"{'p99':>7} {'errors':>7}")
+    for result in results:
+        serving = result["serving"]
+        settings = (f"{serving['TgiMaxConcurrentRequests']:>8} {serving['TgiMaxBatchPrefillTokens']:>8} "
+                    f"{serving['TgiMaxBatchTotalTokens'] or 'auto':>8} {serving['TgiNumShard']:>5} "
+                    f"{serving['TgiQuantize'] or 'none':>16}")
+        if "skipped" in result:
+            print(f"{settings} skipped: {result['skipped']}")
+            continue
+        p50 = f"{result['p50_s']:>7.2f}" if result["p50_s"] is not None else f"{'-':>7}"
+        p99 = f"{result['p99_s']:>7.2f}" if result["p99_s"] is not None else f"{'-':>7}"
+        print(f"{settings} {result['throughput_rps']:>8.1f} {p50} {p99} {result['error_rate']:>7.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stack", default="email_names", help="Key of the stack in model_configs.json")
+    parser.add_argument("--model-configs", default="model_configs.json")
+    parser.add_argument("--max-concurrent-requests",
+                        help="Comma separated TgiMaxConcurrentRequests values, by default the current one")
+    parser.add_argument("--max-batch-prefill-tokens",
+                        help="Comma separated TgiMaxBatchPrefillTokens values, by default the current one")
+    parser.add_argument("--max-batch-total-tokens", default="auto,8000,16000",
+                        help="Comma separated TgiMaxBatchTotalTokens values, "
+                             "auto to size the batch from the KV cache")
+    parser.add_argument("--num-shard", help="Comma separated TgiNumShard values, by default the current one")
+    parser.add_argument("--quantize", default="none,eetq",
+                        help="Comma separated TgiQuantize values, none for fp16. Only the modes TGI applies on the fly "
+                             "are supported")
+    parser.add_argument("--clients", type=int, default=64, help="Concurrent clients sending requests")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load per setting")
+    parser.add_argument("--records", type=int, default=200, help="Number of distinct payloads")
+    parser.add_argument("--noisy-ratio", type=float, default=0.2,
+                        help="Share of payloads with a signature display name")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Overhead of a request outside of the model")
+    parser.add_argument("--latency-cv", type=float, default=0.2)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.2,
+                        help="Prefill time per prompt token of one unquantized shard")
+    parser.add_argument("--decode-ms-per-token", type=float, default=25,
+                        help="Decode time per generated token of one unquantized shard")
+    parser.add_argument("--batch-decode-factor", type=float, default=0.05,
+                        help="Slowdown of a decode step per other request in the batch")
+    parser.add_argument("--kv-cache-tokens", type=int, default=50000,
+                        help="Tokens the KV cache of one GPU holds with fp16 weights")
+    parser.add_argument("--max-p99-latency", type=float, default=5.0, help="Objective for the p99 latency in seconds")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Objective for the share of failed requests")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file to write the results and recommendation to")
+    parser.add_argument("--apply", action="store_true", help="Write the recommendation into the model configs file")
+    args = parser.parse_args()
+
+    with open(args.model_configs, "r") as f:
+        model_configs = json.load(f)
+    model_config = model_configs[args.stack]
+    base_serving = {key: str(model_config.get("serving", {}).get(key, default))
+                    for key, default in TGI_SERVING_DEFAULTS.items()}
+
+    grid = {}
+    for key, option in SWEPT_SETTINGS.items():
+        value = getattr(args, option)
+        grid[key] = parse_list(value) if value else [base_serving[key]]
+
+    payloads = generate_payloads(args.records, args.noisy_ratio, seed=args.seed)
+    candidates = get_candidates(base_serving, grid)
+    print(f"Sweeping {len(candidates)} serving settings with {args.clients} clients for {args.duration} seconds each")
+    results = sweep(candidates, model_config, payloads, args)
+    print_results(results)
+
+    recommendation = recommend(results, args.max_p99_latency, args.max_error_rate)
+    print(f"Recommendation for {args.stack}: {recommendation}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"stack": args.stack, "results": results, "recommendation": recommendation}, f, indent=4)
+    if args.apply and recommendation:
+        model_config["serving"] = recommendation
+        with open(args.model_configs, "w") as f:
+            json.dump(model_configs, f, indent=2)
+            f.write("\n")
@@ -0,0 +1,14 @@
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The Lambda modules import their siblings, and the load test modules are run from their directory
+for path in (ROOT_DIR, os.path.join(ROOT_DIR, "lambda"), os.path.join(ROOT_DIR, "api_load_tests")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Clients are created at import time by some modules, they never reach AWS in the tests
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
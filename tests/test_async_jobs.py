@@ -0,0 +1,180 @@
+import json
+from io import BytesIO
+
+import boto3
+import botocore.exceptions
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+
+import async_jobs
+import circuit_breaker
+import deadline
+
+JOB_ID = "0123456789abcdef0123456789abcdef"
+
+
+def create_s3_store():
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    return async_jobs.S3JobStore(s3_client, "bucket", "async-inference/staging"), Stubber(s3_client)
+
+
+def get_object_response(text):
+    return {"Body": StreamingBody(BytesIO(text.encode("utf-8")), len(text))}
+
+
+def test_s3_job_store_polls_pending_job():
+    store, stubber = create_s3_store()
+    job = {
+        "job_id": JOB_ID,
+        "submitted_at": 0,
+        "records": [{
+            "index": 0,
+            "input": {"email_address": "john.doe@acme.com"},
+            "output_location": "s3://bucket/async-inference/staging/output/0.out",
+            "failure_location": "s3://bucket/async-inference/staging/failure/0.out",
+        }],
+    }
+    stubber.add_response("get_object", get_object_response(json.dumps(job)),
+                         {"Bucket": "bucket", "Key": f"async-inference/staging/jobs/{JOB_ID}.json"})
+    # The output is not written yet, and the failure location comes back as a bare 404
+    stubber.add_client_error("get_object", service_error_code="NoSuchKey", http_status_code=404)
+    stubber.add_client_error("get_object", service_error_code="404", http_status_code=404)
+
+    with stubber:
+        result = async_jobs.collect_job(JOB_ID, store, lambda output: output)
+
+    assert result["status"] == async_jobs.JOB_STATUS_IN_PROGRESS
+    assert result["pending"] == 1
+    stubber.assert_no_pending_responses()
+
+
+def test_s3_job_store_raises_access_denied():
+    # Missing permissions must not look like an output that is not written yet
+    store, stubber = create_s3_store()
+    stubber.add_client_error("get_object", service_error_code="AccessDenied", http_status_code=403)
+
+    with stubber:
+        try:
+            store.read(store.job_location(JOB_ID))
+        except store.s3_client.exceptions.ClientError as e:
+            assert e.response["Error"]["Code"] == "AccessDenied"
+        else:
+            raise AssertionError("AccessDenied was read as a missing object")
+
+
+class FailingSubmitter():
+    """
+    LocalSubmitter failing the submission of some records.
+    """
+    def __init__(self, directory, failing_indexes, error):
+        self.submitter = async_jobs.LocalSubmitter(directory)
+        self.failing_indexes = failing_indexes
+        self.error = error
+
+    def submit(self, input_location, inference_id):
+        if int(inference_id.rsplit("-", 1)[1]) in self.failing_indexes:
+            raise self.error
+        return self.submitter.submit(input_location, inference_id)
+
+
+def build_payload(record):
+    return {"inputs": record["email_address"]}
+
+
+def predict(payload):
+    if payload["inputs"].startswith("bad"):
+        raise ValueError("Cannot extract names")
+    return [{"generated_text": payload["inputs"].split("@")[0]}]
+
+
+def parse_output(output):
+    return output[0]["generated_text"]
+
+
+def create_local_backend(tmp_path):
+    return async_jobs.LocalJobStore(str(tmp_path / "jobs")), async_jobs.LocalSubmitter(str(tmp_path / "endpoint"))
+
+
+def test_local_job_completes_after_processing(tmp_path):
+    store, submitter = create_local_backend(tmp_path)
+    records = [{"email_address": f"user{i}@acme.com"} for i in range(3)]
+
+    job = async_jobs.submit_job(records, build_payload, store, submitter)
+    result = async_jobs.collect_job(job["job_id"], store, parse_output)
+    assert result["status"] == async_jobs.JOB_STATUS_IN_PROGRESS
+    assert result["pending"] == 3
+
+    assert submitter.process(predict, max_requests=2) == 2
+    result = async_jobs.collect_job(job["job_id"], store, parse_output)
+    assert (result["status"], result["completed"], result["pending"]) == (async_jobs.JOB_STATUS_IN_PROGRESS, 2, 1)
+
+    submitter.process(predict)
+    result = async_jobs.collect_job(job["job_id"], store, parse_output)
+    assert result["status"] == async_jobs.JOB_STATUS_COMPLETED
+    assert [record["output"] for record in result["results"]] == ["user0", "user1", "user2"]
+
+
+def test_local_job_with_failed_inference(tmp_path):
+    store, submitter = create_local_backend(tmp_path)
+    records = [{"email_address": "user0@acme.com"}, {"email_address": "bad@acme.com"}]
+
+    job = async_jobs.submit_job(records, build_payload, store, submitter)
+    submitter.process(predict)
+    result = async_jobs.collect_job(job["job_id"], store, parse_output)
+
+    assert (result["status"], result["completed"], result["failed"]) == (async_jobs.JOB_STATUS_COMPLETED, 1, 1)
+    assert "Cannot extract names" in result["results"][1]["error"]
+
+
+def test_partially_submitted_job_keeps_failed_records(tmp_path):
+    store = async_jobs.LocalJobStore(str(tmp_path / "jobs"))
+    submitter = FailingSubmitter(str(tmp_path / "endpoint"), {1}, RuntimeError("Connection reset"))
+    records = [{"email_address": f"user{i}@acme.com"} for i in range(3)]
+
+    job = async_jobs.submit_job(records, build_payload, store, submitter)
+    assert job["records"][1]["status"] == async_jobs.JOB_STATUS_FAILED
+
+    submitter.submitter.process(predict)
+    result = async_jobs.collect_job(job["job_id"], store, parse_output)
+    assert (result["status"], result["completed"], result["failed"]) == (async_jobs.JOB_STATUS_COMPLETED, 2, 1)
+    assert result["results"][1]["error"] == "RuntimeError: Connection reset"
+
+
+def test_job_fails_when_no_record_is_submitted(tmp_path):
+    store = async_jobs.LocalJobStore(str(tmp_path / "jobs"))
+    submitter = FailingSubmitter(str(tmp_path / "endpoint"), {0, 1}, RuntimeError("Connection reset"))
+    records = [{"email_address": f"user{i}@acme.com"} for i in range(2)]
+
+    job = async_jobs.submit_job(records, build_payload, store, submitter)
+    result = async_jobs.collect_job(job["job_id"], store, parse_output)
+
+    assert result["status"] == async_jobs.JOB_STATUS_FAILED
+    assert result["failed"] == 2
+
+
+def test_open_breaker_stops_submissions(tmp_path):
+    store = async_jobs.LocalJobStore(str(tmp_path / "jobs"))
+    throttle = botocore.exceptions.ClientError(
+        {"Error": {"Code": "ThrottlingException"}, "ResponseMetadata": {"HTTPStatusCode": 400}}, "InvokeEndpointAsync"
+    )
+    submitter = FailingSubmitter(str(tmp_path / "endpoint"), set(range(10)), throttle)
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=1, cooldown_s=60)
+    records = [{"email_address": f"user{i}@acme.com"} for i in range(10)]
+
+    job = async_jobs.submit_job(records, build_payload, store, submitter, breaker=breaker)
+
+    assert breaker.state == circuit_breaker.CIRCUIT_OPEN
+    assert all(record["status"] == async_jobs.JOB_STATUS_FAILED for record in job["records"])
+    assert any(record["error"] == "Not submitted, the endpoint is overloaded" for record in job["records"])
+
+
+def test_expired_deadline_stops_submissions(tmp_path):
+    store, submitter = create_local_backend(tmp_path)
+    records = [{"email_address": f"user{i}@acme.com"} for i in range(3)]
+
+    job = async_jobs.submit_job(records, build_payload, store, submitter,
+                                budget=deadline.Deadline.from_timeout(async_jobs.SUBMIT_MIN_S / 2))
+    result = async_jobs.collect_job(job["job_id"], store, parse_output)
+
+    assert result["status"] == async_jobs.JOB_STATUS_FAILED
+    assert all(record["error"] == "Not submitted before the request deadline" for record in result["results"])
@@ -0,0 +1,104 @@
+import time
+
+import botocore.exceptions
+
+import circuit_breaker
+from endpoint_emulator import (ERROR_MODEL, ERROR_OVERLOADED, ERROR_THROTTLE, ERROR_TIMEOUT,
+                               EmulatedSageMakerRuntime)
+
+BODY = "john.doe@acme.com, John Doe, John Doe"
+
+
+def create_runtime():
+    return EmulatedSageMakerRuntime(latency_ms=1, latency_cv=0, seed=0)
+
+
+def invoke(breaker, runtime):
+    return circuit_breaker.invoke_endpoint(
+        breaker, runtime, EndpointName="email-type", Body=BODY, ContentType="text/csv"
+    )
+
+
+def get_error(runtime, kind):
+    runtime.inject_errors(kind)
+    try:
+        runtime.invoke_endpoint(EndpointName="email-type", Body=BODY, ContentType="text/csv")
+    except Exception as e:
+        return e
+    raise AssertionError(f"No {kind} error was raised")
+
+
+def test_classify_error():
+    runtime = create_runtime()
+    assert circuit_breaker.classify_error(get_error(runtime, ERROR_THROTTLE)) == circuit_breaker.OVERLOAD_THROTTLE
+    assert circuit_breaker.classify_error(get_error(runtime, ERROR_TIMEOUT)) == circuit_breaker.OVERLOAD_TIMEOUT
+    # The 429 of the model container, wrapped in a ModelError
+    assert circuit_breaker.classify_error(get_error(runtime, ERROR_OVERLOADED)) == circuit_breaker.OVERLOAD_THROTTLE
+    # A 500 of the model container is an answer, not an overload
+    assert circuit_breaker.classify_error(get_error(runtime, ERROR_MODEL)) is None
+
+
+def test_classify_error_of_other_errors():
+    connect_timeout = botocore.exceptions.ConnectTimeoutError(endpoint_url="https://runtime.sagemaker.local")
+    assert circuit_breaker.classify_error(connect_timeout) == circuit_breaker.OVERLOAD_TIMEOUT
+    gateway_timeout = botocore.exceptions.ClientError(
+        {"Error": {"Code": "InternalFailure"}, "ResponseMetadata": {"HTTPStatusCode": 504}}, "InvokeEndpoint"
+    )
+    assert circuit_breaker.classify_error(gateway_timeout) == circuit_breaker.OVERLOAD_TIMEOUT
+    validation = botocore.exceptions.ClientError(
+        {"Error": {"Code": "ValidationError"}, "ResponseMetadata": {"HTTPStatusCode": 400}}, "InvokeEndpoint"
+    )
+    assert circuit_breaker.classify_error(validation) is None
+    assert circuit_breaker.classify_error(ValueError("not a botocore error")) is None
+
+
+def test_breaker_opens_half_opens_and_closes():
+    runtime = create_runtime()
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=3, cooldown_s=0.2)
+
+    runtime.inject_errors(ERROR_THROTTLE, 3)
+    for _ in range(3):
+        _, error = invoke(breaker, runtime)
+        assert error["statusCode"] == 429
+    assert breaker.state == circuit_breaker.CIRCUIT_OPEN
+
+    # While open, requests are shed without calling the endpoint
+    _, error = invoke(breaker, runtime)
+    assert error["statusCode"] == 503
+    assert "Retry-After" in error["headers"]
+    assert runtime.invocations == 0
+
+    time.sleep(0.25)
+    response, error = invoke(breaker, runtime)
+    assert error is None
+    assert response["InvokedProductionVariant"] == "AllTraffic"
+    assert breaker.state == circuit_breaker.CIRCUIT_CLOSED
+    assert runtime.invocations == 1
+
+
+def test_failed_probe_reopens_breaker():
+    runtime = create_runtime()
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=1, cooldown_s=0.2)
+
+    runtime.inject_errors(ERROR_OVERLOADED)
+    _, error = invoke(breaker, runtime)
+    assert error["statusCode"] == 429
+    assert breaker.state == circuit_breaker.CIRCUIT_OPEN
+
+    time.sleep(0.25)
+    assert breaker.get_retry_after() is None
+    assert breaker.state == circuit_breaker.CIRCUIT_HALF_OPEN
+    runtime.inject_errors(ERROR_THROTTLE)
+    _, error = invoke(breaker, runtime)
+    assert error["statusCode"] == 429
+    assert breaker.state == circuit_breaker.CIRCUIT_OPEN
+
+
+def test_model_error_does_not_open_breaker():
+    runtime = create_runtime()
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=1, cooldown_s=10)
+
+    runtime.inject_errors(ERROR_MODEL)
+    _, error = invoke(breaker, runtime)
+    assert error["statusCode"] == 502
+    assert breaker.state == circuit_breaker.CIRCUIT_CLOSED
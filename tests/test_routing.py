@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from client.email_api import EmailApiError
+from client.routing import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, RegionalRouter
+
+
+class FakeClient():
+    """
+    Regional client answering after latency_s, or raising error.
+    """
+    def __init__(self, region, latency_s=0.0, error=None):
+        self.region = region
+        self.latency_s = latency_s
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def extract_names(self, record):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency_s)
+        if self.error is not None:
+            raise self.error
+        return {"region": self.region}
+
+    def close(self):
+        pass
+
+
+def create_router(clients, **kwargs):
+    return RegionalRouter({client.region: client for client in clients}, **kwargs)
+
+
+def test_fails_over_on_region_failure():
+    primary = FakeClient("prod-us", error=EmailApiError("Unavailable", status_code=503))
+    secondary = FakeClient("prod-eu")
+    with create_router([primary, secondary]) as router:
+        assert router.extract_names({}) == {"region": "prod-eu"}
+        assert router.stats["failovers"] == 1
+
+
+def test_fails_over_on_unexpected_error():
+    primary = FakeClient("prod-us", error=ConnectionResetError("Connection reset by peer"))
+    secondary = FakeClient("prod-eu")
+    breaker_kwargs = {"min_requests": 1, "error_rate_threshold": 0.0}
+    with create_router([primary, secondary], breaker_kwargs=breaker_kwargs) as router:
+        assert router.extract_names({}) == {"region": "prod-eu"}
+        assert router.breakers["prod-us"].state == CIRCUIT_OPEN
+
+
+def test_does_not_fail_over_on_client_error():
+    primary = FakeClient("prod-us", error=EmailApiError("Bad request", status_code=400))
+    secondary = FakeClient("prod-eu")
+    with create_router([primary, secondary]) as router:
+        with pytest.raises(EmailApiError):
+            router.extract_names({})
+        assert secondary.calls == 0
+        assert router.breakers["prod-us"].state == CIRCUIT_CLOSED
+
+
+def test_hedges_slow_request_within_budget():
+    primary = FakeClient("prod-us", latency_s=0.5)
+    secondary = FakeClient("prod-eu")
+    with create_router([primary, secondary], hedge_budget=1.0, default_hedge_delay_s=0.05) as router:
+        assert router.extract_names({}) == {"region": "prod-eu"}
+        assert router.stats["hedges"] == 1
+        assert router.stats["hedge_wins"] == 1
+
+
+def test_does_not_hedge_over_budget():
+    primary = FakeClient("prod-us", latency_s=0.2)
+    secondary = FakeClient("prod-eu")
+    with create_router([primary, secondary], hedge_budget=0.05, default_hedge_delay_s=0.05) as router:
+        assert router.extract_names({}) == {"region": "prod-us"}
+        assert router.stats["hedges_over_budget"] == 1
+        assert secondary.calls == 0
+
+
+def test_failed_probe_reopens_circuit():
+    primary = FakeClient("prod-us", error=ValueError("Unexpected response"))
+    secondary = FakeClient("prod-eu")
+    with create_router([primary, secondary], breaker_kwargs={"cooldown_s": 0.0}) as router:
+        router.breakers["prod-us"]._open()
+        assert router.extract_names({}) == {"region": "prod-eu"}
+        # The probe was recorded as a failure instead of staying in flight
+        assert router.breakers["prod-us"].state == CIRCUIT_OPEN
+        assert router.breakers["prod-us"].acquire() == CIRCUIT_HALF_OPEN
+
+
+def test_cancelled_probe_is_released():
+    client = FakeClient("prod-us")
+    with create_router([client], max_workers=1, breaker_kwargs={"cooldown_s": 0.0}) as router:
+        router.breakers["prod-us"]._open()
+        # The only worker is busy, so the probe is cancelled before it is sent
+        gate = threading.Event()
+        router._request_executor.submit(gate.wait)
+        region, probe = router._next_region(["prod-us"])
+        assert probe
+        future = router._request_executor.submit(router._attempt, region, "extract_names", {})
+        router._cancel({future: region}, {future})
+        gate.set()
+
+        assert future.cancelled()
+        assert client.calls == 0
+        assert router.breakers["prod-us"].acquire() == CIRCUIT_HALF_OPEN
@@ -0,0 +1,25 @@
+import importlib.util
+import os
+import sys
+
+# The Lambda sources are deployed as a flat zip, so they are not a package that can be imported from here
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda")
+
+
+def load_lambda_module(module_name):
+    """
+    Import a module of the lambda directory, once.
+
+    Args:
+    - module_name (str): The module name, e.g. "deadline".
+
+    Returns:
+    - module: The imported module.
+    """
+    name = f"lambda_{module_name}"
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(LAMBDA_DIR, f"{module_name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
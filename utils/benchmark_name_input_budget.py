@@ -0,0 +1,208 @@
+"""
+Offline benchmark of the email-names input budget, see lambda/name_input_budget.py.
+
+It runs the same email-names rows through Mistral_7B_V1 without and then with the input budget. For
+each run it reports the latency percentiles, the prompt length and max_new_tokens. With a real
+endpoint and labeled --data, it also scores the extracted names against the ground truth with
+utils.metrics.Evaluate, so that a faster run that loses accuracy shows up:
+
+    python utils/benchmark_name_input_budget.py --data email_names_labeled.csv --endpoint-name <endpoint>
+
+The --data CSV has the system_prompt, instruction, context and prompt_type columns of the offline
+rows, and the expected "First Name", "Middle Name", "Last Name", "Name Prefix" and "Name Suffix".
+Without --data, synthetic rows are generated, a share of which have signature display names.
+Without --endpoint-name, the rows go to the endpoint emulator of api_load_tests, whose service time
+grows with the tokens of the prompt and of the answer. The names it answers come from a heuristic,
+not the model, so without a real endpoint and labeled data only the latency is reported.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "api_load_tests"))
+# The email-names Lambda imports its sibling modules
+sys.path.insert(0, os.path.join(ROOT_DIR, "lambda"))
+
+from utils.utils import Mistral_7B_V1, name_input_budget  # noqa: E402
+
+NAME_FIELDS = ["First Name", "Middle Name", "Last Name", "Name Prefix", "Name Suffix"]
+
+FIRST_NAMES = ["John", "Emma", "David", "Maria", "Wei", "Aisha", "Lucas", "Sofia"]
+MIDDLE_NAMES = ["", "", "", "Alex", "Grace", "Robert"]
+LAST_NAMES = ["Doe", "Smith", "Brown", "Garcia", "Chen", "Khan", "Silva", "Rossi"]
+PREFIXES = ["", "", "", "Dr.", "Mr.", "Ms."]
+SUFFIXES = ["", "", "", "", "Jr.", "III"]
+TITLES = ["VP Sales", "Senior Account Executive", "Director of Operations", "Chief Financial Officer"]
+COMPANIES = ["Acme Corp", "Globex Corporation", "Initech Global Enterprise Solutions", "Umbrella Holdings LLC"]
+SEPARATORS = [" | ", " - ", "\n"]
+
+
+def generate_rows(count, noisy_ratio, seed=0):
+    """
+    Generate email-names rows with their expected names, a share of which have signature display names.
+    """
+    import inference_lambda_email_names as email_names
+
+    rng = random.Random(seed)
+    prompt = email_names.get_prompt()
+    rows = []
+    for _ in range(count):
+        names = dict(zip(NAME_FIELDS, [rng.choice(FIRST_NAMES), rng.choice(MIDDLE_NAMES), rng.choice(LAST_NAMES),
+                                       rng.choice(PREFIXES), rng.choice(SUFFIXES)]))
+        email_address = f"{names['First Name']}.{names['Last Name']}@{rng.choice(['gmail.com', 'acme.com'])}".lower()
+        display_name = " ".join(names[field] for field in ["Name Prefix", "First Name", "Middle Name", "Last Name",
+                                                            "Name Suffix"] if names[field])
+        if rng.random() < noisy_ratio:
+            separator = rng.choice(SEPARATORS)
+            display_name = separator.join([
+                display_name, rng.choice(TITLES), rng.choice(COMPANIES),
+                f"+1 ({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(1000, 9999)}",
+                f"www.{rng.choice(['acme', 'globex', 'initech'])}.com",
+                f"{rng.randint(1, 999)} Main Street, Springfield, IL {rng.randint(10000, 99999)}",
+            ])
+        rows.append({
+            "system_prompt": prompt["system_prompt"],
+            "instruction": prompt["instruction"],
+            "context": email_names.get_context(email_address, display_name),
+            "prompt_type": prompt["prompt_type"],
+            **names,
+        })
+    return rows
+
+
+def load_rows(path):
+    import pandas as pd
+
+    df = pd.read_csv(path, keep_default_na=False)
+    return df.to_dict("records")
+
+
+def run_rows(model, rows, max_workers):
+    """
+    Get the names of each row, timing each row.
+
+    Returns:
+    - tuple: The results and the latencies in seconds, in row order.
+    """
+    def run_row(row):
+        start = time.perf_counter()
+        result = model.get_email_name_results((None, row))
+        return result, time.perf_counter() - start
+
+    # Mistral_7B_V1 prints the duration of each step, which would drown the report
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=max_workers) as executor:
+        outputs = list(executor.map(run_row, rows))
+    return [result for result, _ in outputs], [latency for _, latency in outputs]
+
+
+def score_names(rows, results):
+    """
+    Score the extracted names against the expected names with Evaluate.compute_jaccard_score.
+
+    Returns:
+    - dict: The mean Jaccard score and the exact match share of each name field.
+    """
+    from utils.metrics import Evaluate
+
+    evaluate = Evaluate()
+    scores = {}
+    for field in NAME_FIELDS:
+        expected = [str(row.get(field, "")) for row in rows]
+        extracted = [str(result.get(field, "")) if result else "" for result in results]
+        jaccard = evaluate.compute_jaccard_score(np.array(expected, dtype=object), np.array(extracted, dtype=object))
+        exact = np.mean([e.strip() == x.strip() for e, x in zip(expected, extracted)])
+        scores[field] = {"jaccard": round(float(np.mean(jaccard)), 4), "exact_match": round(float(exact), 4)}
+    return scores
+
+
+def summarize(rows, results, latencies, input_budget, score=True):
+    """
+    Summarize one run.
+
+    Returns:
+    - dict: Latency percentiles in milliseconds, mean prompt characters, mean max_new_tokens, failed rows
+      and, when score is set, name scores.
+    """
+    prompt_chars, max_new_tokens = [], []
+    for row in rows:
+        context, parameters = name_input_budget.prepare_context(row["context"], enabled=input_budget)
+        prompt_chars.append(len(row["system_prompt"]) + len(row["instruction"]) + len(context))
+        max_new_tokens.append(parameters["max_new_tokens"])
+    latencies_ms = np.array(latencies) * 1000
+    summary = {
+        "latency_ms": {
+            "mean": round(float(np.mean(latencies_ms)), 1),
+            **{f"p{p}": round(float(np.percentile(latencies_ms, p)), 1) for p in (50, 90, 99)},
+        },
+        "prompt_chars": round(float(np.mean(prompt_chars)), 1),
+        "max_new_tokens": round(float(np.mean(max_new_tokens)), 1),
+        "failed": sum(result is None for result in results),
+    }
+    if score:
+        summary["names"] = score_names(rows, results)
+    return summary
+
+
+def print_summary(label, summary):
+    latency = summary["latency_ms"]
+    print(f"{label}: mean {latency['mean']} ms, p50 {latency['p50']} ms, p90 {latency['p90']} ms, "
+          f"p99 {latency['p99']} ms, prompt {summary['prompt_chars']} chars, "
+          f"max_new_tokens {summary['max_new_tokens']}, failed {summary['failed']}")
+    for field, scores in summary.get("names", {}).items():
+        print(f"    {field}: jaccard {scores['jaccard']}, exact match {scores['exact_match']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", help="CSV file of email-names rows with the expected names")
+    parser.add_argument("--rows", type=int, default=200, help="Number of synthetic rows without --data")
+    parser.add_argument("--noisy-ratio", type=float, default=0.3,
+                        help="Share of synthetic rows with a signature display name")
+    parser.add_argument("--endpoint-name", help="Email-names endpoint, the endpoint emulator is used without it")
+    parser.add_argument("--max-workers", type=int, default=1, help="Rows sent to the endpoint at once")
+    parser.add_argument("--latency-ms", type=float, default=100, help="Base service time of the emulated endpoint")
+    parser.add_argument("--latency-cv", type=float, default=0.2,
+                        help="Coefficient of variation of the emulated base service time")
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.2,
+                        help="Emulated service time per prompt token")
+    parser.add_argument("--decode-ms-per-token", type=float, default=20,
+                        help="Emulated service time per generated token")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Name accuracy only means something for the model's answers to labeled rows
+    score = bool(args.endpoint_name and args.data)
+    if not args.endpoint_name:
+        # The emulated endpoint needs no AWS access, but the boto3 client still needs a region
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    rows = load_rows(args.data) if args.data else generate_rows(args.rows, args.noisy_ratio, seed=args.seed)
+    print(f"Benchmarking {len(rows)} rows")
+    if not score:
+        print("Latency only: name accuracy is scored against a real --endpoint-name with labeled --data")
+
+    summaries = {}
+    for label, input_budget in (("before", False), ("after", True)):
+        model = Mistral_7B_V1(args.endpoint_name or "emulated-email-names", input_budget=input_budget)
+        if not args.endpoint_name:
+            from endpoint_emulator import EmulatedSageMakerRuntime
+
+            model.sagemaker_client = EmulatedSageMakerRuntime(
+                latency_ms=args.latency_ms, latency_cv=args.latency_cv, concurrency=args.max_workers, seed=args.seed,
+                prefill_ms_per_token=args.prefill_ms_per_token, decode_ms_per_token=args.decode_ms_per_token,
+            )
+        results, latencies = run_rows(model, rows, args.max_workers)
+        summaries[label] = summarize(rows, results, latencies, input_budget, score=score)
+        print_summary(label, summaries[label])
+
+    before, after = summaries["before"]["latency_ms"], summaries["after"]["latency_ms"]
+    print("Latency change: " + ", ".join(f"{key} {after[key] - before[key]:+.1f} ms" for key in before))
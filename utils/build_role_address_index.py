@@ -0,0 +1,240 @@
+"""
+Build or refresh the role address index of the email-type fast path, lambda/role_address_index.json.
+
+Candidate rules are the seed role local parts and prefixes, the rules of the current index, and
+the local parts and domains of the labeled data that are Non-Person often enough. A rule is kept
+when it has too little labeled support to judge, or when its Non-Person precision on the labeled
+data reaches --min-precision. The index is then scored against the labeled data with
+utils.metrics.Evaluate, and only written if the precision of its matches reaches the minimum:
+
+    python utils/build_role_address_index.py --labeled-data email_type_labeled.csv \
+        --email-column "Email Address" --label-column "Email Type" --current-index lambda/role_address_index.json
+
+Without --labeled-data the index is built from the seeds only.
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils._lambda_modules import load_lambda_module  # noqa: E402
+
+role_address_index = load_lambda_module("role_address_index")
+
+NON_PERSON = "Non-Person"
+
+# Role accounts that are Non-Person whatever the domain, after normalization
+SEED_LOCAL_PARTS = [
+    "noreply", "donotreply", "info", "support", "billing", "sales", "admin", "contact", "help", "helpdesk",
+    "marketing", "newsletter", "newsletters", "news", "notifications", "notification", "alerts", "mailerdaemon",
+    "postmaster", "webmaster", "hostmaster", "abuse", "security", "privacy", "legal", "compliance", "hr", "jobs",
+    "careers", "recruiting", "office", "accounts", "accounting", "invoices", "invoice", "orders", "order",
+    "service", "customerservice", "feedback", "hello", "team", "enquiries", "inquiries", "press", "media",
+    "reservations", "bookings", "receipts", "updates", "mailer", "bounce", "bounces", "system", "root",
+]
+
+# Local part prefixes of automated senders, e.g. noreplyorders or donotreplyus
+SEED_LOCAL_PART_PREFIXES = ["noreply", "donotreply", "mailerdaemon", "bounce", "notification"]
+
+
+def load_labeled_data(path, email_column, label_column):
+    """
+    Load labeled email addresses from a CSV file.
+
+    Returns:
+    - list: (email address, label) tuples.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(path, usecols=[email_column, label_column]).dropna()
+    return list(zip(df[email_column].astype(str), df[label_column].astype(str)))
+
+
+def count_labels(labeled):
+    """
+    Count the labels of each normalized local part and domain, including parent domains.
+
+    Returns:
+    - tuple: Counters of (local part, label) and (domain, label).
+    """
+    local_part_counts = collections.Counter()
+    domain_counts = collections.Counter()
+    for email_address, label in labeled:
+        parts = role_address_index.split_email_address(email_address)
+        if parts is None:
+            continue
+        local_part, domain = parts
+        local_part_counts[local_part, label] += 1
+        labels = domain.split(".")
+        for i in range(len(labels) - 1):
+            domain_counts[".".join(labels[i:]), label] += 1
+    return local_part_counts, domain_counts
+
+
+def get_precision(counts, key):
+    """
+    Get the Non-Person share and the support of a key.
+    """
+    support = sum(count for (k, _), count in counts.items() if k == key)
+    if not support:
+        return None, 0
+    return counts[key, NON_PERSON] / support, support
+
+
+def select_rules(candidates, counts, min_support, min_precision, keep_unjudged):
+    """
+    Keep the candidate rules whose labeled Non-Person precision reaches the minimum.
+
+    Args:
+    - candidates (iterable): The candidate keys.
+    - counts (Counter): Label counts by (key, label).
+    - min_support (int): Number of labeled addresses needed to judge a rule.
+    - min_precision (float): Minimum Non-Person share of the addresses matching a rule.
+    - keep_unjudged (bool): Keep rules with less support than min_support.
+
+    Returns:
+    - tuple: The kept rules and the dropped rules with their precision and support.
+    """
+    kept, dropped = [], {}
+    for key in sorted(set(candidates)):
+        precision, support = get_precision(counts, key)
+        if support < min_support:
+            if keep_unjudged:
+                kept.append(key)
+            continue
+        if precision >= min_precision:
+            kept.append(key)
+        else:
+            dropped[key] = {"precision": round(precision, 4), "support": support}
+    return kept, dropped
+
+
+def get_prefix_counts(labeled, prefixes):
+    counts = collections.Counter()
+    for email_address, label in labeled:
+        parts = role_address_index.split_email_address(email_address)
+        if parts is None:
+            continue
+        for prefix in prefixes:
+            if parts[0].startswith(prefix):
+                counts[prefix, label] += 1
+    return counts
+
+
+def prune_subdomains(domains):
+    """
+    Drop the domains whose parent domain is in the list, since the index matches subdomains already.
+    """
+    domains = set(domains)
+    return sorted(domain for domain in domains
+                  if not any(".".join(domain.split(".")[i:]) in domains for i in range(1, domain.count("."))))
+
+
+def evaluate_index(index, labeled):
+    """
+    Score the matches of an index against labeled data with utils.metrics.Evaluate.
+
+    Returns:
+    - dict: Coverage of the index, and the accuracy, precision, recall and F1 score of its matches.
+    """
+    from utils.metrics import Evaluate
+
+    matched = [(label, NON_PERSON) for email_address, label in labeled if index.match(email_address)]
+    if not matched:
+        return {"coverage": 0.0, "matched": 0}
+    y_true, y_pred = zip(*matched)
+    metrics = Evaluate().compute_evaluation_metrics(list(y_true), list(y_pred))
+    return {
+        "coverage": round(len(matched) / len(labeled), 4),
+        "matched": len(matched),
+        **{key: round(float(value), 4) for key, value in metrics.items()},
+    }
+
+
+def build_index(labeled, current=None, min_support=5, min_domain_support=20, min_precision=0.99):
+    """
+    Build the index from the seeds, the current index and the labeled data.
+
+    Returns:
+    - tuple: The index as a dict and the dropped rules.
+    """
+    current = current or {}
+    local_part_counts, domain_counts = count_labels(labeled)
+    # Local parts and domains of the labeled data that are Non-Person often enough to be candidates
+    observed_local_parts = {key for (key, label) in local_part_counts if label == NON_PERSON and key}
+    observed_domains = {key for (key, label) in domain_counts if label == NON_PERSON}
+
+    known_local_parts = set(SEED_LOCAL_PARTS) | set(current.get("local_parts", []))
+    local_parts, dropped_local_parts = select_rules(known_local_parts, local_part_counts, min_support, min_precision,
+                                                    True)
+    observed, _ = select_rules(observed_local_parts - known_local_parts, local_part_counts, min_support,
+                               min_precision, False)
+    local_parts = sorted(set(local_parts) | set(observed))
+
+    prefixes = set(SEED_LOCAL_PART_PREFIXES) | set(current.get("local_part_prefixes", []))
+    local_part_prefixes, dropped_prefixes = select_rules(prefixes, get_prefix_counts(labeled, prefixes), min_support,
+                                                         min_precision, True)
+
+    # Domains are only learned from the data, and kept from the current index while they hold up
+    known_domains = set(current.get("domains", []))
+    domains, dropped_domains = select_rules(known_domains, domain_counts, min_domain_support, min_precision, True)
+    observed, _ = select_rules(observed_domains - known_domains, domain_counts, min_domain_support, min_precision,
+                               False)
+    domains = prune_subdomains(set(domains) | set(observed))
+
+    index = {
+        "version": datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d%H%M%S"),
+        "local_parts": local_parts,
+        "local_part_prefixes": sorted(local_part_prefixes),
+        "domains": domains,
+    }
+    dropped = {"local_parts": dropped_local_parts, "local_part_prefixes": dropped_prefixes, "domains": dropped_domains}
+    return index, dropped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labeled-data", help="CSV file of labeled email addresses")
+    parser.add_argument("--email-column", default="Email Address")
+    parser.add_argument("--label-column", default="Email Type", help="Column with the Person or Non-Person labels")
+    parser.add_argument("--current-index",
+                        help="Index to refresh, its rules are kept while the labeled data supports them")
+    parser.add_argument("--output", default=role_address_index.DEFAULT_INDEX_PATH)
+    parser.add_argument("--min-support", type=int, default=5,
+                        help="Labeled addresses needed to judge a local part rule")
+    parser.add_argument("--min-domain-support", type=int, default=20,
+                        help="Labeled addresses needed to add or judge a domain")
+    parser.add_argument("--min-precision", type=float, default=0.99,
+                        help="Minimum Non-Person precision of a rule and of the index")
+    args = parser.parse_args()
+
+    labeled = load_labeled_data(args.labeled_data, args.email_column, args.label_column) if args.labeled_data else []
+    current = None
+    if args.current_index and os.path.exists(args.current_index):
+        with open(args.current_index) as f:
+            current = json.load(f)
+
+    index, dropped = build_index(labeled, current, args.min_support, args.min_domain_support, args.min_precision)
+    print(f"{len(index['local_parts'])} local parts, {len(index['local_part_prefixes'])} prefixes, "
+          f"{len(index['domains'])} domains")
+    for kind, rules in dropped.items():
+        for key, stats in rules.items():
+            print(f"Dropped {kind} rule {key}: precision {stats['precision']} on {stats['support']} addresses")
+
+    if labeled:
+        evaluation = evaluate_index(role_address_index.RoleAddressIndex.from_dict(index), labeled)
+        print(f"Evaluation on {len(labeled)} labeled addresses: {evaluation}")
+        if evaluation["matched"] and evaluation["precision"] < args.min_precision:
+            print(f"Precision {evaluation['precision']} is below {args.min_precision}, not writing the index")
+            sys.exit(1)
+        index["evaluation"] = evaluation
+
+    with open(args.output, "w") as f:
+        json.dump(index, f, indent=2)
+        f.write("\n")
+    print(f"Wrote {args.output}")
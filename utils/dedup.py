@@ -0,0 +1,106 @@
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+
+### DEDUPLICATION OF INFERENCE INPUTS ###
+
+# Row fields that make up the prompt of each task
+EMAIL_NAMES_FIELDS = ("system_prompt", "instruction", "context", "prompt_type")
+EMAIL_TYPE_FIELDS = ("system_prompt", "instruction", "prompt_type")
+
+
+def normalize_text(value):
+    """
+    Normalize a value like get_context does before prompting, so that variants of the same input match.
+
+    Args:
+    - value: The value, converted to a string.
+
+    Returns:
+    - str: The value stripped, with whitespace runs collapsed to one space and case folded.
+    """
+    if value is None:
+        return ""
+    return re.sub(r"\s+", " ", str(value).strip()).casefold()
+
+
+def get_row_data(row):
+    """
+    Get the data of a row, either a (index, row) tuple from DataFrame.iterrows() or a mapping.
+    """
+    if isinstance(row, tuple):
+        return row[1]
+    return row
+
+
+def get_dedup_key(row, fields):
+    """
+    Hash the normalized fields of a row into its deduplication key.
+
+    Args:
+    - row (tuple or dict): The row.
+    - fields (tuple): The fields the model input is built from.
+
+    Returns:
+    - str: The deduplication key.
+    """
+    data = get_row_data(row)
+    normalized = [normalize_text(data[field] if field in data else None) for field in fields]
+    return hashlib.sha1(json.dumps(normalized).encode("utf-8")).hexdigest()
+
+
+def group_rows(rows, fields):
+    """
+    Group rows by deduplication key.
+
+    Returns:
+    - dict: The positions of the rows of each key, in order of first appearance.
+    """
+    groups = {}
+    for position, row in enumerate(rows):
+        groups.setdefault(get_dedup_key(row, fields), []).append(position)
+    return groups
+
+
+def run_deduplicated(rows, infer, fields, max_workers=1):
+    """
+    Run inference once per unique input and fan the results back out to every row.
+
+    The first row of each group is sent as is, so the model sees the original text rather than the
+    normalized key. Rows differing only in whitespace or case share its result.
+
+    Args:
+    - rows (iterable): The rows, e.g. DataFrame.iterrows().
+    - infer (function): Inference of one row, returning its result.
+    - fields (tuple): The fields the model input is built from.
+    - max_workers (int): Number of unique inputs sent to the endpoint at once.
+
+    Returns:
+    - tuple: The results in row order, and a dict with the number of rows, unique inputs and dedup ratio.
+    """
+    rows = list(rows)
+    groups = group_rows(rows, fields)
+    representatives = [rows[positions[0]] for positions in groups.values()]
+
+    if max_workers > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            unique_results = list(executor.map(infer, representatives))
+    else:
+        unique_results = [infer(row) for row in representatives]
+
+    results = [None] * len(rows)
+    for positions, result in zip(groups.values(), unique_results):
+        for position in positions:
+            # Copy dict results, so that updating one row does not change the rows sharing it
+            results[position] = dict(result) if isinstance(result, dict) else result
+
+    stats = {
+        "rows": len(rows),
+        "unique": len(groups),
+        "dedup_ratio": 1 - len(groups) / len(rows) if rows else 0.0,
+    }
+    print(f"Deduplicated {stats['rows']} rows to {stats['unique']} unique inputs, "
+          f"{stats['dedup_ratio']:.1%} of the endpoint calls saved")
+    return results, stats
@@ -1,8 +1,18 @@
 import json
 import boto3
+import botocore
 import re
 import time
 
+from utils._lambda_modules import load_lambda_module
+from utils.dedup import EMAIL_NAMES_FIELDS, EMAIL_TYPE_FIELDS, run_deduplicated
+
+# Deadline budgets and the email-names input budget shared with the inference Lambdas
+deadline = load_lambda_module("deadline")
+name_input_budget = load_lambda_module("name_input_budget")
+
+# Attempts of an endpoint call offline, when the time limit of the row leaves room for them
+OFFLINE_MAX_ATTEMPTS = 3
 
 
 
@@ -20,27 +30,42 @@ def timing(func):
 
 
 class LlamaChatV1():
-    def __init__(self, endpoint_name):
+    def __init__(self, endpoint_name, row_time_limit_s=None):
+        """
+        Parameters:
+            endpoint_name (str): The SageMaker endpoint name.
+            row_time_limit_s (float): Optional time limit of each row, bounding the timeouts and retries of its
+                endpoint call.
+        """
         self.sagemaker_client = boto3.client("sagemaker-runtime")
         self.endpoint_name = endpoint_name
+        self.row_time_limit_s = row_time_limit_s
+        self.runtime_clients = deadline.ClientCache(
+            lambda config: boto3.client("sagemaker-runtime", config=config), max_attempts=OFFLINE_MAX_ATTEMPTS
+        )
     
     @timing
-    def query_llama_endpoint(self, payload):
+    def query_llama_endpoint(self, payload, row_deadline=None):
         """
         Invoke the SageMaker endpoint with the provided payload.
 
         Parameters:
             payload (dict): The payload data to be sent to the endpoint.
+            row_deadline (Deadline): Optional deadline of the row, see lambda/deadline.py.
 
         Returns:
             dict: The JSON response from the endpoint.
 
         Raises:
             botocore.exceptions.ClientError: If an error occurs during the invocation.
+            DeadlineExceeded: If the deadline leaves too little time for the invocation.
         """
         try:
+            # Use a client whose timeouts and retries fit in the time left for the row
+            client = self.sagemaker_client if row_deadline is None else self.runtime_clients.get(row_deadline)
+
             # Invoke the SageMaker endpoint
-            response = self.sagemaker_client.invoke_endpoint(
+            response = client.invoke_endpoint(
                 EndpointName=self.endpoint_name,
                 ContentType="application/json",
                 Body=json.dumps(payload),
@@ -144,6 +169,9 @@ class LlamaChatV1():
         # Email Address Display Name
         # Email Type
 
+        # Time limit of this row, if any
+        row_deadline = None if self.row_time_limit_s is None else deadline.Deadline.from_timeout(self.row_time_limit_s)
+
         try:
             # Validate presence of expected keys
             if 'system_prompt' not in row[1] or 'instruction' not in row[1] or 'prompt_type' not in row[1]:
@@ -175,7 +203,7 @@ class LlamaChatV1():
             }
 
             # Query LLAMA endpoint
-            response = self.query_llama_endpoint(payload)
+            response = self.query_llama_endpoint(payload, row_deadline=row_deadline)
 
             # Extract results
             result = self.extract_results(response, prompt_type)
@@ -187,35 +215,70 @@ class LlamaChatV1():
             # Handle the error as per the requirement
             return None
 
+        except deadline.DeadlineExceeded as e:
+            print("Row time limit exceeded:", e)
+            return None
+
         except Exception as e:
             print("Unexpected error occurred:", e)
             # Handle the error as per the requirement
             return None
 
+    @timing
+    def get_results_batch(self, rows, max_workers=1):
+        """
+        Get results for many rows, querying the endpoint once per unique input.
+
+        Parameters:
+            rows (iterable): The rows, e.g. DataFrame.iterrows().
+            max_workers (int): Number of unique inputs sent to the endpoint at once.
+
+        Returns:
+            tuple: The results in row order, and the deduplication stats.
+        """
+        return run_deduplicated(rows, self.get_results, EMAIL_TYPE_FIELDS, max_workers=max_workers)
 
 
 class Mistral_7B_V1():
-    def __init__(self, endpoint_name):
+    def __init__(self, endpoint_name, row_time_limit_s=None, input_budget=False):
+        """
+        Parameters:
+            endpoint_name (str): The SageMaker endpoint name.
+            row_time_limit_s (float): Optional time limit of each row, bounding the timeouts and retries of its
+                endpoint call.
+            input_budget (bool): Clean the display name of the email-names context and size max_new_tokens from it,
+                like the Lambda does. Off by default.
+        """
         self.sagemaker_client = boto3.client("sagemaker-runtime")
         self.endpoint_name = endpoint_name
+        self.row_time_limit_s = row_time_limit_s
+        self.input_budget = input_budget
+        self.runtime_clients = deadline.ClientCache(
+            lambda config: boto3.client("sagemaker-runtime", config=config), max_attempts=OFFLINE_MAX_ATTEMPTS
+        )
     
     @timing
-    def query_mistral_endpoint(self, payload):
+    def query_mistral_endpoint(self, payload, row_deadline=None):
         """
         Invoke the SageMaker endpoint with the provided payload.
 
         Parameters:
             payload (dict): The payload data to be sent to the endpoint.
+            row_deadline (Deadline): Optional deadline of the row, see lambda/deadline.py.
 
         Returns:
             dict: The JSON response from the endpoint.
 
         Raises:
             botocore.exceptions.ClientError: If an error occurs during the invocation.
+            DeadlineExceeded: If the deadline leaves too little time for the invocation.
         """
         try:
+            # Use a client whose timeouts and retries fit in the time left for the row
+            client = self.sagemaker_client if row_deadline is None else self.runtime_clients.get(row_deadline)
+
             # Invoke the SageMaker endpoint
-            response = self.sagemaker_client.invoke_endpoint(
+            response = client.invoke_endpoint(
                 EndpointName=self.endpoint_name,
                 ContentType="application/json",
                 Body=json.dumps(payload),
@@ -400,6 +463,9 @@ class Mistral_7B_V1():
             KeyError: If one or more expected keys are not found in the row.
         """
 
+        # Time limit of this row, if any
+        row_deadline = None if self.row_time_limit_s is None else deadline.Deadline.from_timeout(self.row_time_limit_s)
+
         try:
             # validate presence of expected keys
             if 'system_prompt' not in row[1] or 'instruction' not in row[1] or 'context' not in row[1] or 'prompt_type' not in row[1]:
@@ -411,6 +477,9 @@ class Mistral_7B_V1():
             context = row[1]['context']
             prompt_type = row[1]['prompt_type']
 
+            # strip the noise of the display name and choose the generation parameters from it
+            context, parameters = name_input_budget.prepare_context(context, enabled=self.input_budget)
+
             # define base prompt template
             # TODO: correct the prompt template for Mistral
             # reference: https://community.aws/content/2dFNOnLVQRhyrOrMsloofnW0ckZ/how-to-prompt-mistral-ai-models-and-why?lang=en 
@@ -428,11 +497,11 @@ class Mistral_7B_V1():
             payload = {
                 "inputs": prompt
                 + input_output_demarkation_key,
-                "parameters": {"max_new_tokens": 100, "temperature":0.1, 'top_p':0.1},
+                "parameters": parameters,
             }
 
             # invoke Mistral endpoint
-            response = self.query_mistral_endpoint(payload)
+            response = self.query_mistral_endpoint(payload, row_deadline=row_deadline)
             #print(f"****MODEL RESPONSE***: {response}")
 
             # extract results
@@ -446,7 +515,28 @@ class Mistral_7B_V1():
             # Handle the error as per the requirement
             return None
 
+        except deadline.DeadlineExceeded as e:
+            print("Row time limit exceeded:", e)
+            return None
+
         except Exception as e:
             print("Unexpected error occurred:", e)
             # Handle the error as per the requirement
-            return None
\ No newline at end of file
+            return None
+
+    @timing
+    def get_email_name_results_batch(self, rows, max_workers=1):
+        """
+        Get email name results for many rows, querying the endpoint once per unique input.
+
+        Rows whose prompt fields differ only in surrounding or repeated whitespace or in case
+        share one endpoint call.
+
+        Parameters:
+            rows (iterable): The rows, e.g. DataFrame.iterrows().
+            max_workers (int): Number of unique inputs sent to the endpoint at once.
+
+        Returns:
+            tuple: The results in row order, and the deduplication stats.
+        """
+        return run_deduplicated(rows, self.get_email_name_results, EMAIL_NAMES_FIELDS, max_workers=max_workers)